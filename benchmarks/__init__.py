@@ -0,0 +1 @@
+"""Benchmarks for the Social Insecurity application, run them with python -m benchmarks.<name>."""
@@ -0,0 +1,178 @@
+"""Benchmarks the main pages of the application at several dataset sizes.
+
+For every size a fresh database is filled with generated data (see social_insecurity/datagen.py)
+in a separate process, and the login, stream, comments, friends and profile pages are requested
+through Flask's test client as a set of logged in users. The p50/p99 latency and the throughput
+of every page are printed as JSON, and can be saved and compared with the results of another commit.
+
+Example:
+    python -m benchmarks.routes --sizes 100,1000,10000 --output before.json
+    python -m benchmarks.routes --sizes 100,1000,10000 --output after.json
+    python -m benchmarks.routes --compare before.json after.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+from benchmarks.stats import summarize
+
+PASSWORD = "password"
+SESSIONS = 20  # Users logged in at the same time, each page request picks one of them
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(request: Callable[[], Any], requests: int, warmup: int) -> dict[str, float]:
+    for _ in range(warmup):
+        request()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        begin = time.perf_counter()
+        response = request()
+        samples.append(time.perf_counter() - begin)
+        if response.status_code >= 400:
+            raise RuntimeError(f"Benchmark request failed with {response.status_code}")
+    return summarize(samples, time.perf_counter() - start)
+
+
+def run_size(users: int, posts: int, comments: int, requests: int, warmup: int, seed: int) -> dict[str, Any]:
+    """Generates a dataset and benchmarks every page, in the current process."""
+    from social_insecurity import create_app, sqlite
+    from social_insecurity.datagen import generate
+    from social_insecurity.password import hash_password
+
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+
+        class BenchmarkConfig:
+            # Absolute paths, so nothing is written to the instance folder of the checkout
+            SQLITE3_DATABASE_PATH = str(Path(directory) / "sqlite3.db")
+            UPLOADS_FOLDER_PATH = str(Path(directory) / "uploads")
+            JINJA_BYTECODE_CACHE = str(Path(directory) / "jinja")
+            RATELIMIT_ENABLED = False
+            RATELIMIT_STORAGE_URI = "memory://"
+
+        app = create_app(BenchmarkConfig)
+        start = time.perf_counter()
+        with app.app_context(), sqlite.transaction() as conn:
+            first_user = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM Users;").fetchone()[0]
+            first_post = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM Posts;").fetchone()[0]
+            added = generate(conn, users, posts, comments, hash_password(PASSWORD), seed=seed)
+        generate_seconds = time.perf_counter() - start
+
+        user_ids = range(first_user, first_user + users)
+        post_ids = range(first_post, first_post + posts)
+
+        def login(client: Any, user_id: int) -> Any:
+            return client.post(
+                "/",
+                data={"login-username": f"user{user_id}", "login-password": PASSWORD, "login-submit": "Sign In"},
+            )
+
+        sessions = []
+        for user_id in rng.sample(user_ids, min(SESSIONS, users)):
+            client = app.test_client()
+            login(client, user_id)
+            sessions.append((client, f"user{user_id}"))
+
+        def page(path: Callable[[str], str]) -> Callable[[], Any]:
+            def request() -> Any:
+                client, username = rng.choice(sessions)
+                return client.get(path(username))
+
+            return request
+
+        pages = {
+            "login": lambda: login(app.test_client(), rng.choice(user_ids)),
+            "stream": page(lambda username: f"/stream/{username}"),
+            "comments": page(lambda username: f"/comments/{username}/{rng.choice(post_ids)}"),
+            "friends": page(lambda username: f"/friends/{username}"),
+            "profile": page(lambda username: f"/profile/{username}"),
+        }
+        return {
+            **added,
+            "generate_seconds": generate_seconds,
+            "routes": {name: measure(request, requests, warmup) for name, request in pages.items()},
+        }
+
+
+def compare(before: dict[str, Any], after: dict[str, Any]) -> None:
+    """Prints the change in p50 and p99 latency of every page between two result files."""
+    print(f"{'users':>8} {'route':<10} {'p50 before':>11} {'p50 after':>10} {'p99 before':>11} {'p99 after':>10}")
+    for old, new in zip(before["sizes"], after["sizes"]):
+        for route, old_stats in old["routes"].items():
+            new_stats = new["routes"].get(route)
+            if new_stats is None:
+                continue
+            print(
+                f"{old['users']:>8} {route:<10} {old_stats['p50_ms']:>9.2f}ms {new_stats['p50_ms']:>8.2f}ms"
+                f" {old_stats['p99_ms']:>9.2f}ms {new_stats['p99_ms']:>8.2f}ms"
+                f"  ({new_stats['p50_ms'] / old_stats['p50_ms'] - 1:+.0%} p50)"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma separated numbers of users")
+    parser.add_argument("--posts-per-user", type=int, default=10)
+    parser.add_argument("--comments-per-user", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per page and size")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per page and size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("BEFORE", "AFTER"), help="Compare two result files")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*(json.loads(path.read_text()) for path in args.compare))
+        return
+
+    if args.child is not None:
+        users = args.child
+        result = run_size(
+            users, users * args.posts_per_user, users * args.comments_per_user, args.requests, args.warmup, args.seed
+        )
+        print(json.dumps(result))
+        return
+
+    # Every size runs in its own process, the application can only be created once per process
+    sizes = []
+    for users in (int(size) for size in args.sizes.split(",")):
+        command = [sys.executable, "-m", "benchmarks.routes", "--child", str(users)]
+        command += ["--posts-per-user", str(args.posts_per_user), "--comments-per-user", str(args.comments_per_user)]
+        command += ["--requests", str(args.requests), "--warmup", str(args.warmup), "--seed", str(args.seed)]
+        output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+        sizes.append(json.loads(output.splitlines()[-1]))
+        print(f"Benchmarked {users} users", file=sys.stderr)
+
+    results = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "requests": args.requests,
+        "sizes": sizes,
+    }
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        args.output.write_text(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Benchmarks reading a large feed as sqlite3.Row against the named tuples in rows.py.
+
+A database is created from schema.sql and filled with generated data (see social_insecurity/datagen.py).
+The newest posts are then read as one large feed, once with `SELECT p.*, u.*` into sqlite3.Row,
+the way the stream used to be read, and once with the projected columns into PostRow.
+Every field the post card shows is read from every row, like rendering the page would.
+The throughput and the memory held by the rows are printed as JSON.
+
+Example:
+    python -m benchmarks.rows --posts 200000 --output rows.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+from benchmarks.stats import summarize
+from social_insecurity.datagen import generate
+from social_insecurity.rows import PostRow
+
+SCHEMA_PATH = Path(__file__).parent.parent / "social_insecurity" / "schema.sql"
+CARD_FIELDS = ("id", "username", "creation_time", "content", "image", "comment_count")
+
+SELECT_ALL = """
+    SELECT p.*, u.*
+    FROM Posts AS p JOIN Users AS u ON u.id = p.u_id
+    ORDER BY p.creation_time DESC, p.id DESC
+    LIMIT ?;
+    """
+SELECT_PROJECTED = """
+    SELECT p.id, p.u_id, u.username, u.first_name, u.last_name, p.content, p.image, p.creation_time,
+           p.comment_count
+    FROM Posts AS p JOIN Users AS u ON u.id = p.u_id
+    ORDER BY p.creation_time DESC, p.id DESC
+    LIMIT ?;
+    """
+
+
+def read_rows(conn: sqlite3.Connection, rows: int) -> list[sqlite3.Row]:
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    return cursor.execute(SELECT_ALL, (rows,)).fetchall()
+
+
+def read_named(conn: sqlite3.Connection, rows: int) -> list[PostRow]:
+    return list(map(PostRow._make, conn.execute(SELECT_PROJECTED, (rows,)).fetchall()))
+
+
+def render_rows(rows: list[sqlite3.Row]) -> None:
+    for row in rows:
+        for field in CARD_FIELDS:
+            row[field]
+
+
+def render_named(rows: list[PostRow]) -> None:
+    for row in rows:
+        for field in CARD_FIELDS:
+            getattr(row, field)
+
+
+def measure(
+    read: Callable[[sqlite3.Connection, int], list[Any]],
+    render: Callable[[list[Any]], None],
+    conn: sqlite3.Connection,
+    rows: int,
+    repeats: int,
+) -> dict[str, Any]:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        render(read(conn, rows))
+        samples.append(time.perf_counter() - start)
+    stats = summarize(samples, sum(samples))
+
+    tracemalloc.start()
+    result = read(conn, rows)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return {**stats, "rows_per_second": rows * stats["per_second"], "bytes_per_row": held / rows}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000, help="Number of users to generate")
+    parser.add_argument("--posts", type=int, default=200_000, help="Number of posts to generate")
+    parser.add_argument("--rows", type=int, default=50_000, help="Posts read per feed")
+    parser.add_argument("--repeats", type=int, default=20, help="Feeds read per row model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        conn = sqlite3.connect(Path(directory) / "rows.sqlite3")
+        conn.executescript(SCHEMA_PATH.read_text())
+        with conn:
+            # A realistic Argon2 hash, SELECT u.* carries it along with every post
+            generate(conn, args.users, args.posts, 0, "$argon2id$v=19$m=65536,t=3,p=4$" + "x" * 66, seed=args.seed)
+
+        rows = min(args.rows, args.posts)
+        results = {
+            "posts": args.posts,
+            "rows": rows,
+            "sqlite3_row": measure(read_rows, render_rows, conn, rows, args.repeats),
+            "named_tuple": measure(read_named, render_named, conn, rows, args.repeats),
+        }
+        conn.close()
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        args.output.write_text(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
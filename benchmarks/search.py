@@ -0,0 +1,126 @@
+"""Benchmarks the full-text search over a generated corpus of posts.
+
+A database is created from schema.sql and filled with users, friendships and posts
+made of words drawn from a Zipf-like vocabulary, so a few words are very common and most are rare.
+It then times loading the corpus through the sync triggers, rebuilding the index,
+and running search_posts() in an app context for common, rare and multi-word searches.
+
+Example:
+    python -m benchmarks.search --rows 1000000 --output search.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from flask import Flask
+
+from benchmarks.stats import summarize
+from social_insecurity.database import SQLite3
+from social_insecurity.search import search_posts
+
+SCHEMA_PATH = Path(__file__).parent.parent / "social_insecurity" / "schema.sql"
+VOCABULARY_SIZE = 20000
+WORDS_PER_POST = 12
+BATCH_SIZE = 10000
+
+
+def generate(conn: sqlite3.Connection, rows: int, users: int, friends: int, rng: random.Random) -> None:
+    vocabulary = [f"w{index:05d}" for index in range(VOCABULARY_SIZE)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(VOCABULARY_SIZE)))
+
+    with conn:
+        conn.executemany(
+            "INSERT INTO Users (username, first_name, last_name, password) VALUES (?, ?, ?, '');",
+            ((f"user{index}", rng.choice(vocabulary), rng.choice(vocabulary)) for index in range(users)),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO Friends (u_id, f_id) VALUES (?, ?);",
+            ((rng.randint(1, users), rng.randint(1, users)) for _ in range(users * friends)),
+        )
+
+    for start in range(0, rows, BATCH_SIZE):
+        batch = min(BATCH_SIZE, rows - start)
+        with conn:
+            conn.executemany(
+                "INSERT INTO Posts (u_id, content, creation_time) VALUES (?, ?, datetime('now'));",
+                (
+                    (rng.randint(1, users), " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=WORDS_PER_POST)))
+                    for _ in range(batch)
+                ),
+            )
+
+
+def time_queries(app: Flask, searches: list[str], users: int, rng: random.Random) -> dict[str, float]:
+    samples = []
+    with app.app_context():
+        for text in searches:
+            user_id = rng.randint(1, users)
+            start = time.perf_counter()
+            search_posts(user_id, text)
+            samples.append(time.perf_counter() - start)
+    return summarize(samples, sum(samples))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of posts to generate")
+    parser.add_argument("--users", type=int, default=10_000, help="Number of users to generate")
+    parser.add_argument("--friends", type=int, default=20, help="Average number of friendships per user")
+    parser.add_argument("--queries", type=int, default=200, help="Number of searches per kind")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = Path(directory) / "search.sqlite3"
+        conn = sqlite3.connect(database_path)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.executescript(SCHEMA_PATH.read_text())
+
+        start = time.perf_counter()
+        generate(conn, args.rows, args.users, args.friends, rng)
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with conn:
+            conn.execute("INSERT INTO PostsSearch (PostsSearch) VALUES ('rebuild');")
+            conn.execute("INSERT INTO PostsSearch (PostsSearch) VALUES ('optimize');")
+        rebuild_seconds = time.perf_counter() - start
+        conn.close()
+
+        # The searches run through the application's own query and database extension
+        app = Flask(__name__, instance_path=directory)
+        app.config["SQLITE3_DATABASE_PATH"] = str(database_path)
+        SQLite3(app)
+
+        searches = {
+            "common": [f"w{rng.randint(0, 9):05d}" for _ in range(args.queries)],
+            "rare": [f"w{rng.randint(1000, VOCABULARY_SIZE - 1):05d}" for _ in range(args.queries)],
+            "two_words": [f"w{rng.randint(0, 99):05d} w{rng.randint(0, 999):05d}" for _ in range(args.queries)],
+        }
+        results = {
+            "rows": args.rows,
+            "users": args.users,
+            "load_rows_per_second": args.rows / load_seconds,
+            "rebuild_seconds": rebuild_seconds,
+            "search": {kind: time_queries(app, texts, args.users, rng) for kind, texts in searches.items()},
+        }
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        args.output.write_text(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""Summarizes latency samples for the benchmarks."""
+
+from __future__ import annotations
+
+import statistics
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """Returns the sample below which the given fraction of the samples fall."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(samples: list[float], elapsed: float) -> dict[str, float]:
+    """Returns the p50, p99 and mean latency in milliseconds, and the throughput over the elapsed seconds."""
+    return {
+        "requests": len(samples),
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "per_second": len(samples) / elapsed,
+    }
@@ -3,15 +3,29 @@
 The package contains the Flask application factory.
 """
 
+import sqlite3
+from collections.abc import Mapping
+from datetime import datetime
 from pathlib import Path
 from shutil import rmtree
-from typing import cast
+from time import perf_counter
+from typing import Optional, cast
 
-from flask import Flask, current_app
+import click
+from flask import Flask, current_app, session
 
+from social_insecurity import uploads
+from social_insecurity.cache import LRUCache
 from social_insecurity.config import Config
 from social_insecurity.database import SQLite3
+from social_insecurity.events import EventHub
+from social_insecurity.fragments import FragmentCache
+from social_insecurity.graph import FriendGraph
+from social_insecurity.instrumentation import QueryMetrics
 from social_insecurity.models import User
+from social_insecurity.password import HasherBusyError, hash_password, hasher
+from social_insecurity.thumbnails import Thumbnails
+from social_insecurity.writes import WriteBehind
 
 from flask_login import LoginManager
 from flask_limiter import Limiter
@@ -22,10 +36,16 @@ from flask_limiter.errors import RateLimitExceeded
 
 sqlite = SQLite3()
 login = LoginManager()
+thumbnails = Thumbnails()
+fragments = FragmentCache()
+friend_graph = FriendGraph()
+events = EventHub()
+metrics = QueryMetrics()
+writes = WriteBehind()
 limiter = Limiter(
     key_func=get_remote_address,  # Rate limit by IP address
     default_limits=["200 per day", "50 per hour"],  # Global defaults
-    storage_uri="memory://"  # For production, use Redis: "redis://localhost:6379"
+    # Storage is configured by RATELIMIT_STORAGE_URI, see config.py
 )
 
 @login.user_loader
@@ -33,8 +53,15 @@ def load_user(user_id):
     """Load user from database by ID for Flask-Login.
     
     This callback uses the SQL schema to fetch user data.
+    If USER_SESSION_IDENTITY is set, the identity stored in the signed session at login is used instead,
+    so most requests skip the database entirely.
     """
-    return User.get(int(user_id))
+    user_id = int(user_id)
+    if current_app.config["USER_SESSION_IDENTITY"]:
+        identity = session.get("identity")
+        if identity and identity.get("id") == user_id:
+            return User(**identity, password=None)
+    return User.get(user_id)
 
 
 # TODO: The passwords are stored in plaintext, this is not secure at all. I should probably use bcrypt or something
@@ -45,20 +72,37 @@ def load_user(user_id):
 
 def create_app(test_config=None) -> Flask:
     """Create and configure the Flask application."""
+    # Imported here rather than with the package, modules only used by a command are imported by that command
+    from social_insecurity.ratelimit import resolve_storage_uri
+    from social_insecurity.startup import init_bytecode_cache
+
     app = Flask(__name__)
     app.config.from_object(Config)
-    if test_config:
+    if isinstance(test_config, Mapping):
+        app.config.from_mapping(test_config)
+    elif test_config:
         app.config.from_object(test_config)
 
     # Ensure Jinja2 auto-escaping is enabled (default, but explicit for clarity)
     app.jinja_env.autoescape = True
+    init_bytecode_cache(app)
 
     sqlite.init_app(app, schema="schema.sql")
+    metrics.init_app(app)
+    writes.init_app(app)
+    app.extensions["user_cache"] = LRUCache(app.config["USER_CACHE_SIZE"], app.config["USER_CACHE_TTL"])
+    hasher.init_app(app)
+    thumbnails.init_app(app)
+    fragments.init_app(app)
+    friend_graph.init_app(app)
+    events.init_app(app)
     login.init_app(app)
     # Redirect to login page if not authenticated
     login.login_view = 'index' 
     login.login_message = 'Please log in to access this page.'
+    resolve_storage_uri(app)
     limiter.init_app(app)
+    limiter.exempt(metrics.serve)  # Scraped every few seconds, and only served with SQLITE3_METRICS_TOKEN
     
     @app.errorhandler(RateLimitExceeded)
     def handle_rate_limit_exceeded(e):
@@ -66,6 +110,14 @@ def create_app(test_config=None) -> Flask:
         from flask import flash, redirect, url_for
         flash("Too many login attempts. Please try again in a minute.", category="error")
         return redirect(url_for("index")), 429
+
+    @app.errorhandler(HasherBusyError)
+    def handle_hasher_busy(e):
+        """Handle a saturated password hashing pool."""
+        from flask import flash, render_template
+        from social_insecurity.forms import IndexForm
+        flash("The server is busy, please try again in a moment.", category="error")
+        return render_template("index.html.j2", title="Welcome", form=IndexForm()), 503, {"Retry-After": "1"}
     
     # bcrypt.init_app(app)
     # csrf.init_app(app)
@@ -80,8 +132,218 @@ def create_app(test_config=None) -> Flask:
         if instance_path.exists():
             rmtree(instance_path)
 
+    @app.cli.command("repair-counters")
+    def repair_counters_command() -> None:
+        """Recompute the comment counters stored on posts, adding the counter column and triggers if missing."""
+        get_columns = """
+            SELECT name
+            FROM pragma_table_info('Posts');
+            """
+        add_counter = """
+            ALTER TABLE Posts ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0;
+            """
+        create_insert_trigger = """
+            CREATE TRIGGER IF NOT EXISTS [CommentsCountInsert] AFTER INSERT ON [Comments]
+            BEGIN
+              UPDATE Posts SET comment_count = comment_count + 1 WHERE id = NEW.p_id;
+            END;
+            """
+        create_delete_trigger = """
+            CREATE TRIGGER IF NOT EXISTS [CommentsCountDelete] AFTER DELETE ON [Comments]
+            BEGIN
+              UPDATE Posts SET comment_count = comment_count - 1 WHERE id = OLD.p_id;
+            END;
+            """
+        repair_counters = """
+            UPDATE Posts
+            SET comment_count = (SELECT COUNT(*) FROM Comments WHERE p_id = Posts.id)
+            WHERE comment_count != (SELECT COUNT(*) FROM Comments WHERE p_id = Posts.id);
+            """
+        # Databases created before the counter was added to schema.sql are migrated in the same transaction
+        with sqlite.transaction() as conn:
+            if "comment_count" not in {row["name"] for row in conn.execute(get_columns)}:
+                conn.execute(add_counter)
+            conn.execute(create_insert_trigger)
+            conn.execute(create_delete_trigger)
+            repaired = conn.execute(repair_counters).rowcount
+        click.echo(f"Repaired {repaired} comment counters.")
+
+    @app.cli.command("rebuild-timeline")
+    def rebuild_timeline_command() -> None:
+        """Rebuild the materialized home timelines from posts and friendships."""
+        rebuild_timeline = """
+            INSERT OR IGNORE INTO Timeline (owner_id, post_id, creation_time)
+            SELECT p.u_id, p.id, p.creation_time FROM Posts AS p
+            UNION ALL
+            SELECT f.u_id, p.id, p.creation_time FROM Posts AS p JOIN Friends AS f ON f.f_id = p.u_id
+            UNION ALL
+            SELECT f.f_id, p.id, p.creation_time FROM Posts AS p JOIN Friends AS f ON f.u_id = p.u_id;
+            """
+        with sqlite.transaction() as conn:
+            conn.execute("DELETE FROM Timeline;")
+            rebuilt = conn.execute(rebuild_timeline).rowcount
+        click.echo(f"Rebuilt timelines with {rebuilt} entries.")
+
+    @app.cli.command("generate-data")
+    @click.option("--users", default=1000, show_default=True, help="Number of users to add.")
+    @click.option("--posts", default=10000, show_default=True, help="Number of posts to add.")
+    @click.option("--comments", default=50000, show_default=True, help="Number of comments to add.")
+    @click.option("--friends", default=10.0, show_default=True, help="Average number of friends added per user.")
+    @click.option("--password", default="password", show_default=True, help="Password of every added user.")
+    @click.option("--seed", default=0, show_default=True, help="Seed of the random generator.")
+    def generate_data_command(users: int, posts: int, comments: int, friends: float, password: str, seed: int) -> None:
+        """Fill the database with generated users, friendships, posts and comments."""
+        from social_insecurity.datagen import generate
+
+        password_hash = hash_password(password)
+        with sqlite.transaction() as conn:
+            added = generate(conn, users, posts, comments, password_hash, friends=friends, seed=seed)
+        click.echo("Added " + ", ".join(f"{count} {table}" for table, count in added.items()) + ".")
+        if app.config["TIMELINE_ENABLED"]:
+            click.echo("Run 'flask rebuild-timeline' to add the new posts to the timelines.")
+
+    @app.cli.command("rebuild-search")
+    def rebuild_search_command() -> None:
+        """Rebuild and optimize the full-text search indexes from posts, comments and users."""
+        from social_insecurity.search import SEARCH_TABLES
+
+        with sqlite.transaction() as conn:
+            for table in SEARCH_TABLES:
+                conn.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild');")
+                conn.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize');")
+        click.echo(f"Rebuilt search indexes {', '.join(SEARCH_TABLES)}.")
+
+    @app.cli.command("gc-uploads")
+    def gc_uploads_command() -> None:
+        """Delete uploaded files that are no longer, or were never, referenced by any post."""
+        deleted = uploads.collect_garbage(app.config["UPLOADS_GC_GRACE"])
+        click.echo(f"Deleted {deleted} unreferenced uploads.")
+
+    @app.cli.command("build-thumbnails")
+    def build_thumbnails_command() -> None:
+        """Generate the missing resized variants of all uploaded images."""
+        if not thumbnails.enabled:
+            raise click.ClickException("Image variants are disabled or Pillow is not installed.")
+        get_images = """
+            SELECT name
+            FROM Uploads;
+            """
+        names = [row["name"] for row in sqlite.select(get_images)]
+        with click.progressbar(names, label="Generating image variants") as progress:
+            for name in progress:
+                if uploads.is_content_addressed(name):
+                    try:
+                        thumbnails.generate(name)
+                    except Exception as e:
+                        click.echo(f"Skipped {name}: {e}", err=True)
+
+    @app.cli.command("export")
+    @click.argument("path", type=click.Path(path_type=Path))
+    @click.option(
+        "--format",
+        "file_format",
+        type=click.Choice(["ndjson", "csv"]),
+        default="ndjson",
+        show_default=True,
+        help="NDJSON writes one file, '-' for stdout, CSV writes one file per table into the PATH folder.",
+    )
+    @click.option("--table", "tables", multiple=True, help="Table to export, all tables by default. Can be repeated.")
+    def export_command(path: Path, file_format: str, tables: tuple[str, ...]) -> None:
+        """Export users, posts, comments and friendships as NDJSON or CSV, without the uploaded files."""
+        from social_insecurity import bulk
+
+        unknown = set(tables) - set(bulk.TABLES)
+        if unknown:
+            raise click.BadParameter(f"Unknown tables {', '.join(sorted(unknown))}", param_hint="--table")
+        tables = tuple(table for table in bulk.TABLES if not tables or table in tables)
+        if file_format == "csv":
+            counts = bulk.export_csv(sqlite.connection, path, tables)
+        elif str(path) == "-":
+            counts = bulk.export_ndjson(sqlite.connection, click.get_text_stream("stdout"), tables)
+        else:
+            with bulk.open_text(path, "w") as file:
+                counts = bulk.export_ndjson(sqlite.connection, file, tables)
+        click.echo("Exported " + ", ".join(f"{count} {table}" for table, count in counts.items()) + ".", err=True)
+
+    @app.cli.command("import")
+    @click.argument("path", type=click.Path(exists=True, allow_dash=True, path_type=Path))
+    @click.option(
+        "--on-conflict",
+        type=click.Choice(["replace", "ignore", "abort"]),
+        default="replace",
+        show_default=True,
+        help="What to do with rows whose key already exists.",
+    )
+    def import_command(path: Path, on_conflict: str) -> None:
+        """Import an NDJSON file, '-' for stdin, or a folder of CSV files written by 'flask export'.
+
+        The uploaded files the imported posts reference are registered if they are in the uploads folder.
+        """
+        from social_insecurity import bulk
+
+        def progress(table: str, rows: int) -> None:
+            counts[table] = counts.get(table, 0) + rows
+            click.echo(f"\r{table}: {counts[table]} rows", nl=False, err=True)
+
+        counts: dict[str, int] = {}
+        folder = uploads.upload_folder()
+        try:
+            if path.is_dir():
+                bulk.import_batches(sqlite.connection, bulk.read_csv(path), on_conflict, progress, folder)
+            elif str(path) == "-":
+                stdin = click.get_text_stream("stdin")
+                bulk.import_batches(sqlite.connection, bulk.read_ndjson(stdin), on_conflict, progress, folder)
+            else:
+                with bulk.open_text(path, "r") as file:
+                    bulk.import_batches(sqlite.connection, bulk.read_ndjson(file), on_conflict, progress, folder)
+        except (ValueError, sqlite3.IntegrityError) as e:
+            raise click.ClickException(f"Import failed, nothing was imported: {e}") from e
+        click.echo("\nImported " + ", ".join(f"{count} {table}" for table, count in counts.items()) + ".", err=True)
+        if app.config["TIMELINE_ENABLED"]:
+            click.echo("Run 'flask rebuild-timeline' to add the imported posts to the timelines.")
+
+    @app.cli.command("backup")
+    @click.argument("path", type=click.Path(dir_okay=False, path_type=Path), required=False)
+    def backup_command(path: Optional[Path]) -> None:
+        """Copy the live database to PATH, by default instance/backups/sqlite3-<time>.db."""
+        from social_insecurity import bulk
+
+        if path is None:
+            path = Path(app.instance_path) / "backups" / f"sqlite3-{datetime.now():%Y%m%d-%H%M%S}.db"
+        start = perf_counter()
+        bulk.backup(sqlite.connection, path)
+        click.echo(f"Backed up {path.stat().st_size} bytes to {path} in {perf_counter() - start:.1f}s.")
+
+    @app.cli.command("measure-startup")
+    @click.option("--runs", default=5, show_default=True, help="Number of fresh processes to start.")
+    @click.option("--path", default="/", show_default=True, help="URL path of the requests made after startup.")
+    @click.option("--warm-up/--no-warm-up", default=False, show_default=True, help="Warm up in create_app().")
+    @click.option("--clear-cache", is_flag=True, help="Empty the template bytecode cache before the first run.")
+    def measure_startup_command(runs: int, path: str, warm_up: bool, clear_cache: bool) -> None:
+        """Measure import time, app creation and first request latency in fresh processes."""
+        from social_insecurity.startup import bytecode_cache_folder, measure_startup
+
+        if clear_cache and app.config["JINJA_BYTECODE_CACHE"]:
+            rmtree(bytecode_cache_folder(app), ignore_errors=True)
+        click.echo(f"{'run':>3} {'status':>6} {'import':>9} {'create_app':>11} {'1st request':>12} {'2nd request':>12}")
+        for run in range(1, runs + 1):
+            timings = measure_startup(path, warm_up)
+            click.echo(
+                f"{run:>3} {timings['status']:>6} {timings['import'] * 1000:>7.1f}ms"
+                f" {timings['create_app'] * 1000:>9.1f}ms {timings['first_request'] * 1000:>10.1f}ms"
+                f" {timings['second_request'] * 1000:>10.1f}ms"
+            )
+
     with app.app_context():
         import social_insecurity.routes  # noqa: E402,F401
+        import social_insecurity.api  # noqa: E402,F401
+
+    if app.config["WARM_UP"]:
+        from social_insecurity.startup import warm_up
+
+        timings = warm_up(app)
+        steps = ", ".join(f"{step} {seconds * 1000:.1f} ms" for step, seconds in timings.items())
+        app.logger.info("Warmed up: %s", steps)
 
     return app
 
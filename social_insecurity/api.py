@@ -0,0 +1,229 @@
+"""Provides the JSON API for the Social Insecurity application.
+
+The endpoints return the same pages of posts and comments as the stream and comments pages,
+using the same queries and cursors. A page lists its field names once, and every item is an array
+of the values of those fields, so the rows go to the JSON encoder as plain tuples. The `fields` query
+parameter selects a subset of the fields, and responses are compressed with brotli or gzip
+when the client accepts it.
+With EVENTS_ENABLED set, the /api/events endpoints push the ids of new posts and comments
+as server-sent events, see events.py. With EVENTS_ONLY set, the application serves nothing else,
+so the event streams can be served by their own gevent worker.
+
+orjson and brotli are optional dependencies, without them the standard json module and gzip are used.
+
+Example:
+    GET /api/stream?fields=id,username,content
+    GET /api/comments/1?cursor=MjAyNC0wMS0wMSAxMjowMDowMHw0Mg
+    GET /api/events/stream
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+from collections.abc import Iterator
+from functools import wraps
+from operator import itemgetter
+from time import monotonic
+from typing import Any, Callable, Optional
+
+from flask import abort, request
+from flask import current_app as app
+from flask_login import current_user
+
+from social_insecurity import events, friend_graph
+from social_insecurity.etags import conditional
+from social_insecurity.rows import CommentRow, PostRow
+from social_insecurity.routes import comments_version, get_post_and_comments, get_stream_page, stream_version
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+POST_FIELDS = PostRow._fields
+COMMENT_FIELDS = CommentRow._fields
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+EVENT_ENDPOINTS = ("api_stream_events", "api_comments_events")
+
+
+def dumps(payload: Any) -> bytes:
+    """Serializes a payload to JSON, with orjson if it is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def json_response(payload: Any, status: int = 200) -> Any:
+    """Returns a JSON response, compressed with the best encoding the client accepts if it is large enough."""
+    body = dumps(payload)
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding and len(body) >= app.config["API_COMPRESSION_MIN_SIZE"]:
+        body = brotli.compress(body, quality=5) if encoding == "br" else gzip.compress(body, compresslevel=6)
+    else:
+        encoding = None
+
+    response = app.response_class(body, status=status, mimetype="application/json")
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def select_fields(available: tuple[str, ...]) -> tuple[str, ...]:
+    """Returns the fields requested with the `fields` query parameter, or all available fields."""
+    requested = request.args.get("fields")
+    if not requested:
+        return available
+    fields = tuple(field for field in requested.split(",") if field)
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        abort(json_response({"error": f"Unknown fields: {', '.join(unknown)}", "fields": available}, 400))
+    return fields
+
+
+def page(
+    rows: list[tuple[Any, ...]], next_cursor: Optional[str], fields: tuple[str, ...], available: tuple[str, ...]
+) -> dict[str, Any]:
+    """Returns a page of rows as JSON-serializable items with the cursor of the next page.
+
+    params:
+        rows: The rows of the page, named tuples with the available fields.
+        next_cursor: The cursor of the next page, or None if this is the last one.
+        fields: The fields to include in every item, in order.
+        available: The fields of the rows, in order.
+
+    returns: The field names, the items as arrays of their values and the cursor of the next page.
+
+    """
+    # The rows are copied into plain tuples by map() and itemgetter, without a Python call per row or field
+    if fields == available:
+        items = list(map(tuple, rows))
+    elif len(fields) == 1:
+        items = list(zip(map(itemgetter(available.index(fields[0])), rows)))
+    else:
+        items = list(map(itemgetter(*map(available.index, fields)), rows))
+    return {"fields": fields, "items": items, "next_cursor": next_cursor}
+
+
+def event_stream(kind: str, get_new: str, *args: Any) -> Any:
+    """Returns a server-sent event stream of the new rows of a kind that a query selects.
+
+    The query gets the ids the new rows are after and up to, then args, and the number of rows to read at most.
+    It selects the id and the data of each event, newest first. The stream starts after the Last-Event-ID
+    sent by a reconnecting client, or at the newest row. It runs outside the request context,
+    so it only holds a database connection while it reads new rows.
+    """
+    if not app.config["EVENTS_ENABLED"]:
+        return json_response({"error": "Live updates are disabled"}, 404)
+
+    flask_app = app._get_current_object()
+    sqlite = app.extensions["sqlite3"]
+    keepalive = app.config["EVENTS_KEEPALIVE"]
+    backlog = app.config["EVENTS_BACKLOG"]
+    closes_at = monotonic() + app.config["EVENTS_MAX_AGE"]
+    latest = events.latest(kind)
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    # Ids above the newest row were seen before the database was replaced
+    last_id = min(int(last_event_id), latest) if last_event_id.isdigit() else latest
+
+    def generate(last_id: int) -> Iterator[str]:
+        events.connect()
+        try:
+            yield "retry: 1000\n\n"  # Reconnect quickly after the stream is closed at EVENTS_MAX_AGE
+            while monotonic() < closes_at:
+                latest = events.wait(kind, last_id, keepalive)
+                if latest <= last_id:
+                    yield ": keepalive\n\n"
+                    continue
+                with flask_app.app_context():
+                    rows = sqlite.select(get_new, last_id, latest, *args, backlog)
+                for row in reversed(rows):
+                    yield f"id: {row['id']}\nevent: {kind}\ndata: {dumps(dict(row)).decode()}\n\n"
+                last_id = latest
+        finally:
+            events.disconnect()
+
+    response = app.response_class(generate(last_id), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    response.headers["X-Accel-Buffering"] = "no"  # Let nginx forward events as they are written
+    return response
+
+
+def api_login_required(view: Callable[..., Any]) -> Callable[..., Any]:
+    """Answers unauthenticated API requests with 401 instead of redirecting them to the login page."""
+
+    @wraps(view)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not current_user.is_authenticated:
+            return json_response({"error": "Authentication required"}, 401)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+@app.before_request
+def serve_events_only() -> None:
+    """Answers every request but the event streams with 404 if EVENTS_ONLY is set.
+
+    The password hashing pool, the write-behind writer and the thumbnail pool are only started by other requests,
+    so a worker serving the event streams alone runs no real threads and can use gevent.
+    """
+    if app.config["EVENTS_ONLY"] and request.endpoint not in EVENT_ENDPOINTS:
+        abort(404)
+
+
+@app.route("/api/stream", methods=["GET"])
+@api_login_required
+@conditional(lambda: stream_version(current_user.username))
+def api_stream():
+    """Returns a page of posts from the user and their friends, newest first."""
+    fields = select_fields(POST_FIELDS)
+    posts, next_cursor = get_stream_page(current_user.id, request.args.get("cursor"))
+    return json_response(page(posts, next_cursor, fields, POST_FIELDS))
+
+
+@app.route("/api/comments/<int:post_id>", methods=["GET"])
+@api_login_required
+@conditional(lambda post_id: comments_version(current_user.username, post_id))
+def api_comments(post_id: int):
+    """Returns a page of comments on a post, newest first."""
+    fields = select_fields(COMMENT_FIELDS)
+    post, comments, next_cursor = get_post_and_comments(post_id, request.args.get("cursor"))
+    if post is None:
+        return json_response({"error": "Post not found"}, 404)
+    return json_response(page(comments, next_cursor, fields, COMMENT_FIELDS))
+
+
+@app.route("/api/events/stream", methods=["GET"])
+@api_login_required
+def api_stream_events():
+    """Pushes the ids of new posts by the user and their friends."""
+    get_new_posts = """
+        SELECT id, u_id
+        FROM Posts
+        WHERE id > ? AND id <= ? AND u_id IN (SELECT value FROM json_each(?))
+        ORDER BY id DESC
+        LIMIT ?;
+        """
+    authors = friend_graph.visible_authors(current_user.id)
+    return event_stream("post", get_new_posts, json.dumps(sorted(authors)))
+
+
+@app.route("/api/events/comments/<int:post_id>", methods=["GET"])
+@api_login_required
+def api_comments_events(post_id: int):
+    """Pushes the ids of new comments on a post."""
+    get_new_comments = """
+        SELECT id, p_id
+        FROM Comments
+        WHERE id > ? AND id <= ? AND p_id = ?
+        ORDER BY id DESC
+        LIMIT ?;
+        """
+    return event_stream("comment", get_new_comments, post_id)
@@ -0,0 +1,306 @@
+"""Provides bulk export, import and backup of the Social Insecurity database.
+
+Exports stream the users, posts, comments and friendships from one read snapshot, as NDJSON
+(one object per row, with a "table" key) or as one CSV file per table. Imports read them back in batches
+with executemany, inside a single transaction. The secondary indexes and triggers of the imported tables
+are dropped first and recreated at the end, then the search indexes are rebuilt and the counters recomputed,
+so each row is written once instead of once per index and trigger. Memory use is bounded by BATCH_SIZE
+in both directions. Paths ending in .gz are compressed with gzip.
+
+Uploaded files are not exported, so neither are their Uploads rows. An import registers the files
+the imported posts reference that are present in the uploads folder instead.
+
+Backups copy the live database with SQLite's online backup API, a few pages at a time,
+so the application keeps serving requests while they run. The copy is written next to the target
+and moved into place once it is complete, so an existing backup is only replaced by a complete one.
+
+Example:
+    from social_insecurity import bulk
+
+    with open("dump.ndjson", "w") as file:
+        bulk.export_ndjson(conn, file)
+    with open("dump.ndjson") as file:
+        bulk.import_batches(conn, bulk.read_ndjson(file), uploads=Path("instance/uploads"))
+    bulk.backup(conn, Path("backup.db"))
+"""
+
+from __future__ import annotations
+
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+from collections.abc import Iterable, Iterator
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import IO, Any, Callable, Optional
+
+from social_insecurity.datagen import BATCH_SIZE, batched
+from social_insecurity.search import SEARCH_TABLES
+from social_insecurity.uploads import upload_path
+
+FORMATS = ("ndjson", "csv")
+CONFLICT_ACTIONS = ("replace", "ignore", "abort")
+# Tables in import order, each row only references rows of the tables before it, or uploads
+TABLES = {
+    "Users": (
+        "id",
+        "username",
+        "first_name",
+        "last_name",
+        "password",
+        "education",
+        "employment",
+        "music",
+        "movie",
+        "nationality",
+        "birthday",
+        "version",
+    ),
+    "Posts": ("id", "u_id", "content", "image", "creation_time", "comment_count"),
+    "Comments": ("id", "p_id", "u_id", "comment", "creation_time"),
+    "Friends": ("u_id", "f_id"),
+}
+
+Batch = tuple[str, tuple[str, ...], list[tuple[Any, ...]]]
+
+
+def open_text(path: Path, mode: str) -> IO[str]:
+    """Opens a text file for reading or writing, through gzip if its name ends in .gz."""
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", compresslevel=6, encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def iter_table(conn: sqlite3.Connection, table: str) -> Iterator[tuple[Any, ...]]:
+    """Yields the rows of a table as plain tuples of its TABLES columns, fetched BATCH_SIZE at a time."""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(f"SELECT {', '.join(TABLES[table])} FROM {table};")
+    while rows := cursor.fetchmany(BATCH_SIZE):
+        yield from rows
+    cursor.close()
+
+
+def export_ndjson(conn: sqlite3.Connection, file: IO[str], tables: Iterable[str] = TABLES) -> dict[str, int]:
+    """Writes the rows of the tables to a file as NDJSON, returns the number of rows written per table.
+
+    params:
+        conn: The connection to read from, the tables are read from a single snapshot.
+        file: The text file to write to.
+        tables (optional): The tables to export, all of them by default.
+
+    returns: The number of rows written per table.
+
+    """
+    counts = {}
+    with _snapshot(conn):
+        for table in tables:
+            columns = TABLES[table]
+            counts[table] = 0
+            for row in iter_table(conn, table):
+                file.write(json.dumps({"table": table, **dict(zip(columns, row))}, separators=(",", ":")) + "\n")
+                counts[table] += 1
+    return counts
+
+
+def export_csv(conn: sqlite3.Connection, folder: Path, tables: Iterable[str] = TABLES) -> dict[str, int]:
+    """Writes the rows of each table to <folder>/<table>.csv with a header row, NULL is written as an empty field.
+
+    returns: The number of rows written per table.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    counts = {}
+    with _snapshot(conn):
+        for table in tables:
+            with open_text(folder / f"{table}.csv", "w") as file:
+                writer = csv.writer(file)
+                writer.writerow(TABLES[table])
+                counts[table] = 0
+                for batch in batched(iter_table(conn, table)):
+                    writer.writerows(batch)
+                    counts[table] += len(batch)
+    return counts
+
+
+def read_ndjson(file: IO[str]) -> Iterator[Batch]:
+    """Reads NDJSON rows into batches of consecutive rows of the same table with the same keys."""
+    table, columns, rows = "", (), []
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        item_table = item.pop("table", None)
+        item_columns = tuple(item)
+        if (item_table, item_columns) != (table, columns) or len(rows) >= BATCH_SIZE:
+            if rows:
+                yield table, columns, rows
+            table, columns, rows = item_table, _check_columns(item_table, item_columns, f"line {number}"), []
+        rows.append(tuple(item.values()))
+    if rows:
+        yield table, columns, rows
+
+
+def read_csv(folder: Path) -> Iterator[Batch]:
+    """Reads the <folder>/<table>.csv files that exist into batches, an empty field is read as NULL."""
+    for table in TABLES:
+        path = next((path for path in (folder / f"{table}.csv", folder / f"{table}.csv.gz") if path.exists()), None)
+        if path is None:
+            continue
+        with open_text(path, "r") as file:
+            reader = csv.reader(file)
+            columns = _check_columns(table, tuple(next(reader, ())), path.name)
+            rows = (tuple(value if value != "" else None for value in row) for row in reader)
+            for batch in batched(rows):
+                yield table, columns, batch
+
+
+def import_batches(
+    conn: sqlite3.Connection,
+    batches: Iterable[Batch],
+    on_conflict: str = "replace",
+    progress: Optional[Callable[[str, int], None]] = None,
+    uploads: Optional[Path] = None,
+) -> dict[str, int]:
+    """Inserts batches of rows in a single transaction, with the indexes and triggers deferred to the end.
+
+    params:
+        conn: The connection to write to, it must not be in a transaction.
+        batches: The (table, columns, rows) batches to insert, see read_ndjson() and read_csv().
+        on_conflict (optional): Whether a row replaces, or is ignored for, an existing row with the same key,
+            or aborts the import.
+        progress (optional): Called with the table and the number of rows after every batch.
+        uploads (optional): The uploads folder, the files in it that imported posts reference are registered.
+
+    returns: The number of rows inserted per table.
+
+    """
+    if on_conflict not in CONFLICT_ACTIONS:
+        raise ValueError(f"on_conflict must be one of {', '.join(CONFLICT_ACTIONS)}")
+    verb = "INSERT" if on_conflict == "abort" else f"INSERT OR {on_conflict.upper()}"
+    counts: dict[str, int] = {}
+
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        deferred = _drop_indexes_and_triggers(conn)
+        for table, columns, rows in batches:
+            placeholders = ", ".join("?" * len(columns))
+            conn.executemany(f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({placeholders});", rows)
+            counts[table] = counts.get(table, 0) + len(rows)
+            if progress is not None:
+                progress(table, len(rows))
+
+        for statement in deferred:
+            conn.execute(statement)
+        for table in SEARCH_TABLES:
+            conn.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild');")
+        if uploads is not None:
+            _register_uploads(conn, uploads)
+        _recount(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return counts
+
+
+def backup(
+    conn: sqlite3.Connection,
+    target: Path,
+    pages: int = 1024,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+) -> None:
+    """Copies the database to a new file with SQLite's online backup API.
+
+    params:
+        conn: The connection to the database to copy.
+        target: The path of the copy, it is replaced once the copy is complete.
+        pages (optional): The number of pages copied per step, other connections can write between steps.
+        progress (optional): Called with the status, remaining and total number of pages after every step.
+
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}-")
+    os.close(fd)
+    try:
+        with closing(sqlite3.connect(temporary)) as destination:
+            conn.backup(destination, pages=pages, progress=progress)
+        os.replace(temporary, target)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _check_columns(table: Optional[str], columns: tuple[str, ...], location: str) -> tuple[str, ...]:
+    """Returns the columns if they are known columns of a known table, they are used in the INSERT statements."""
+    if table not in TABLES:
+        raise ValueError(f"Unknown table {table!r} at {location}")
+    unknown = [column for column in columns if column not in TABLES[table]]
+    if unknown or not columns:
+        raise ValueError(f"Unknown columns {', '.join(unknown) or '(none)'} for {table} at {location}")
+    return columns
+
+
+@contextmanager
+def _snapshot(conn: sqlite3.Connection) -> Iterator[None]:
+    """Reads everything inside the block from a single read transaction, without blocking writers in WAL mode."""
+    conn.execute("BEGIN;")
+    try:
+        yield
+    finally:
+        conn.rollback()
+
+
+def _drop_indexes_and_triggers(conn: sqlite3.Connection) -> list[str]:
+    """Drops the secondary indexes and triggers of the imported tables, returns the statements recreating them."""
+    get_deferred = f"""
+        SELECT type, name, sql
+        FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({", ".join("?" * len(TABLES))})
+        ORDER BY type = 'trigger', name;
+        """
+    deferred = conn.execute(get_deferred, tuple(TABLES)).fetchall()
+    for kind, name, _ in deferred:
+        conn.execute(f"DROP {kind.upper()} [{name}];")
+    return [sql for *_, sql in deferred]
+
+
+def _register_uploads(conn: sqlite3.Connection, folder: Path) -> None:
+    """Adds the missing Uploads rows of the stored files that posts reference, their counts are set by _recount()."""
+    get_images = """
+        SELECT DISTINCT image
+        FROM Posts
+        WHERE image IS NOT NULL AND image NOT IN (SELECT name FROM Uploads);
+        """
+    insert_upload = """
+        INSERT INTO Uploads (name, size)
+        VALUES (?, ?);
+        """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(get_images)
+    while names := cursor.fetchmany(BATCH_SIZE):
+        paths = [(name, folder / upload_path(name)) for name, in names]
+        conn.executemany(insert_upload, [(name, path.stat().st_size) for name, path in paths if path.is_file()])
+    cursor.close()
+
+
+def _recount(conn: sqlite3.Connection) -> None:
+    """Recomputes the counters the dropped triggers would have maintained."""
+    recount_comments = """
+        UPDATE Posts
+        SET comment_count = (SELECT COUNT(*) FROM Comments WHERE p_id = Posts.id)
+        WHERE comment_count != (SELECT COUNT(*) FROM Comments WHERE p_id = Posts.id);
+        """
+    # Posts are not indexed by image, so they are counted in one pass instead of once per upload
+    recount_uploads = """
+        UPDATE Uploads
+        SET ref_count = c.count
+        FROM (SELECT image, COUNT(*) AS count FROM Posts WHERE image IS NOT NULL GROUP BY image) AS c
+        WHERE c.image = Uploads.name;
+        """
+    conn.execute(recount_comments)
+    conn.execute("UPDATE Uploads SET ref_count = 0;")
+    conn.execute(recount_uploads)
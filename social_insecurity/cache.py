@@ -0,0 +1,117 @@
+"""Provides a small in-process cache for the Social Insecurity application.
+
+The cache is a thread-safe LRU mapping with an optional time-to-live and memory budget,
+and it counts hits, misses and evictions so it can be sized from real traffic.
+
+Example:
+    from social_insecurity.cache import LRUCache
+
+    cache = LRUCache(maxsize=1024, ttl=60)
+    cache.set("key", "value")
+    value = cache.get("key")
+    print(cache.stats())
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """Provides a thread-safe, size-bounded LRU cache with an optional time-to-live and memory budget."""
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+    ) -> None:
+        """Initializes the cache.
+
+        params:
+            maxsize: The maximum number of entries kept, 0 disables the cache.
+            ttl (optional): The number of seconds an entry stays valid, None keeps entries until evicted.
+            max_bytes (optional): The memory budget for the cached values, None only bounds the number of entries.
+            sizeof (optional): The function measuring the size of a value in bytes.
+
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries: OrderedDict[Hashable, tuple[float, Any, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value for a key, or the default if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl is not None and entry[0] < monotonic()):
+                if entry is not None:
+                    self._remove(key)
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Stores a value, evicting the least recently used entries if the cache is full."""
+        if self.maxsize <= 0:
+            return
+        expires = monotonic() + self.ttl if self.ttl is not None else 0.0
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires, value, size)
+            self._bytes += size
+            while len(self._entries) > self.maxsize or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        """Removes a key from the cache if it is present."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Removes all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, float]:
+        """Returns the size and hit/miss statistics of the cache."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes or 0,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        """Removes an entry, the lock must be held by the caller."""
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
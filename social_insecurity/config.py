@@ -19,7 +19,58 @@ from datetime import timedelta
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY") or "secret"  # TODO: Use this with wtforms
     SQLITE3_DATABASE_PATH = "sqlite3.db"  # Path relative to the Flask instance folder
+    SQLITE3_POOL_SIZE = 8  # Connections kept open between requests, 0 opens a new connection per request
+    SQLITE3_POOL_TIMEOUT = 30.0  # Seconds to wait for a free pooled connection
+    SQLITE3_AUTOCOMMIT = False  # Commit after every statement instead of once per request or transaction()
+    SQLITE3_WRITE_BEHIND = False  # Commit new posts and comments in batches from one writer thread per process
+    SQLITE3_WRITE_BATCH_SIZE = 64  # Writes committed together at most
+    SQLITE3_WRITE_BATCH_LATENCY = 0.002  # Seconds the writer waits for more writes before committing a batch
+    SQLITE3_WRITE_TIMEOUT = 30.0  # Seconds a request waits for its write to be committed
+    SQLITE3_INSTRUMENT = False  # Record every statement per request and serve histograms at /metrics
+    SQLITE3_METRICS_TOKEN = os.environ.get("SQLITE3_METRICS_TOKEN")  # Bearer token required by /metrics, unset hides it
+    SQLITE3_SLOW_QUERY_SECONDS = 0.1  # Statements slower than this are logged with their query plan when instrumented
+    SQLITE3_PRAGMAS = {  # Applied to every new connection
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 64 * 1024 * 1024,
+        "cache_size": -16000,  # Negative values are in KiB
+        "busy_timeout": 5000,  # Milliseconds
+    }
     UPLOADS_FOLDER_PATH = "uploads"  # Path relative to the Flask instance folder
+    UPLOADS_GC_GRACE = 60 * 60  # Seconds gc-uploads keeps a recently uploaded file, for posts still being written
+    UPLOADS_MAX_AGE = 365 * 24 * 60 * 60  # Seconds browsers may cache content-addressed uploads
+    UPLOADS_ACCEL_REDIRECT_PREFIX = None  # Internal nginx location serving the uploads folder, e.g. "/protected-uploads/"
+    RATELIMIT_STORAGE_URI = "sqlite:///ratelimit.db"  # Shared by all workers, relative to the instance folder
+    ARGON2_TIME_COST = 3  # Hashes made with other parameters are upgraded on the next successful login
+    ARGON2_MEMORY_COST = 64 * 1024  # KiB
+    ARGON2_PARALLELISM = 4
+    PASSWORD_HASH_WORKERS = 4  # Threads hashing passwords, 0 hashes on the request thread
+    PASSWORD_HASH_QUEUE_DEPTH = 16  # Hashes allowed to wait for a worker before logins get a 503
+    USER_CACHE_SIZE = 1024  # Users kept in the in-process user_loader cache, 0 disables it
+    USER_CACHE_TTL = 60  # Seconds a cached user stays valid, bounds staleness across worker processes
+    USER_SESSION_IDENTITY = False  # Load the logged in user's identity from the signed session instead of the database
+    IMAGE_VARIANT_WIDTHS = (320, 960)  # Bounding boxes of the resized variants generated for uploaded images
+    IMAGE_VARIANT_FORMAT = "WEBP"  # WEBP or JPEG
+    IMAGE_VARIANT_QUALITY = 80
+    IMAGE_VARIANT_WORKERS = 2  # Background threads generating variants, 0 disables them
+    FRAGMENT_CACHE_BYTES = 8 * 1024 * 1024  # Memory budget for rendered post cards, 0 disables the cache
+    JINJA_BYTECODE_CACHE = "jinja"  # Compiled templates shared by all workers, in the instance folder, None disables it
+    WARM_UP = False  # Compile all templates and open the database in create_app(), before the worker serves requests
+    STREAM_PAGE_SIZE = 20  # Posts shown per page in the stream
+    COMMENTS_PAGE_SIZE = 50  # Comments shown per page on the comments page and in the API
+    API_COMPRESSION_MIN_SIZE = 1024  # Smaller API responses are sent uncompressed
+    EVENTS_ENABLED = False  # Push new posts and comments to open pages, each open page holds a worker connection
+    EVENTS_POLL_INTERVAL = 1.0  # Seconds between reads of the newest post and comment ids, per worker process
+    EVENTS_BACKLOG = 1024  # Events replayed at most to a client reconnecting with Last-Event-ID
+    EVENTS_KEEPALIVE = 15  # Seconds between comments keeping idle event streams open through proxies
+    EVENTS_MAX_AGE = 300  # Seconds before an event stream is closed, browsers reconnect and pick up new friends
+    EVENTS_ONLY = False  # Answer everything but the event streams with 404, for a separate gevent worker
+    TIMELINE_ENABLED = False  # Push new posts into each friend's Timeline on write instead of querying on read
+    TIMELINE_BACKFILL_SIZE = 50  # Recent posts copied into both timelines when a friendship is added
+    FRIEND_GRAPH_SIZE = 10000  # Users whose friendships are kept in memory
+    FRIEND_GRAPH_TTL = 60  # Seconds before friendships added by other workers are picked up
+    FRIEND_SUGGESTIONS = 5  # Friends of friends suggested on the friends page
+    SEARCH_RESULTS_LIMIT = 20  # Results shown per section on the search page
     ALLOWED_EXTENSIONS = {}  # TODO: Might use this at some point, probably don't want people to upload any file type
     WTF_CSRF_ENABLED = False  # TODO: I should probably implement this wtforms feature, but it's not a priority
     # Session security settings
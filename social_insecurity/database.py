@@ -12,19 +12,166 @@ Example:
 
 from __future__ import annotations
 
+import os
+import queue
 import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
 from os import PathLike
 from pathlib import Path
-from typing import Any, Optional, cast
+from time import perf_counter
+from typing import Any, Callable, Mapping, Optional, cast
 
 from flask import Flask, current_app, g
 
 
+class ConnectionPool:
+    """Provides a bounded pool of reusable SQLite3 connections.
+
+    Connections are created lazily up to the configured size and handed out
+    most-recently-used first, so a warm connection keeps its page cache.
+    If all connections are checked out, callers wait up to the timeout for one to be returned.
+    Connections inherited from the parent process after a fork are dropped, SQLite connections
+    must not be used across a fork.
+
+    Example:
+        pool = ConnectionPool(lambda: sqlite3.connect("db.sqlite3"), size=4)
+        conn = pool.acquire()
+        try:
+            conn.execute("SELECT 1;")
+        finally:
+            pool.release(conn)
+    """
+
+    def __init__(self, factory: Callable[[], sqlite3.Connection], size: int, timeout: float = 30.0) -> None:
+        """Initializes the pool.
+
+        params:
+            factory: A callable creating a new, fully configured connection.
+            size: The maximum number of connections kept open by the pool.
+            timeout: The number of seconds to wait for a free connection before giving up.
+
+        """
+        if size < 1:
+            raise ValueError("Connection pool size must be at least 1")
+
+        self._factory = factory
+        self._size = size
+        self._timeout = timeout
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._pid = os.getpid()
+
+    @property
+    def size(self) -> int:
+        """Returns the maximum number of connections in the pool."""
+        return self._size
+
+    def acquire(self) -> sqlite3.Connection:
+        """Checks out a connection, creating or waiting for one if none is idle."""
+        start = perf_counter()
+        self._forget_after_fork()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._create_or_wait()
+
+        waited = perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Returns a connection to the pool, discarding any unfinished transaction."""
+        if self._pid != os.getpid():
+            return  # Checked out before a fork, the pool has forgotten it
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self) -> None:
+        """Closes all idle connections in the pool."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self) -> dict[str, float]:
+        """Returns the size and wait-time statistics of the pool."""
+        with self._lock:
+            idle = self._idle.qsize()
+            return {
+                "size": self._size,
+                "open": self._created,
+                "idle": idle,
+                "in_use": self._created - idle,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_seconds_total": self._wait_total,
+                "wait_seconds_max": self._wait_max,
+                "wait_seconds_avg": self._wait_total / self._checkouts if self._checkouts else 0.0,
+            }
+
+    def _forget_after_fork(self) -> None:
+        """Drops the connections created by the parent process, without closing them.
+
+        Closing them could checkpoint or remove the parent's write-ahead log, so they are left to the parent.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle = queue.LifoQueue()
+                self._created = 0
+                self._pid = os.getpid()
+
+    def _create_or_wait(self) -> sqlite3.Connection:
+        """Creates a new connection if the pool has room, otherwise waits for one to be released."""
+        with self._lock:
+            create = self._created < self._size
+            if create:
+                self._created += 1
+            else:
+                self._waits += 1
+
+        if create:
+            try:
+                return self._factory()
+            except BaseException:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self._timeout)
+        except queue.Empty:
+            raise RuntimeError(f"Timed out after {self._timeout}s waiting for a database connection") from None
+
+
 class SQLite3:
     """Provides a SQLite3 database extension for Flask.
 
     This class provides a simple interface to the SQLite3 database.
     It also initializes the database if it does not exist yet.
+    If SQLITE3_POOL_SIZE is set, connections are checked out of a ConnectionPool per app context
+    and returned at teardown instead of being opened and closed for every request.
+
+    Writes made outside an explicit transaction() share one transaction per app context,
+    which is committed at teardown, or rolled back if the request failed.
+    Setting SQLITE3_AUTOCOMMIT restores the old behaviour of committing after every statement.
+    Callables appended to observers are told about every statement run through select, query and insert.
 
     Example:
         from flask import Flask
@@ -34,9 +181,10 @@ class SQLite3:
         db = SQLite3(app)
 
         # Use the database
-        # db.query("SELECT * FROM Users;")
-        # db.query("SELECT * FROM Users WHERE id = 1;", one=True)
-        # db.query("INSERT INTO Users (name, email) VALUES ('John', 'test@test.net');")
+        # db.select("SELECT id, username FROM Users;")
+        # db.select("SELECT id, username FROM Users WHERE id = 1;", one=True, row=FriendRow)
+        # with db.transaction():
+        #     db.query("INSERT INTO Users (name, email) VALUES ('John', 'test@test.net');")
     """
 
     def __init__(
@@ -54,6 +202,9 @@ class SQLite3:
             schema (optional): The path to the schema file. Is relative to the application root folder.
 
         """
+        self.pool: Optional[ConnectionPool] = None
+        # Called with the statement, its parameters, the number of rows and the seconds it took
+        self.observers: list[Callable[[str, tuple[Any, ...], int, float], None]] = []
         if app is not None:
             self.init_app(app, path=path, schema=schema)
 
@@ -91,42 +242,176 @@ class SQLite3:
         else:
             raise ValueError("No database path provided to SQLite3 extension")
 
+        self._pragmas: Mapping[str, Any] = app.config.get("SQLITE3_PRAGMAS") or {}
+        self._autocommit = bool(app.config.get("SQLITE3_AUTOCOMMIT", False))
+        pool_size = app.config.get("SQLITE3_POOL_SIZE", 0)
+        self.pool = (
+            ConnectionPool(
+                lambda: self.connect(check_same_thread=False),
+                pool_size,
+                app.config.get("SQLITE3_POOL_TIMEOUT", 30.0),
+            )
+            if pool_size
+            else None
+        )
+
+        app.teardown_appcontext(self._close_connection)
+
         if not self._path.exists():
-            self._path.parent.mkdir(parents=True)
+            self._path.parent.mkdir(parents=True, exist_ok=True)
 
         if schema and not self._path.exists():
             with app.app_context():
                 self._init_database(schema)
 
-        app.teardown_appcontext(self._close_connection)
-
     @property
     def connection(self) -> sqlite3.Connection:
         """Returns the connection to the SQLite3 database."""
         conn = getattr(g, "flask_sqlite3_connection", None)
         if conn is None:
-            conn = g.flask_sqlite3_connection = sqlite3.connect(self._path)
-            conn.row_factory = sqlite3.Row
+            conn = g.flask_sqlite3_connection = self.pool.acquire() if self.pool else self.connect()
         return conn
 
-    def query(self, query: str, *args, one: bool = False) -> Any:
+    def query(self, query: str, *args, one: bool = False, row: Optional[type[tuple]] = None) -> Any:
         """Queries the database and returns the result.'
 
         params:
             query: The SQL query to execute.
             one: Whether to return a single row or a list of rows.
+            row (optional): A named tuple class to build the rows as, instead of sqlite3.Row.
             args: Additional arguments to pass to the query.
 
         returns: A single row, a list of rows or None.
 
         """
+        response = self.select(query, *args, one=one, row=row)
+        if self._autocommit and not g.get("flask_sqlite3_transaction_depth"):
+            self.connection.commit()
+        return response
+
+    def insert(self, query: str, *args) -> int:
+        """Executes an INSERT statement and returns the rowid of the inserted row.
+
+        params:
+            query: The SQL statement to execute.
+            args: Additional arguments to pass to the statement.
+
+        returns: The rowid of the last inserted row.
+
+        """
+        start = perf_counter()
         cursor = self.connection.execute(query, args)
+        rowid = cast(int, cursor.lastrowid)
+        rows = cursor.rowcount
+        cursor.close()
+        for observer in self.observers:
+            observer(query, args, rows, perf_counter() - start)
+        if self._autocommit and not g.get("flask_sqlite3_transaction_depth"):
+            self.connection.commit()
+        return rowid
+
+    def select(self, query: str, *args, one: bool = False, row: Optional[type[tuple]] = None) -> Any:
+        """Queries the database without committing, intended for read-only statements.
+
+        params:
+            query: The SQL query to execute.
+            one: Whether to return a single row or a list of rows.
+            row (optional): A named tuple class to build the rows as, instead of sqlite3.Row.
+                The query must select exactly its fields, in order.
+            args: Additional arguments to pass to the query.
+
+        returns: A single row, a list of rows or None.
+
+        """
+        start = perf_counter()
+        cursor = self.connection.cursor()
+        if row is not None:
+            cursor.row_factory = None  # Plain tuples, converted below without a Python call per column
+        cursor.execute(query, args)
         response = cursor.fetchone() if one else cursor.fetchall()
         cursor.close()
-        self.connection.commit()
+        if row is not None:
+            if one:
+                response = row._make(response) if response is not None else None
+            else:
+                response = list(map(row._make, response))
+        if self.observers:
+            rows = int(response is not None) if one else len(response)
+            elapsed = perf_counter() - start
+            for observer in self.observers:
+                observer(query, args, rows, elapsed)
         return response
 
-    # TODO: Add more specific query methods to simplify code
+    def connect(self, **kwargs: Any) -> sqlite3.Connection:
+        """Opens a new connection and applies the configured PRAGMAs to it.
+
+        The connection belongs to the caller, it is neither pooled nor closed with the app context.
+
+        params:
+            kwargs: Additional arguments to pass to sqlite3.connect(), such as check_same_thread.
+
+        returns: The new connection.
+
+        """
+        conn = sqlite3.connect(self._path, **kwargs)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in self._pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value};")
+        return conn
+
+    @contextmanager
+    def bind(self, conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+        """Runs the enclosed statements of the current app context on a connection owned by the caller.
+
+        Inside the block query(), insert(), select() and transaction() use the connection. It is not committed,
+        returned to the pool or closed when the block or the app context ends, so the caller can reuse it
+        across app contexts, for example in a background thread.
+
+        Example:
+            conn = db.connect(check_same_thread=False)
+            with app.app_context(), db.bind(conn):
+                db.query("INSERT INTO Posts (u_id, content) VALUES (?, ?);", 1, "Hello")
+        """
+        previous = g.pop("flask_sqlite3_connection", None)
+        depth = g.pop("flask_sqlite3_transaction_depth", 0)
+        g.flask_sqlite3_connection = conn
+        try:
+            yield conn
+        finally:
+            g.pop("flask_sqlite3_connection", None)
+            if previous is not None:
+                g.flask_sqlite3_connection = previous
+            g.flask_sqlite3_transaction_depth = depth
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Runs the enclosed statements in a single transaction.
+
+        The transaction is committed when the outermost block exits, and rolled back if it raises.
+        Nested blocks join the enclosing transaction.
+
+        Example:
+            with db.transaction():
+                db.query("INSERT INTO Posts (u_id, content) VALUES (?, ?);", 1, "Hello")
+                db.query("INSERT INTO Comments (p_id, u_id, comment) VALUES (?, ?, ?);", 1, 1, "World")
+        """
+        conn = self.connection
+        depth = g.get("flask_sqlite3_transaction_depth", 0)
+        if depth == 0 and not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE;")
+
+        g.flask_sqlite3_transaction_depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            if depth == 0:
+                conn.rollback()
+            raise
+        else:
+            if depth == 0:
+                conn.commit()
+        finally:
+            g.flask_sqlite3_transaction_depth = depth
 
     def _init_database(self, schema: PathLike | str) -> None:
         """Initializes the database with the supplied schema if it does not exist yet."""
@@ -135,7 +420,16 @@ class SQLite3:
             self.connection.commit()
 
     def _close_connection(self, exception: Optional[BaseException] = None) -> None:
-        """Closes the connection to the database."""
-        conn = cast(sqlite3.Connection, getattr(g, "flask_sqlite3_connection", None))
-        if conn is not None:
+        """Closes the connection to the database, or returns it to the pool if pooling is enabled."""
+        conn = cast(sqlite3.Connection, g.pop("flask_sqlite3_connection", None))
+        if conn is None:
+            return
+        if conn.in_transaction:
+            if exception is None:
+                conn.commit()
+            else:
+                conn.rollback()
+        if self.pool:
+            self.pool.release(conn)
+        else:
             conn.close()
@@ -0,0 +1,112 @@
+"""Generates realistic test data for the Social Insecurity application.
+
+Friend degrees follow a power law, so a few users have very many friends and most have a handful.
+Well connected users also post more, and a few popular posts collect most of the comments.
+Rows are written directly with executemany in batches, the triggers keep counters and search indexes in sync.
+
+Example:
+    from social_insecurity.datagen import generate
+
+    with sqlite.transaction() as conn:
+        generate(conn, users=1000, posts=10000, comments=50000, password_hash=hash_password("password"))
+"""
+
+from __future__ import annotations
+
+import itertools
+import random
+import sqlite3
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+from typing import Any
+
+BATCH_SIZE = 10000
+DEGREE_EXPONENT = 1.5  # Pareto shape of the friend degrees, lower is more skewed
+WORDS = (
+    "the a my our today just really new old great bad coffee music movie trip home work school friends family "
+    "weekend holiday summer winter photo picture dinner lunch game team city beach mountain party birthday"
+).split()
+
+
+def batched(rows: Iterable[tuple[Any, ...]], size: int = BATCH_SIZE) -> Iterator[list[tuple[Any, ...]]]:
+    """Splits rows into lists of at most size rows."""
+    iterator = iter(rows)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def generate(
+    conn: sqlite3.Connection,
+    users: int,
+    posts: int,
+    comments: int,
+    password_hash: str,
+    friends: float = 10.0,
+    seed: int = 0,
+) -> dict[str, int]:
+    """Adds users, friendships, posts and comments to the database.
+
+    params:
+        conn: The connection to write to, the caller commits.
+        users: The number of users to add, named user<id>.
+        posts: The number of posts to add.
+        comments: The number of comments to add.
+        password_hash: The password hash stored for every new user.
+        friends (optional): The average number of friends added per user.
+        seed (optional): The seed of the random generator, the same seed generates the same data.
+
+    returns: The number of rows added to each table.
+
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    first_user = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM Users;").fetchone()[0]
+    first_post = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM Posts;").fetchone()[0]
+    user_ids = range(first_user, first_user + users)
+
+    def random_time() -> str:
+        return (now - timedelta(seconds=rng.randrange(365 * 24 * 60 * 60))).strftime("%Y-%m-%d %H:%M:%S")
+
+    def random_text(words: int) -> str:
+        return " ".join(rng.choices(WORDS, k=words)).capitalize()
+
+    for batch in batched(
+        (f"user{user_id}", rng.choice(WORDS).title(), rng.choice(WORDS).title(), password_hash) for user_id in user_ids
+    ):
+        conn.executemany("INSERT INTO Users (username, first_name, last_name, password) VALUES (?, ?, ?, ?);", batch)
+
+    # Pareto distributed degrees, scaled so their mean is the requested number of friends
+    scale = friends * (DEGREE_EXPONENT - 1) / DEGREE_EXPONENT
+    degrees = [min(users - 1, int(scale * rng.paretovariate(DEGREE_EXPONENT))) for _ in user_ids]
+    by_degree = list(itertools.accumulate(degree + 1 for degree in degrees))
+    friendships = (
+        (user_id, friend_id)
+        for user_id, degree in zip(user_ids, degrees)
+        for friend_id in rng.choices(user_ids, cum_weights=by_degree, k=degree)
+        if friend_id != user_id
+    )
+    friendships_before = conn.total_changes
+    for batch in batched(friendships):
+        conn.executemany("INSERT OR IGNORE INTO Friends (u_id, f_id) VALUES (?, ?);", batch)
+    friendships_added = conn.total_changes - friendships_before
+
+    post_times = sorted(random_time() for _ in range(posts))
+    authors = rng.choices(user_ids, cum_weights=by_degree, k=posts)
+    for batch in batched(
+        (author, random_text(rng.randint(3, 30)), creation_time) for author, creation_time in zip(authors, post_times)
+    ):
+        conn.executemany("INSERT INTO Posts (u_id, content, creation_time) VALUES (?, ?, ?);", batch)
+
+    # A few posts collect most of the comments
+    if posts:
+        by_popularity = list(itertools.accumulate(1 / rank for rank in range(1, posts + 1)))
+        popular = list(range(posts))
+        rng.shuffle(popular)
+        commented = (popular[index] for index in rng.choices(range(posts), cum_weights=by_popularity, k=comments))
+        for batch in batched(
+            (first_post + index, rng.choice(user_ids), random_text(rng.randint(1, 20)), post_times[index])
+            for index in commented
+        ):
+            conn.executemany("INSERT INTO Comments (p_id, u_id, comment, creation_time) VALUES (?, ?, ?, ?);", batch)
+
+    return {"users": users, "friends": friendships_added, "posts": posts, "comments": comments if posts else 0}
@@ -0,0 +1,64 @@
+"""Provides conditional GET support for the authenticated pages of the Social Insecurity application.
+
+A page decorated with conditional() gets a weak ETag computed from a cheap version stamp,
+for example the highest post, comment and friendship ids, instead of from the rendered page.
+If the browser already has the page for the current stamp, it gets a 304 response
+before the view runs its main queries and renders its template.
+
+Example:
+    @app.route("/friends/<string:username>")
+    @login_required
+    @conditional(lambda username: sqlite.select("SELECT MAX(rowid) FROM Friends;", one=True))
+    def friends(username: str):
+        ...
+"""
+
+from __future__ import annotations
+
+import hashlib
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+# Changes whenever a template does, so a deployment never serves pages rendered by the previous one
+_TEMPLATES_STAMP = max(
+    (path.stat().st_mtime_ns for path in (Path(__file__).parent / "templates").iterdir()),
+    default=0,
+)
+
+
+def conditional(version: Callable[..., Any]) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Adds weak ETags and 304 responses to a view.
+
+    params:
+        version: Called with the view arguments, returns a value that changes whenever the page would.
+
+    """
+
+    def decorator(view: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(view)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            # Flashed messages are shown once, so a page carrying them can never be reused
+            if request.method != "GET" or session.get("_flashes"):
+                return view(*args, **kwargs)
+
+            stamp = (_TEMPLATES_STAMP, current_user.get_id(), request.full_path, tuple(version(*args, **kwargs)))
+            etag = hashlib.sha1(repr(stamp).encode()).hexdigest()
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,110 @@
+"""Provides live updates of new posts and comments for the Social Insecurity application.
+
+Live updates are off unless EVENTS_ENABLED is set. Server-sent event streams then tell their client
+about the new posts and comments it may see. New rows are read from the Posts and Comments tables,
+so every worker and host sharing the database sees the writes of all of them.
+
+Waiting clients share one condition variable per process instead of each polling the database.
+At most every EVENTS_POLL_INTERVAL seconds one of them reads the highest post and comment ids,
+and all of them are woken if the ids grew. Writes made by this process wake them right away.
+Event ids are row ids, so a client reconnecting with Last-Event-ID to any worker picks up what it missed.
+Under gevent the condition variable is patched to wait in greenlets, so a worker started with EVENTS_ONLY
+holds thousands of waiting clients instead of one thread each.
+
+Example:
+    from social_insecurity import events
+
+    events.publish("post", post_id)
+
+    latest = events.wait("post", last_id, timeout=15)
+"""
+
+from __future__ import annotations
+
+import threading
+from math import inf
+from time import monotonic
+from typing import Optional
+
+from flask import Flask
+
+# Kinds of events, and the table whose rows they announce
+TABLES = {"post": "Posts", "comment": "Comments"}
+
+
+class EventHub:
+    """Tracks the highest post and comment ids, so that many clients can wait for new ones cheaply."""
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self._app: Optional[Flask] = None
+        self._latest = {kind: 0 for kind in TABLES}
+        self._poll_interval = 1.0
+        self._polled_at = -inf
+        self._polling = False
+        self._clients = 0
+        self._condition = threading.Condition()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Initializes the hub with the database and poll interval of the app."""
+        self._app = app
+        self._poll_interval = app.config.get("EVENTS_POLL_INTERVAL", 1.0)
+
+    def latest(self, kind: str) -> int:
+        """Returns the highest id of a kind, reading it from the database if it was not read recently."""
+        self._poll_if_due()
+        with self._condition:
+            return self._latest[kind]
+
+    def publish(self, kind: str, id: int) -> None:
+        """Records a row written by this process and wakes up every waiting client."""
+        with self._condition:
+            if id > self._latest[kind]:
+                self._latest[kind] = id
+                self._condition.notify_all()
+
+    def wait(self, kind: str, last_id: int, timeout: float) -> int:
+        """Waits up to timeout seconds for an id of a kind above last_id, returns the highest id."""
+        deadline = monotonic() + timeout
+        while True:
+            self._poll_if_due()
+            with self._condition:
+                remaining = deadline - monotonic()
+                if self._latest[kind] > last_id or remaining <= 0:
+                    return self._latest[kind]
+                self._condition.wait(min(remaining, self._poll_interval))
+
+    def connect(self) -> None:
+        """Counts a client as connected."""
+        with self._condition:
+            self._clients += 1
+
+    def disconnect(self) -> None:
+        """Counts a client as disconnected."""
+        with self._condition:
+            self._clients -= 1
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of connected clients and the highest id of each kind."""
+        with self._condition:
+            return {"clients": self._clients, **self._latest}
+
+    def _poll_if_due(self) -> None:
+        """Reads the highest ids from the database, in one client at a time and at most once per poll interval."""
+        with self._condition:
+            if self._polling or monotonic() - self._polled_at < self._poll_interval:
+                return
+            self._polling = True
+        get_latest = f"""
+            SELECT {", ".join(f"(SELECT MAX(id) FROM {table})" for table in TABLES.values())};
+            """
+        try:
+            with self._app.app_context():
+                latest = self._app.extensions["sqlite3"].select(get_latest, one=True)
+        finally:
+            with self._condition:
+                self._polling = False
+                self._polled_at = monotonic()
+        for kind, id in zip(TABLES, latest):
+            self.publish(kind, id or 0)
@@ -89,6 +89,16 @@ class FriendsForm(FlaskForm):
     submit = SubmitField(label="Add Friend")
 
 
+class SearchForm(FlaskForm):
+    """Provides the search form for the application, it is submitted with GET so results can be linked."""
+
+    class Meta:
+        csrf = False
+
+    q = StringField(label="Search", render_kw={"placeholder": "Search posts, comments and people"})
+    submit = SubmitField(label="Search")
+
+
 class ProfileForm(FlaskForm):
     """Provides the profile form for the application."""
 
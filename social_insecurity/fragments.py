@@ -0,0 +1,55 @@
+"""Provides caching of rendered template fragments for the Social Insecurity application.
+
+A post never changes after it is inserted, so the HTML of its card only has to be rendered once
+for every version of the data it shows, such as its comment count.
+Templates render such fragments through the render_fragment() template global,
+which keys the cache by the fragment name and a caller supplied key that includes that version.
+A new comment therefore changes the key of the card, and the stale entry is evicted by the LRU.
+
+Example:
+    {{ render_fragment("post_card.html.j2", (post.id, post.comment_count), post=post) }}
+"""
+
+from __future__ import annotations
+
+from typing import Any, Hashable
+
+from flask import Flask, render_template
+from markupsafe import Markup
+
+from social_insecurity.cache import LRUCache
+
+
+class FragmentCache:
+    """Caches rendered template fragments within a memory budget."""
+
+    def __init__(self) -> None:
+        self.cache = LRUCache(maxsize=0)
+
+    def init_app(self, app: Flask) -> None:
+        """Configures the memory budget and registers the render_fragment template global."""
+        budget = app.config["FRAGMENT_CACHE_BYTES"]
+        # Bounded by the memory budget rather than the number of fragments, a budget of 0 disables the cache
+        self.cache = LRUCache(maxsize=1_000_000 if budget else 0, max_bytes=budget, sizeof=len)
+        app.jinja_env.globals["render_fragment"] = self.render
+        app.extensions["fragments"] = self
+
+    def render(self, template_name: str, key: Hashable, **context: Any) -> Markup:
+        """Returns the rendered fragment for a key, rendering and caching it on a miss.
+
+        params:
+            template_name: The template rendering the fragment.
+            key: Identifies the data shown by the fragment, including its version.
+            context: The variables passed to the template on a miss.
+
+        """
+        cache_key = (template_name, key)
+        fragment = self.cache.get(cache_key)
+        if fragment is None:
+            fragment = Markup(render_template(template_name, **context))
+            self.cache.set(cache_key, fragment)
+        return fragment
+
+    def stats(self) -> dict[str, float]:
+        """Returns the size and hit rate of the cache."""
+        return self.cache.stats()
@@ -0,0 +1,137 @@
+"""Provides an in-memory index of the friend graph for the Social Insecurity application.
+
+Friendships are stored as directed rows in Friends, but a user sees the posts of everyone
+they added and everyone who added them. The index keeps both directions for each user as frozensets,
+loaded lazily from Friends and reloaded when a friendship is added in this process.
+Entries expire after FRIEND_GRAPH_TTL seconds, which bounds how stale friendships added by other
+worker processes can be.
+
+Example:
+    from social_insecurity import friend_graph
+
+    if not friend_graph.is_friend(current_user.id, friend_id):
+        ...
+    authors = friend_graph.visible_authors(current_user.id)
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from collections import Counter
+from typing import NamedTuple, Optional
+
+from flask import Flask, current_app
+
+from social_insecurity.cache import LRUCache
+
+
+class Adjacency(NamedTuple):
+    """The friendships of a single user, in both directions."""
+
+    friends: frozenset[int]  # Users this user added
+    followers: frozenset[int]  # Users who added this user
+
+    @property
+    def connections(self) -> frozenset[int]:
+        return self.friends | self.followers
+
+
+class FriendGraph:
+    """Provides O(1) friendship lookups, stream authors, mutual friends and suggestions without SQL."""
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self._lock = threading.Lock()
+        self._generation = 0  # Incremented by add(), loads that started before it are not indexed
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Initializes the index with the size and time-to-live configured for the app."""
+        app.extensions["friend_graph"] = LRUCache(
+            maxsize=app.config.get("FRIEND_GRAPH_SIZE", 10000),
+            ttl=app.config.get("FRIEND_GRAPH_TTL", 60),
+        )
+
+    @property
+    def _cache(self) -> LRUCache:
+        return current_app.extensions["friend_graph"]
+
+    def adjacency(self, user_id: int) -> Adjacency:
+        """Returns the friendships of a user, loading them from the database if they are not indexed yet."""
+        return self.adjacencies([user_id])[user_id]
+
+    def adjacencies(self, user_ids: list[int]) -> dict[int, Adjacency]:
+        """Returns the friendships of several users, loading all missing ones with two queries."""
+        found = {user_id: self._cache.get(user_id) for user_id in user_ids}
+        missing = [user_id for user_id, adjacency in found.items() if adjacency is None]
+        if missing:
+            found.update(self._load(missing))
+        return found
+
+    def is_friend(self, user_id: int, friend_id: int) -> bool:
+        """Returns whether a user has added another user as a friend."""
+        return friend_id in self.adjacency(user_id).friends
+
+    def visible_authors(self, user_id: int) -> frozenset[int]:
+        """Returns the users whose posts appear in a user's stream, including the user themselves."""
+        return self.adjacency(user_id).connections | {user_id}
+
+    def mutual_count(self, user_id: int, other_id: int) -> int:
+        """Returns the number of connections two users have in common."""
+        adjacencies = self.adjacencies([user_id, other_id])
+        return len(adjacencies[user_id].connections & adjacencies[other_id].connections)
+
+    def suggestions(self, user_id: int, limit: int = 10) -> list[tuple[int, int]]:
+        """Returns friends of friends the user is not connected to, with the most mutual connections first.
+
+        returns: A list of (user id, number of mutual connections) pairs.
+        """
+        connections = self.adjacency(user_id).connections
+        mutuals: Counter[int] = Counter()
+        for adjacency in self.adjacencies(list(connections)).values():
+            mutuals.update(adjacency.connections)
+        for known in connections | {user_id}:
+            mutuals.pop(known, None)
+        return sorted(mutuals.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def add(self, user_id: int, friend_id: int) -> None:
+        """Records a friendship after it was committed, both users are reloaded on their next lookup.
+
+        The entries are dropped rather than updated, and loads that read Friends before the commit
+        are not indexed, so a concurrent load cannot put the old friendships back.
+        """
+        with self._lock:
+            self._generation += 1
+            self._cache.pop(user_id)
+            self._cache.pop(friend_id)
+
+    def _load(self, user_ids: list[int]) -> dict[int, Adjacency]:
+        """Reads the friendships of the given users from the database and indexes them."""
+        sqlite = current_app.extensions["sqlite3"]
+        get_friends = """
+            SELECT u_id, f_id
+            FROM Friends
+            WHERE u_id IN (SELECT value FROM json_each(?));
+            """
+        get_followers = """
+            SELECT u_id, f_id
+            FROM Friends
+            WHERE f_id IN (SELECT value FROM json_each(?));
+            """
+        with self._lock:
+            generation = self._generation
+        ids = json.dumps(user_ids)
+        friends: dict[int, set[int]] = {user_id: set() for user_id in user_ids}
+        followers: dict[int, set[int]] = {user_id: set() for user_id in user_ids}
+        for u_id, f_id in sqlite.select(get_friends, ids):
+            friends[u_id].add(f_id)
+        for u_id, f_id in sqlite.select(get_followers, ids):
+            followers[f_id].add(u_id)
+
+        loaded = {user_id: Adjacency(frozenset(friends[user_id]), frozenset(followers[user_id])) for user_id in user_ids}
+        with self._lock:
+            if generation == self._generation:
+                for user_id, adjacency in loaded.items():
+                    self._cache.set(user_id, adjacency)
+        return loaded
@@ -0,0 +1,251 @@
+"""Provides opt-in SQL instrumentation for the Social Insecurity application.
+
+When SQLITE3_INSTRUMENT is set, every statement run through the SQLite3 extension is recorded
+for the current request with its fingerprint, number of parameters, number of rows and wall time.
+Statements slower than SQLITE3_SLOW_QUERY_SECONDS are logged together with their query plan.
+At the end of each request the records are added to histograms per route and per statement,
+which are served in the Prometheus text format at /metrics to scrapers sending SQLITE3_METRICS_TOKEN
+as a bearer token, and summarized for the browser in a Server-Timing header.
+/metrics also reports the connection pool, the write-behind queue and the hits and misses of the in-process caches.
+
+Example:
+    from social_insecurity.instrumentation import QueryMetrics
+
+    metrics = QueryMetrics()
+    metrics.init_app(app)
+
+    # curl -H "Authorization: Bearer $SQLITE3_METRICS_TOKEN" http://127.0.0.1:5000/metrics
+"""
+
+from __future__ import annotations
+
+import hmac
+import re
+import sqlite3
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, NamedTuple, Optional
+
+from flask import Flask, current_app, g, request
+
+# Upper bounds of the histogram buckets, in seconds or statements per request
+DURATION_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Metrics of the in-process caches, with their type, help text and the key of their value in LRUCache.stats()
+CACHE_METRICS = (
+    ("cache_entries", "gauge", "Entries held by an in-process cache.", "size"),
+    ("cache_bytes", "gauge", "Size of the values held by an in-process cache with a memory budget.", "bytes"),
+    ("cache_hits_total", "counter", "Lookups answered by an in-process cache.", "hits"),
+    ("cache_misses_total", "counter", "Lookups an in-process cache could not answer.", "misses"),
+    ("cache_evictions_total", "counter", "Entries evicted from an in-process cache to make room.", "evictions"),
+    ("cache_hit_ratio", "gauge", "Share of the lookups answered by an in-process cache since it started.", "hit_ratio"),
+)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(query: str) -> str:
+    """Returns the statement with literals replaced by ? and whitespace collapsed, to group its executions."""
+    return _WHITESPACE.sub(" ", _LITERALS.sub("?", query)).strip()
+
+
+class StatementRecord(NamedTuple):
+    """A statement executed during a request."""
+
+    fingerprint: str
+    params: int
+    rows: int
+    seconds: float
+
+
+class Histogram:
+    """Counts observations in cumulative buckets, like a Prometheus histogram."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str) -> list[str]:
+        """Returns the histogram as lines of the Prometheus text format."""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+def label(value: str) -> str:
+    """Escapes a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def cache_samples(caches: dict[str, dict[str, float]]) -> list[str]:
+    """Returns the statistics of caches, by cache name, as lines of the Prometheus text format."""
+    lines = []
+    for name, kind, description, key in CACHE_METRICS:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{cache="{label(cache)}"}} {stats[key]}' for cache, stats in caches.items()]
+    return lines
+
+
+def pool_samples(stats: dict[str, float]) -> list[str]:
+    """Returns the statistics of the connection pool as lines of the Prometheus text format."""
+    return [
+        "# HELP sqlite_pool_size Connections the pool keeps open at most.",
+        "# TYPE sqlite_pool_size gauge",
+        f"sqlite_pool_size {stats['size']}",
+        "# HELP sqlite_pool_connections Open connections of the pool, idle or checked out.",
+        "# TYPE sqlite_pool_connections gauge",
+        f'sqlite_pool_connections{{state="idle"}} {stats["idle"]}',
+        f'sqlite_pool_connections{{state="in_use"}} {stats["in_use"]}',
+        "# HELP sqlite_pool_checkouts_total Connections checked out of the pool.",
+        "# TYPE sqlite_pool_checkouts_total counter",
+        f"sqlite_pool_checkouts_total {stats['checkouts']}",
+        "# HELP sqlite_pool_waits_total Checkouts that waited because every connection was in use.",
+        "# TYPE sqlite_pool_waits_total counter",
+        f"sqlite_pool_waits_total {stats['waits']}",
+        "# HELP sqlite_pool_wait_seconds_total Time spent checking out connections.",
+        "# TYPE sqlite_pool_wait_seconds_total counter",
+        f"sqlite_pool_wait_seconds_total {stats['wait_seconds_total']}",
+        "# HELP sqlite_pool_wait_seconds_max Longest checkout since the worker started.",
+        "# TYPE sqlite_pool_wait_seconds_max gauge",
+        f"sqlite_pool_wait_seconds_max {stats['wait_seconds_max']}",
+    ]
+
+
+class QueryMetrics:
+    """Provides per-request SQL records and aggregate histograms for the SQLite3 extension."""
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self._lock = threading.Lock()
+        self._statements: dict[str, tuple[Histogram, Histogram]] = {}
+        self._routes: dict[str, tuple[Histogram, Histogram]] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Hooks into the SQLite3 extension and adds the /metrics endpoint, if SQLITE3_INSTRUMENT is set."""
+        if not app.config.get("SQLITE3_INSTRUMENT", False):
+            return
+
+        app.extensions["sqlite3"].observers.append(self.record)
+        app.after_request(self._finish_request)
+        app.add_url_rule("/metrics", "metrics", self.serve)
+
+    def record(self, query: str, args: tuple[Any, ...], rows: int, seconds: float) -> None:
+        """Records a statement for the current request, logging it with its query plan if it was slow."""
+        record = StatementRecord(fingerprint(query), len(args), rows, seconds)
+        g.setdefault("sql_statements", []).append(record)
+
+        threshold = current_app.config.get("SQLITE3_SLOW_QUERY_SECONDS")
+        if threshold is not None and seconds >= threshold:
+            sqlite = current_app.extensions["sqlite3"]
+            try:
+                plan = sqlite.connection.execute(f"EXPLAIN QUERY PLAN {query}", args).fetchall()
+            except sqlite3.Error:
+                plan = []  # Not every statement has a plan, PRAGMAs for example
+            current_app.logger.warning(
+                "Slow statement took %.1f ms, returned %d rows: %s\n%s",
+                seconds * 1000,
+                rows,
+                record.fingerprint,
+                "\n".join(f"  {detail}" for *_, detail in plan),
+            )
+
+    def serve(self) -> Any:
+        """Serves the histograms in the Prometheus text format, to clients sending SQLITE3_METRICS_TOKEN.
+
+        The peer address is not checked, behind a reverse proxy every request comes from the proxy's host.
+        Without a token configured the endpoint is not served at all.
+        """
+        token = current_app.config.get("SQLITE3_METRICS_TOKEN")
+        sent = request.headers.get("Authorization", "")
+        if not token or not hmac.compare_digest(sent.encode(), f"Bearer {token}".encode()):
+            return current_app.response_class(status=404)
+        return current_app.response_class(self.render(), mimetype="text/plain; version=0.0.4")
+
+    def render(self) -> str:
+        """Returns all histograms in the Prometheus text format."""
+        lines = [
+            "# HELP sqlite_statement_duration_seconds Wall time of each execution of a statement.",
+            "# TYPE sqlite_statement_duration_seconds histogram",
+        ]
+        with self._lock:
+            statements = list(self._statements.items())
+            routes = list(self._routes.items())
+        for statement, (duration, _) in statements:
+            lines += duration.samples("sqlite_statement_duration_seconds", f'statement="{label(statement)}"')
+        lines += [
+            "# HELP sqlite_statement_rows Rows returned or changed by each execution of a statement.",
+            "# TYPE sqlite_statement_rows histogram",
+        ]
+        for statement, (_, rows) in statements:
+            lines += rows.samples("sqlite_statement_rows", f'statement="{label(statement)}"')
+        lines += [
+            "# HELP sqlite_route_statements Statements executed per request to a route.",
+            "# TYPE sqlite_route_statements histogram",
+        ]
+        for route, (count, _) in routes:
+            lines += count.samples("sqlite_route_statements", f'route="{label(route)}"')
+        lines += [
+            "# HELP sqlite_route_duration_seconds Time spent in SQL per request to a route.",
+            "# TYPE sqlite_route_duration_seconds histogram",
+        ]
+        for route, (_, duration) in routes:
+            lines += duration.samples("sqlite_route_duration_seconds", f'route="{label(route)}"')
+        pool = current_app.extensions["sqlite3"].pool
+        if pool is not None:
+            lines += pool_samples(pool.stats())
+        write_behind = current_app.extensions.get("write_behind")
+        if write_behind is not None:
+            lines += write_behind.samples()
+        caches = {}
+        fragments = current_app.extensions.get("fragments")
+        if fragments is not None:
+            caches["fragments"] = fragments.stats()
+        user_cache = current_app.extensions.get("user_cache")
+        if user_cache is not None:
+            caches["users"] = user_cache.stats()
+        if caches:
+            lines += cache_samples(caches)
+        return "\n".join(lines) + "\n"
+
+    def _finish_request(self, response: Any) -> Any:
+        """Adds the statements of the finished request to the histograms and the Server-Timing header."""
+        records: list[StatementRecord] = g.pop("sql_statements", [])
+        route = request.endpoint or "unknown"
+        total = sum(record.seconds for record in records)
+
+        with self._lock:
+            for record in records:
+                if record.fingerprint not in self._statements:
+                    self._statements[record.fingerprint] = (Histogram(DURATION_BUCKETS), Histogram(COUNT_BUCKETS))
+                duration, rows = self._statements[record.fingerprint]
+                duration.observe(record.seconds)
+                rows.observe(record.rows)
+            if route not in self._routes:
+                self._routes[route] = (Histogram(COUNT_BUCKETS), Histogram(DURATION_BUCKETS))
+            count, duration = self._routes[route]
+            count.observe(len(records))
+            duration.observe(total)
+
+        response.headers.add("Server-Timing", f'sql;dur={total * 1000:.2f};desc="{len(records)} statements"')
+        return response
@@ -8,6 +8,9 @@ from flask_login import UserMixin
 
 class User(UserMixin):
     """User model compatible with Flask-Login."""
+
+    # Fields that are safe to keep in the signed session cookie
+    IDENTITY_FIELDS = ("id", "username", "first_name", "last_name")
     
     def __init__(self, id, username, first_name, last_name, password):
         self.id = id
@@ -15,23 +18,33 @@ class User(UserMixin):
         self.first_name = first_name
         self.last_name = last_name
         self.password = password
+
+    def identity(self):
+        """Return the non-sensitive fields identifying the user."""
+        return {field: getattr(self, field) for field in self.IDENTITY_FIELDS}
     
     @staticmethod
     def get(user_id):
-        """Get a user by ID from the database."""
+        """Get a user by ID, from the user cache if possible, otherwise from the database."""
+        user_cache = current_app.extensions['user_cache']
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+
         # Access sqlite from Flask app context to avoid circular import
         sqlite = current_app.extensions['sqlite3']
-        user_data = sqlite.query(
-            "SELECT * FROM Users WHERE id = ?;", 
-            user_id, 
+        user_data = sqlite.select(
+            "SELECT id, username, first_name, last_name, password FROM Users WHERE id = ?;",
+            user_id,
             one=True
         )
         if user_data:
-            return User(
-                user_data['id'],
-                user_data['username'],
-                user_data['first_name'],
-                user_data['last_name'],
-                user_data['password']
-            )
-        return None
\ No newline at end of file
+            user = User(*user_data)
+            user_cache.set(user_id, user)
+            return user
+        return None
+
+    @staticmethod
+    def invalidate(user_id):
+        """Remove a user from the user cache after their row was changed."""
+        current_app.extensions['user_cache'].pop(user_id)
@@ -0,0 +1,52 @@
+"""Provides keyset pagination cursors for the Social Insecurity application.
+
+A cursor encodes the (creation_time, id) key of the last row on a page.
+The next page is then read with a `(creation_time, id) < (?, ?)` range condition,
+which an index can seek to directly instead of skipping rows like OFFSET does.
+
+Example:
+    from social_insecurity.pagination import decode_cursor, encode_cursor
+
+    creation_time, row_id = decode_cursor(request.args.get("cursor"))
+    rows = sqlite.select(query, creation_time, row_id, page_size + 1, row=PostRow)
+    next_cursor = encode_cursor(rows[-2].creation_time, rows[-2].id) if len(rows) > page_size else None
+"""
+
+from __future__ import annotations
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from typing import Optional
+
+# Sorts after every stored key, so the first page uses the same query as the following ones
+FIRST_PAGE = ("9999-12-31 23:59:59", 2**63 - 1)
+
+
+def encode_cursor(creation_time: str, row_id: int) -> str:
+    """Encodes the key of the last row on a page into an opaque, URL-safe cursor."""
+    return urlsafe_b64encode(f"{creation_time}|{row_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> tuple[str, int]:
+    """Decodes a cursor into a (creation_time, id) key.
+
+    Missing or malformed cursors decode to FIRST_PAGE.
+    """
+    if not cursor:
+        return FIRST_PAGE
+    try:
+        creation_time, _, row_id = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().rpartition("|")
+        return creation_time, int(row_id)
+    except (Base64Error, UnicodeDecodeError, ValueError):
+        return FIRST_PAGE
+
+
+def split_page(rows: list, page_size: int) -> tuple[list, Optional[str]]:
+    """Splits rows fetched with a LIMIT of page_size + 1 into a page and the cursor for the next page.
+
+    The rows must have creation_time and id attributes, like the named tuples in rows.py.
+    """
+    if len(rows) <= page_size:
+        return rows, None
+    page = rows[:page_size]
+    return page, encode_cursor(page[-1].creation_time, page[-1].id)
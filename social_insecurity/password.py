@@ -1,12 +1,114 @@
 """Simple password hashing using Argon2id.
 
 Based on argon2-cffi documentation: https://argon2-cffi.readthedocs.io/en/stable/howto.html
+
+Hashing runs on a small, bounded pool of worker threads (argon2-cffi releases the GIL while hashing).
+This caps how many expensive hashes, and how much Argon2 memory, are in flight at once.
+When the pool and its queue are full, HasherBusyError is raised right away instead of queueing without bound.
+argon2 is imported by the first hash or verification, so workers that never see a login do not load it.
 """
 
-from argon2 import PasswordHasher
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from flask import Flask
+
+if TYPE_CHECKING:
+    from argon2 import PasswordHasher
+
+
+class HasherBusyError(RuntimeError):
+    """Raised when the password hashing pool cannot accept more work."""
+
+
+class Hasher:
+    """Runs Argon2 hashing and verification on a bounded worker pool.
+
+    Example:
+        hasher = Hasher()
+        hasher.init_app(app)
+        password_hash = hasher.hash("password")
+        hasher.verify("password", password_hash)
+    """
+
+    def __init__(self) -> None:
+        self._ph: Optional[PasswordHasher] = None
+        self._parameters: dict[str, int] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[threading.BoundedSemaphore] = None
+
+    def init_app(self, app: Flask) -> None:
+        """Configures the Argon2 parameters and the worker pool from the application config."""
+        self._ph = None
+        self._parameters = {
+            "time_cost": app.config["ARGON2_TIME_COST"],
+            "memory_cost": app.config["ARGON2_MEMORY_COST"],
+            "parallelism": app.config["ARGON2_PARALLELISM"],
+        }
+        workers = app.config["PASSWORD_HASH_WORKERS"]
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if workers:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="argon2")
+            self._slots = threading.BoundedSemaphore(workers + app.config["PASSWORD_HASH_QUEUE_DEPTH"])
+        else:
+            self._executor = self._slots = None
+
+    @property
+    def ph(self) -> PasswordHasher:
+        """Returns the Argon2 hasher, created with the configured parameters on first use."""
+        if self._ph is None:
+            from argon2 import PasswordHasher
+
+            self._ph = PasswordHasher(**self._parameters)
+        return self._ph
+
+    @ph.setter
+    def ph(self, ph: PasswordHasher) -> None:
+        self._ph = ph
+
+    def hash(self, password: str) -> str:
+        """Hashes a password on the worker pool."""
+        return self._run(self.ph.hash, password)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        """Verifies a password against a stored hash on the worker pool."""
+        from argon2.exceptions import InvalidHashError, VerificationError
+
+        try:
+            return self._run(self.ph.verify, password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Checks whether a hash was created with different parameters than the current ones."""
+        from argon2.exceptions import InvalidHashError
+
+        try:
+            return self.ph.check_needs_rehash(password_hash)
+        except InvalidHashError:
+            return True
+
+    def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs a function on the worker pool and waits for its result."""
+        if self._executor is None or self._slots is None:
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusyError("Password hashing pool is saturated")
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
 
 # Create a single instance
-ph = PasswordHasher()
+hasher = Hasher()
 
 
 def hash_password(password: str) -> str:
@@ -17,8 +119,11 @@ def hash_password(password: str) -> str:
         
     Returns:
         Hashed password string
+
+    Raises:
+        HasherBusyError: If the hashing pool is saturated
     """
-    return ph.hash(password)
+    return hasher.hash(password)
 
 
 def verify_password(password: str, password_hash: str) -> bool:
@@ -30,9 +135,20 @@ def verify_password(password: str, password_hash: str) -> bool:
         
     Returns:
         True if password matches, False otherwise
+
+    Raises:
+        HasherBusyError: If the hashing pool is saturated
+    """
+    return hasher.verify(password, password_hash)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """Check whether a stored hash should be upgraded to the current Argon2 parameters.
+    
+    Args:
+        password_hash: Stored hash from database
+        
+    Returns:
+        True if the hash should be replaced after a successful login, False otherwise
     """
-    try:
-        ph.verify(password_hash, password)
-        return True
-    except Exception:  # VerifyMismatchError or other exceptions
-        return False
\ No newline at end of file
+    return hasher.needs_rehash(password_hash)
@@ -0,0 +1,153 @@
+"""Provides a SQLite3 storage backend for Flask-Limiter.
+
+The default "memory://" storage keeps separate counters in every worker process,
+which multiplies the effective limits when the application runs with several workers.
+This backend keeps the counters in a SQLite3 database file shared by all workers on the host,
+without depending on an external service such as Redis.
+
+Importing this module registers the "sqlite" storage scheme with the limits package.
+
+Example:
+    from flask_limiter import Limiter
+    import social_insecurity.ratelimit  # noqa: F401
+
+    limiter = Limiter(key_func=get_remote_address, storage_uri="sqlite:////tmp/ratelimit.db")
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlparse
+
+from flask import Flask
+from limits.storage import Storage
+
+
+class SQLiteStorage(Storage):
+    """Provides fixed-window rate limit counters stored in a SQLite3 database.
+
+    Every counter update is a single atomic upsert, so concurrent workers never lose increments.
+    Expired windows are reset in place on their next hit, and removed in bulk by a periodic compaction.
+
+    The URI follows the SQLAlchemy convention: "sqlite:///relative.db" or "sqlite:////absolute.db".
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(
+        self,
+        uri: str,
+        wrap_exceptions: bool = False,
+        compaction_interval: float = 60.0,
+        busy_timeout: float = 5.0,
+        **options: Any,
+    ) -> None:
+        """Initializes the storage.
+
+        params:
+            uri: The storage URI, pointing to the database file.
+            wrap_exceptions: Whether to wrap storage errors in limits.errors.StorageError.
+            compaction_interval: The number of seconds between removals of expired windows.
+            busy_timeout: The number of seconds to wait for another worker's write lock.
+
+        """
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._path = urlparse(uri).path[1:] or ":memory:"
+        self._busy_timeout = busy_timeout
+        self._compaction_interval = compaction_interval
+        self._next_compaction = 0.0
+        self._local = threading.local()
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS RateLimits (key TEXT PRIMARY KEY, count INTEGER NOT NULL, expiry REAL NOT NULL) "
+            "WITHOUT ROWID;"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS RateLimitsByExpiry ON RateLimits(expiry);")
+
+    @property
+    def base_exceptions(self) -> type[Exception]:
+        return sqlite3.Error
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread, reconnecting after a fork."""
+        conn = getattr(self._local, "connection", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = NORMAL;")
+            self._local.connection = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def incr(self, key: str, expiry: float, elastic_expiry: bool = False, amount: int = 1) -> int:
+        """Increments the counter of a key, starting a new window if the current one has expired.
+
+        params:
+            key: The rate limit key.
+            expiry: The length of the window in seconds.
+            elastic_expiry: Whether every hit extends the window (limits < 4 only).
+            amount: The number to increment by.
+
+        returns: The counter value after the increment.
+
+        """
+        now = time.time()
+        if now >= self._next_compaction:
+            self._next_compaction = now + self._compaction_interval
+            self._connection.execute("DELETE FROM RateLimits WHERE expiry <= ?;", (now,))
+
+        increment = """
+            INSERT INTO RateLimits (key, count, expiry)
+            VALUES (:key, :amount, :expiry)
+            ON CONFLICT (key) DO UPDATE SET
+              count = CASE WHEN expiry <= :now THEN excluded.count ELSE count + excluded.count END,
+              expiry = CASE WHEN expiry <= :now OR :elastic THEN excluded.expiry ELSE expiry END
+            RETURNING count;
+            """
+        params = {"key": key, "amount": amount, "expiry": now + expiry, "now": now, "elastic": elastic_expiry}
+        return self._connection.execute(increment, params).fetchone()[0]
+
+    def get(self, key: str) -> int:
+        """Returns the counter of a key, or 0 if its window has expired."""
+        row = self._connection.execute(
+            "SELECT count FROM RateLimits WHERE key = ? AND expiry > ?;", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        """Returns the time at which the window of a key expires."""
+        now = time.time()
+        row = self._connection.execute(
+            "SELECT expiry FROM RateLimits WHERE key = ? AND expiry > ?;", (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def check(self) -> bool:
+        """Checks that the database can be queried."""
+        try:
+            self._connection.execute("SELECT 1;").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int:
+        """Removes all counters and returns how many there were."""
+        return self._connection.execute("DELETE FROM RateLimits;").rowcount
+
+    def clear(self, key: str) -> None:
+        """Removes the counter of a key."""
+        self._connection.execute("DELETE FROM RateLimits WHERE key = ?;", (key,))
+
+
+def resolve_storage_uri(app: Flask) -> None:
+    """Makes a relative "sqlite:///" RATELIMIT_STORAGE_URI relative to the instance folder."""
+    uri = app.config.get("RATELIMIT_STORAGE_URI", "")
+    if uri.startswith("sqlite:///") and not uri.startswith("sqlite:////"):
+        path = Path(app.instance_path) / uri[len("sqlite:///") :]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        app.config["RATELIMIT_STORAGE_URI"] = f"sqlite:///{path}"
@@ -4,17 +4,34 @@ This file contains the routes for the application. It is imported by the social_
 It also contains the SQL queries used for communicating with the database.
 """
 
+import json
+import mimetypes
+import os
 from pathlib import Path
+from sqlite3 import IntegrityError
+from typing import Optional
 
 from flask import current_app as app
-from flask import flash, redirect, render_template, send_from_directory, url_for
+from flask import abort, flash, redirect, render_template, request, send_file, session, url_for
 from flask_login import login_user, logout_user, login_required, current_user
 from markupsafe import escape
-
-from social_insecurity import sqlite, limiter
-from social_insecurity.password import hash_password, verify_password
-from social_insecurity.forms import CommentsForm, FriendsForm, IndexForm, PostForm, ProfileForm
+from werkzeug.security import safe_join
+
+from social_insecurity import events, friend_graph, limiter, search, sqlite, thumbnails, timeline, writes
+from social_insecurity.etags import conditional
+from social_insecurity.pagination import decode_cursor, split_page
+from social_insecurity.rows import CommentRow, FriendRow, PostHeader, PostRow, ProfileRow
+from social_insecurity.password import HasherBusyError, hash_password, needs_rehash, verify_password
+from social_insecurity.forms import CommentsForm, FriendsForm, IndexForm, PostForm, ProfileForm, SearchForm
 from social_insecurity.models import User
+from social_insecurity.uploads import (
+    is_content_addressed,
+    register_upload,
+    save_upload,
+    upload_etag,
+    upload_folder,
+    upload_path,
+)
 
 @app.route("/", methods=["GET", "POST"])
 @app.route("/index", methods=["GET", "POST"])
@@ -33,11 +50,11 @@ def index():
 
     if login_form.is_submitted() and login_form.submit.data:
         get_user = """
-            SELECT *
+            SELECT id, username, first_name, last_name, password
             FROM Users
             WHERE username = ?;
             """
-        user = sqlite.query(get_user, login_form.username.data, one=True)
+        user = sqlite.select(get_user, login_form.username.data, one=True)
 
         if user is None:
             flash("Sorry, username or password is not correct.", category="warning")
@@ -45,14 +62,25 @@ def index():
             flash("Sorry, username or password is not correct.", category="warning")
         else:
             # Create User object and log them in
-            user_obj = User(
-                user['id'],
-                user['username'],
-                user['first_name'],
-                user['last_name'],
-                user['password']
-            )
+            user_obj = User(*user)
+            if needs_rehash(user["password"]):
+                # Upgrade the stored hash to the current Argon2 parameters while the password is at hand
+                update_password = """
+                    UPDATE Users
+                    SET password = ?
+                    WHERE id = ?;
+                    """
+                try:
+                    upgraded_password = hash_password(login_form.password.data)
+                except HasherBusyError:
+                    pass  # Try again on a later login rather than failing this one
+                else:
+                    with sqlite.transaction():
+                        sqlite.query(update_password, upgraded_password, user["id"])
+                    User.invalidate(user["id"])
             login_user(user_obj, remember=login_form.remember_me.data)
+            if app.config["USER_SESSION_IDENTITY"]:
+                session["identity"] = user_obj.identity()
             flash("Login successful!", category="success")
             return redirect(url_for("stream", username=user['username']))
 
@@ -64,13 +92,18 @@ def index():
             INSERT INTO Users (username, first_name, last_name, password)
             VALUES (?, ?, ?, ?);
             """
-        sqlite.query(insert_user, 
-                    register_form.username.data, 
-                    register_form.first_name.data, 
-                    register_form.last_name.data, 
-                    hashed_password)
-        flash("User successfully created!", category="success")
-        return redirect(url_for("index"))
+        try:
+            with sqlite.transaction():
+                sqlite.query(insert_user, 
+                            register_form.username.data, 
+                            register_form.first_name.data, 
+                            register_form.last_name.data, 
+                            hashed_password)
+        except IntegrityError:
+            flash("Sorry, that username is already taken.", category="warning")
+        else:
+            flash("User successfully created!", category="success")
+            return redirect(url_for("index"))
 
     return render_template("index.html.j2", title="Welcome", form=index_form)
 
@@ -79,18 +112,138 @@ def index():
 def logout():
     """Log out the current user."""
     logout_user()
+    session.pop("identity", None)
     flash("You have been logged out.", category="success")
     return redirect(url_for("index"))
 
+
+def get_stream_page(user_id: int, cursor: Optional[str]) -> tuple[list[PostRow], Optional[str]]:
+    """Returns a page of posts from a user and their friends, newest first, and the cursor of the next page."""
+    get_posts = """
+         SELECT p.id, p.u_id, u.username, u.first_name, u.last_name, p.content, p.image, p.creation_time,
+                p.comment_count
+         FROM Posts AS p JOIN Users AS u ON u.id = p.u_id
+         WHERE p.u_id IN (SELECT value FROM json_each(?))
+           AND (p.creation_time, p.id) < (?, ?)
+         ORDER BY p.creation_time DESC, p.id DESC
+         LIMIT ?;
+        """
+    get_timeline = """
+         SELECT p.id, p.u_id, u.username, u.first_name, u.last_name, p.content, p.image, p.creation_time,
+                p.comment_count
+         FROM Timeline AS t JOIN Posts AS p ON p.id = t.post_id JOIN Users AS u ON u.id = p.u_id
+         WHERE t.owner_id = ? AND (t.creation_time, t.post_id) < (?, ?)
+         ORDER BY t.creation_time DESC, t.post_id DESC
+         LIMIT ?;
+        """
+    page_size = app.config["STREAM_PAGE_SIZE"]
+    creation_time, post_id = decode_cursor(cursor)
+    if app.config["TIMELINE_ENABLED"]:
+        rows = sqlite.select(get_timeline, user_id, creation_time, post_id, page_size + 1, row=PostRow)
+    else:
+        authors = json.dumps(sorted(friend_graph.visible_authors(user_id)))
+        rows = sqlite.select(get_posts, authors, creation_time, post_id, page_size + 1, row=PostRow)
+    return split_page(rows, page_size)
+
+
+def get_post_and_comments(
+    post_id: int, cursor: Optional[str]
+) -> tuple[Optional[PostHeader], list[CommentRow], Optional[str]]:
+    """Returns a post, a page of its comments, newest first, and the cursor of the next page.
+
+    The post header and the comments are read with a single query, the comments are aggregated into a JSON array.
+    The post is None if it does not exist.
+    """
+    get_post = """
+        SELECT p.id, u.username, p.content, p.image, p.creation_time,
+               (SELECT json_group_array(json_array(c.id, c.p_id, c.u_id, c.username, c.comment, c.creation_time))
+                FROM (SELECT c.id, c.p_id, c.u_id, cu.username, c.comment, c.creation_time
+                      FROM Comments AS c JOIN Users AS cu ON cu.id = c.u_id
+                      WHERE c.p_id = p.id AND (c.creation_time, c.id) < (?, ?)
+                      ORDER BY c.creation_time DESC, c.id DESC
+                      LIMIT ?) AS c) AS comments
+        FROM Posts AS p JOIN Users AS u ON u.id = p.u_id
+        WHERE p.id = ?;
+        """
+    page_size = app.config["COMMENTS_PAGE_SIZE"]
+    creation_time, comment_id = decode_cursor(cursor)
+    post = sqlite.select(get_post, creation_time, comment_id, page_size + 1, post_id, one=True)
+    if post is None:
+        return None, [], None
+    *header, comments = post
+    comments, next_cursor = split_page(list(map(CommentRow._make, json.loads(comments))), page_size)
+    return PostHeader(*header), comments, next_cursor
+
+
+def write_post(user_id: int, content: Optional[str], image: Optional[str]) -> int:
+    """Inserts a post and pushes it into the timelines, returns its id. Runs through writes.submit()."""
+    insert_post = """
+        INSERT INTO Posts (u_id, content, image, creation_time)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP);
+        """
+    with sqlite.transaction():
+        if image:
+            register_upload(image)
+        post_id = sqlite.insert(insert_post, user_id, content, image)
+        if app.config["TIMELINE_ENABLED"]:
+            timeline.fan_out_post(post_id)
+    return post_id
+
+
+def write_comment(post_id: int, user_id: int, comment: Optional[str]) -> int:
+    """Inserts a comment, returns its id. Runs through writes.submit()."""
+    insert_comment = """
+        INSERT INTO Comments (p_id, u_id, comment, creation_time)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP);
+        """
+    with sqlite.transaction():
+        return sqlite.insert(insert_comment, post_id, user_id, comment)
+
+
+def stream_version(username: str):
+    """Returns the version stamp of the stream page, the ids and comment counts of the posts on it.
+
+    They are read with the page's own keyset lookup, but without the authors' names or the post contents,
+    so the stamp costs less than the page. It changes with a new post the user can see, a comment on a post
+    on the page or a new friendship, activity elsewhere does not invalidate the page.
+    """
+    get_posts = """
+         SELECT p.id, p.comment_count
+         FROM Posts AS p
+         WHERE p.u_id IN (SELECT value FROM json_each(?))
+           AND (p.creation_time, p.id) < (?, ?)
+         ORDER BY p.creation_time DESC, p.id DESC
+         LIMIT ?;
+        """
+    get_timeline = """
+         SELECT p.id, p.comment_count
+         FROM Timeline AS t JOIN Posts AS p ON p.id = t.post_id
+         WHERE t.owner_id = ? AND (t.creation_time, t.post_id) < (?, ?)
+         ORDER BY t.creation_time DESC, t.post_id DESC
+         LIMIT ?;
+        """
+    page_size = app.config["STREAM_PAGE_SIZE"]
+    creation_time, post_id = decode_cursor(request.args.get("cursor"))
+    if app.config["TIMELINE_ENABLED"]:
+        return tuple(map(tuple, sqlite.select(get_timeline, current_user.id, creation_time, post_id, page_size + 1)))
+    visible_authors = friend_graph.visible_authors(current_user.id)
+    authors = json.dumps(sorted(visible_authors))
+    rows = sqlite.select(get_posts, authors, creation_time, post_id, page_size + 1)
+    # The friend graph can lag behind Friends in other workers, so the authors it returned are part of the stamp
+    return (*map(tuple, rows), hash(visible_authors))
+
+
 @app.route("/stream/<string:username>", methods=["GET", "POST"])
 @login_required
+@conditional(stream_version)
 def stream(username: str):
     """
     Provides the stream page for the application.
 
     If a form was submitted, it reads the form data and inserts a new post into the database.
 
-    Otherwise, it reads the username from the URL and displays all posts from the user and their friends.
+    Otherwise, it reads the username from the URL and displays posts from the user and their friends,
+    newest first, one page at a time. The `cursor` query parameter selects the page after a previous one.
     """
     # Verify authenticated user matches requested username
     if current_user.username != username:
@@ -100,40 +253,44 @@ def stream(username: str):
     post_form = PostForm()
 
     if post_form.is_submitted():
-        if post_form.image.data:
-            path = Path(app.instance_path) / app.config["UPLOADS_FOLDER_PATH"] / post_form.image.data.filename
-            post_form.image.data.save(path)
+        # Stream the upload to disk before taking the write lock
+        image = save_upload(post_form.image.data) if post_form.image.data else None
 
-        insert_post = """
-            INSERT INTO Posts (u_id, content, image, creation_time)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP);
-            """
-        image_filename = post_form.image.data.filename if post_form.image.data else None
         # Sanitize user input to prevent XSS
         sanitized_content = escape(post_form.content.data) if post_form.content.data else None
         # Use current_user.id instead of querying user again
-        sqlite.query(insert_post, current_user.id, sanitized_content, image_filename)
+        post_id = writes.submit(write_post, current_user.id, sanitized_content, image)
+        events.publish("post", post_id)
+        if image:
+            thumbnails.submit(image)
         return redirect(url_for("stream", username=username))
 
-    get_posts = """
-         SELECT p.*, u.*, (SELECT COUNT(*) FROM Comments WHERE p_id = p.id) AS cc
-         FROM Posts AS p JOIN Users AS u ON u.id = p.u_id
-         WHERE p.u_id IN (SELECT u_id FROM Friends WHERE f_id = ?) OR p.u_id IN (SELECT f_id FROM Friends WHERE u_id = ?) OR p.u_id = ?
-         ORDER BY p.creation_time DESC;
+    posts, next_cursor = get_stream_page(current_user.id, request.args.get("cursor"))
+    return render_template(
+        "stream.html.j2", title="Stream", username=username, form=post_form, posts=posts, next_cursor=next_cursor
+    )
+
+
+def comments_version(username: str, post_id: int):
+    """Returns the version stamp of a comments page, it changes with every new comment on the post."""
+    get_version = """
+        SELECT comment_count
+        FROM Posts
+        WHERE id = ?;
         """
-    # Use current_user.id instead of querying user again
-    posts = sqlite.query(get_posts, current_user.id, current_user.id, current_user.id)
-    return render_template("stream.html.j2", title="Stream", username=username, form=post_form, posts=posts)
+    return sqlite.select(get_version, post_id, one=True) or ()
 
 
 @app.route("/comments/<string:username>/<int:post_id>", methods=["GET", "POST"])
 @login_required
+@conditional(comments_version)
 def comments(username: str, post_id: int):
     """Provides the comments page for the application.
 
     If a form was submitted, it reads the form data and inserts a new comment into the database.
 
-    Otherwise, it reads the username and post id from the URL and displays all comments for the post.
+    Otherwise, it reads the username and post id from the URL and displays the comments on the post,
+    newest first, one page at a time. The `cursor` query parameter selects the page after a previous one.
     """
     # Verify authenticated user matches requested username
     if current_user.username != username:
@@ -143,35 +300,39 @@ def comments(username: str, post_id: int):
     comments_form = CommentsForm()
 
     if comments_form.is_submitted():
-        insert_comment = """
-            INSERT INTO Comments (p_id, u_id, comment, creation_time)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP);
-            """
         # Sanitize user input to prevent XSS
         sanitized_comment = escape(comments_form.comment.data) if comments_form.comment.data else None
         # Use current_user.id instead of querying user again
-        sqlite.query(insert_comment, post_id, current_user.id, sanitized_comment)
+        comment_id = writes.submit(write_comment, post_id, current_user.id, sanitized_comment)
+        events.publish("comment", comment_id)
 
-    get_post = """
-        SELECT *
-        FROM Posts AS p JOIN Users AS u ON p.u_id = u.id
-        WHERE p.id = ?;
-        """
-    get_comments = """
-        SELECT DISTINCT *
-        FROM Comments AS c JOIN Users AS u ON c.u_id = u.id
-        WHERE c.p_id = ?
-        ORDER BY c.creation_time DESC;
-        """
-    post = sqlite.query(get_post, post_id, one=True)
-    comments = sqlite.query(get_comments, post_id)
+    post, comments, next_cursor = get_post_and_comments(post_id, request.args.get("cursor"))
     return render_template(
-        "comments.html.j2", title="Comments", username=username, form=comments_form, post=post, comments=comments
+        "comments.html.j2",
+        title="Comments",
+        username=username,
+        form=comments_form,
+        post=post,
+        comments=comments,
+        next_cursor=next_cursor,
     )
 
 
+def friends_version(username: str):
+    """Returns the version stamp of the friends page, it changes with every new friendship.
+
+    Any friendship can change the suggested friends of friends, not only the user's own.
+    """
+    get_version = """
+        SELECT MAX(rowid)
+        FROM Friends;
+        """
+    return sqlite.select(get_version, one=True)
+
+
 @app.route("/friends/<string:username>", methods=["GET", "POST"])
 @login_required
+@conditional(friends_version)
 def friends(username: str):
     """Provides the friends page for the application.
 
@@ -188,46 +349,108 @@ def friends(username: str):
 
     if friends_form.is_submitted():
         get_friend = """
-            SELECT *
+            SELECT id
             FROM Users
             WHERE username = ?;
             """
-        friend = sqlite.query(get_friend, friends_form.username.data, one=True)
-        get_friends = """
-            SELECT f_id
-            FROM Friends
-            WHERE u_id = ?;
-            """
-        # Use current_user.id instead of querying user again
-        existing_friends = sqlite.query(get_friends, current_user.id)
+        friend = sqlite.select(get_friend, friends_form.username.data, one=True)
 
         if friend is None:
             flash("User does not exist!", category="warning")
         elif friend["id"] == current_user.id:
             flash("You cannot be friends with yourself!", category="warning")
-        elif friend["id"] in [f["f_id"] for f in existing_friends]:
+        elif friend_graph.is_friend(current_user.id, friend["id"]):
             flash("You are already friends with this user!", category="warning")
         else:
             insert_friend = """
-                INSERT INTO Friends (u_id, f_id)
-                VALUES (?, ?);
+                INSERT OR IGNORE INTO Friends (u_id, f_id)
+                VALUES (?, ?)
+                RETURNING u_id;
                 """
-            # Use current_user.id instead of querying user again
-            sqlite.query(insert_friend, current_user.id, friend["id"])
-            flash("Friend successfully added!", category="success")
+            # The friend graph can lag behind friendships added in other workers, the table decides
+            # An ignored insert returns no row
+            with sqlite.transaction():
+                added = sqlite.query(insert_friend, current_user.id, friend["id"], one=True) is not None
+                if added and app.config["TIMELINE_ENABLED"]:
+                    timeline.backfill_friendship(current_user.id, friend["id"])
+            friend_graph.add(current_user.id, friend["id"])
+            if added:
+                flash("Friend successfully added!", category="success")
+            else:
+                flash("You are already friends with this user!", category="warning")
 
     get_friends = """
-        SELECT *
+        SELECT u.id, u.username
         FROM Friends AS f JOIN Users as u ON f.f_id = u.id
         WHERE f.u_id = ? AND f.f_id != ?;
         """
     # Use current_user.id instead of querying user again
-    friends = sqlite.query(get_friends, current_user.id, current_user.id)
-    return render_template("friends.html.j2", title="Friends", username=username, friends=friends, form=friends_form)
+    friends = sqlite.select(get_friends, current_user.id, current_user.id, row=FriendRow)
+
+    get_suggested = """
+        SELECT id, username
+        FROM Users
+        WHERE id IN (SELECT value FROM json_each(?));
+        """
+    mutuals = dict(friend_graph.suggestions(current_user.id, app.config["FRIEND_SUGGESTIONS"]))
+    suggested = sorted(
+        sqlite.select(get_suggested, json.dumps(list(mutuals)), row=FriendRow), key=lambda user: -mutuals[user.id]
+    )
+    return render_template(
+        "friends.html.j2",
+        title="Friends",
+        username=username,
+        friends=friends,
+        suggested=suggested,
+        mutuals=mutuals,
+        form=friends_form,
+    )
+
+
+@app.route("/search/<string:username>", methods=["GET"])
+@login_required
+def search_page(username: str):
+    """Provides the search page for the application.
+
+    It reads the search text from the query string and displays the best matching posts, comments and users.
+    Only posts and comments the user could see in their stream are included.
+    """
+    # Verify authenticated user matches requested username
+    if current_user.username != username:
+        return redirect(url_for("search_page", username=current_user.username, **request.args))
+
+    search_form = SearchForm(formdata=request.args)
+    text = search_form.q.data or ""
+    limit = app.config["SEARCH_RESULTS_LIMIT"]
+
+    posts = search.search_posts(current_user.id, text, limit)
+    comments = search.search_comments(current_user.id, text, limit)
+    users = search.search_users(text, limit)
+    return render_template(
+        "search.html.j2",
+        title="Search",
+        username=username,
+        form=search_form,
+        text=text,
+        posts=posts,
+        comments=comments,
+        users=users,
+    )
+
+
+def profile_version(username: str):
+    """Returns the version stamp of a profile page, it changes whenever the profile is updated."""
+    get_version = """
+        SELECT version
+        FROM Users
+        WHERE username = ?;
+        """
+    return sqlite.select(get_version, username, one=True) or ()
 
 
 @app.route("/profile/<string:username>", methods=["GET", "POST"])
 @login_required
+@conditional(profile_version)
 def profile(username: str):
     """Provides the profile page for the application.
 
@@ -242,11 +465,11 @@ def profile(username: str):
 
     profile_form = ProfileForm()
     get_user = """
-        SELECT *
+        SELECT id, username, first_name, last_name, education, employment, music, movie, nationality, birthday
         FROM Users
         WHERE username = ?;
         """
-    user = sqlite.query(get_user, username, one=True)
+    user = sqlite.select(get_user, username, one=True, row=ProfileRow)
 
     if profile_form.is_submitted():
         # Double-check authorization before allowing update
@@ -256,20 +479,22 @@ def profile(username: str):
 
         update_profile = """
             UPDATE Users
-            SET education=?, employment=?, music=?, movie=?, nationality=?, birthday=?
+            SET education=?, employment=?, music=?, movie=?, nationality=?, birthday=?, version=version + 1
             WHERE username=?;
             """
         # Sanitize user input to prevent XSS
-        sqlite.query(
-            update_profile,
-            escape(profile_form.education.data) if profile_form.education.data else None,
-            escape(profile_form.employment.data) if profile_form.employment.data else None,
-            escape(profile_form.music.data) if profile_form.music.data else None,
-            escape(profile_form.movie.data) if profile_form.movie.data else None,
-            escape(profile_form.nationality.data) if profile_form.nationality.data else None,
-            profile_form.birthday.data, 
-            username
-        )
+        with sqlite.transaction():
+            sqlite.query(
+                update_profile,
+                escape(profile_form.education.data) if profile_form.education.data else None,
+                escape(profile_form.employment.data) if profile_form.employment.data else None,
+                escape(profile_form.music.data) if profile_form.music.data else None,
+                escape(profile_form.movie.data) if profile_form.movie.data else None,
+                escape(profile_form.nationality.data) if profile_form.nationality.data else None,
+                profile_form.birthday.data, 
+                username
+            )
+        User.invalidate(current_user.id)
         flash("Profile updated successfully!", category="success")
         return redirect(url_for("profile", username=username))
 
@@ -278,5 +503,34 @@ def profile(username: str):
 
 @app.route("/uploads/<string:filename>")
 def uploads(filename):
-    """Provides an endpoint for serving uploaded files."""
-    return send_from_directory(Path(app.instance_path) / app.config["UPLOADS_FOLDER_PATH"], filename)
+    """Provides an endpoint for serving uploaded files.
+
+    Files are served with a strong ETag derived from their content, and answer conditional and range requests.
+    Content-addressed files never change, so they are also marked as immutable and cached for UPLOADS_MAX_AGE.
+
+    If UPLOADS_ACCEL_REDIRECT_PREFIX is set, only the headers are produced here and
+    the X-Accel-Redirect header tells the front proxy (nginx) to send the file itself.
+    For proxies understanding X-Sendfile, set Flask's USE_X_SENDFILE instead.
+    """
+    path = safe_join(str(upload_folder()), upload_path(filename))
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    etag = upload_etag(filename, Path(path))
+    max_age = app.config["UPLOADS_MAX_AGE"] if is_content_addressed(filename) else None
+    accel_redirect_prefix = app.config["UPLOADS_ACCEL_REDIRECT_PREFIX"]
+
+    if accel_redirect_prefix:
+        response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+        response.headers["X-Accel-Redirect"] = accel_redirect_prefix.rstrip("/") + "/" + upload_path(filename)
+        response.set_etag(etag)
+        if max_age is not None:
+            response.cache_control.max_age = max_age
+        response = response.make_conditional(request)
+    else:
+        response = send_file(path, etag=etag, max_age=max_age, conditional=True)
+
+    if max_age is not None:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
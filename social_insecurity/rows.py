@@ -0,0 +1,73 @@
+"""Provides the row classes of the Social Insecurity application.
+
+Each query selects exactly the columns of its row class, in order, and SQLite3.select() builds
+the rows as instances of the class when it is passed as `row`. Named tuples hold their values
+without a per-row dict or column lookup, and only carry what a page shows, never a password hash.
+
+Example:
+    from social_insecurity.rows import FriendRow
+
+    friends = sqlite.select("SELECT u.id, u.username FROM Users AS u WHERE u.id = ?;", 1, row=FriendRow)
+    friends[0].username
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple, Optional
+
+
+class PostRow(NamedTuple):
+    """A post in the stream, with its author."""
+
+    id: int
+    u_id: int
+    username: str
+    first_name: Optional[str]
+    last_name: Optional[str]
+    content: Optional[str]
+    image: Optional[str]
+    creation_time: str
+    comment_count: int
+
+
+class PostHeader(NamedTuple):
+    """The post shown above its comments."""
+
+    id: int
+    username: str
+    content: Optional[str]
+    image: Optional[str]
+    creation_time: str
+
+
+class CommentRow(NamedTuple):
+    """A comment on a post, with its author."""
+
+    id: int
+    p_id: int
+    u_id: int
+    username: str
+    comment: Optional[str]
+    creation_time: str
+
+
+class FriendRow(NamedTuple):
+    """A user in a list of friends or suggested friends."""
+
+    id: int
+    username: str
+
+
+class ProfileRow(NamedTuple):
+    """The public profile of a user."""
+
+    id: int
+    username: str
+    first_name: Optional[str]
+    last_name: Optional[str]
+    education: Optional[str]
+    employment: Optional[str]
+    music: Optional[str]
+    movie: Optional[str]
+    nationality: Optional[str]
+    birthday: Optional[str]
@@ -4,7 +4,7 @@
 
 CREATE TABLE [Users] (
   id INTEGER PRIMARY KEY,
-  username VARCHAR,
+  username VARCHAR UNIQUE,
   first_name VARCHAR,
   last_name VARCHAR,
   [password] VARCHAR,
@@ -13,15 +13,24 @@ CREATE TABLE [Users] (
   music VARCHAR DEFAULT 'Unknown',
   movie VARCHAR DEFAULT 'Unknown',
   nationality VARCHAR DEFAULT 'Unknown',
-  birthday DATE DEFAULT 'Unknown'
+  birthday DATE DEFAULT 'Unknown',
+  version INTEGER NOT NULL DEFAULT 0  -- Incremented on every profile update, used for ETags
+);
+
+-- Content-addressed uploads, ref_count is maintained by the Posts triggers below
+CREATE TABLE [Uploads](
+  name VARCHAR PRIMARY KEY,  -- SHA-256 of the content plus the file extension
+  size INTEGER NOT NULL,
+  ref_count INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE TABLE [Posts](
   id INTEGER PRIMARY KEY,
   u_id INTEGER,
   content INTEGER,
-  [image] VARCHAR,
+  [image] VARCHAR REFERENCES Uploads,
   [creation_time] DATETIME,
+  comment_count INTEGER NOT NULL DEFAULT 0,  -- Maintained by the Comments triggers below
   FOREIGN KEY (u_id) REFERENCES [Users](id)
 );
 
@@ -43,6 +52,118 @@ CREATE TABLE [Comments](
   FOREIGN KEY (u_id) REFERENCES Users(id)
 );
 
+-- Materialized home timelines, only written when TIMELINE_ENABLED is set
+CREATE TABLE [Timeline](
+  owner_id INTEGER NOT NULL REFERENCES Users,
+  post_id INTEGER NOT NULL REFERENCES Posts,
+  [creation_time] DATETIME,
+  PRIMARY KEY(owner_id, creation_time, post_id),
+  FOREIGN KEY (owner_id) REFERENCES [Users](id),
+  FOREIGN KEY (post_id) REFERENCES [Posts](id)
+) WITHOUT ROWID;
+
+-- Full-text search indexes over the text columns, kept in sync by the triggers below
+CREATE VIRTUAL TABLE [PostsSearch] USING fts5(content, content='Posts', content_rowid='id', tokenize='porter unicode61');
+
+CREATE VIRTUAL TABLE [CommentsSearch] USING fts5(comment, content='Comments', content_rowid='id', tokenize='porter unicode61');
+
+CREATE VIRTUAL TABLE [UsersSearch] USING fts5(username, first_name, last_name, content='Users', content_rowid='id', prefix='2 3');
+
+-- --
+-- Create indexes
+-- --
+
+-- Stream: posts by author, already in feed order
+CREATE INDEX [PostsByUser] ON [Posts](u_id, creation_time, id);
+
+-- Comment counts and the comments page: comments by post, already in page order
+CREATE INDEX [CommentsByPost] ON [Comments](p_id, creation_time, id);
+
+-- Stream: reverse friendships (the primary key covers the forward direction)
+CREATE INDEX [FriendsByFriend] ON [Friends](f_id, u_id);
+
+-- gc-uploads: only the uploads no post references
+CREATE INDEX [UnreferencedUploads] ON [Uploads](ref_count) WHERE ref_count <= 0;
+
+-- --
+-- Create triggers
+-- --
+
+-- Keep Posts.comment_count in sync, 'flask repair-counters' recomputes it from scratch
+CREATE TRIGGER [CommentsCountInsert] AFTER INSERT ON [Comments]
+BEGIN
+  UPDATE Posts SET comment_count = comment_count + 1 WHERE id = NEW.p_id;
+END;
+
+CREATE TRIGGER [CommentsCountDelete] AFTER DELETE ON [Comments]
+BEGIN
+  UPDATE Posts SET comment_count = comment_count - 1 WHERE id = OLD.p_id;
+END;
+
+-- Count the posts referencing each upload, 'flask gc-uploads' removes the unreferenced ones
+CREATE TRIGGER [PostsImageInsert] AFTER INSERT ON [Posts] WHEN NEW.image IS NOT NULL
+BEGIN
+  UPDATE Uploads SET ref_count = ref_count + 1 WHERE name = NEW.image;
+END;
+
+CREATE TRIGGER [PostsImageDelete] AFTER DELETE ON [Posts] WHEN OLD.image IS NOT NULL
+BEGIN
+  UPDATE Uploads SET ref_count = ref_count - 1 WHERE name = OLD.image;
+END;
+
+-- Keep the full-text search indexes in sync, 'flask rebuild-search' rebuilds them from scratch
+CREATE TRIGGER [PostsSearchInsert] AFTER INSERT ON [Posts]
+BEGIN
+  INSERT INTO PostsSearch (rowid, content) VALUES (NEW.id, NEW.content);
+END;
+
+CREATE TRIGGER [PostsSearchDelete] AFTER DELETE ON [Posts]
+BEGIN
+  INSERT INTO PostsSearch (PostsSearch, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+END;
+
+CREATE TRIGGER [PostsSearchUpdate] AFTER UPDATE OF content ON [Posts]
+BEGIN
+  INSERT INTO PostsSearch (PostsSearch, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+  INSERT INTO PostsSearch (rowid, content) VALUES (NEW.id, NEW.content);
+END;
+
+CREATE TRIGGER [CommentsSearchInsert] AFTER INSERT ON [Comments]
+BEGIN
+  INSERT INTO CommentsSearch (rowid, comment) VALUES (NEW.id, NEW.comment);
+END;
+
+CREATE TRIGGER [CommentsSearchDelete] AFTER DELETE ON [Comments]
+BEGIN
+  INSERT INTO CommentsSearch (CommentsSearch, rowid, comment) VALUES ('delete', OLD.id, OLD.comment);
+END;
+
+CREATE TRIGGER [CommentsSearchUpdate] AFTER UPDATE OF comment ON [Comments]
+BEGIN
+  INSERT INTO CommentsSearch (CommentsSearch, rowid, comment) VALUES ('delete', OLD.id, OLD.comment);
+  INSERT INTO CommentsSearch (rowid, comment) VALUES (NEW.id, NEW.comment);
+END;
+
+CREATE TRIGGER [UsersSearchInsert] AFTER INSERT ON [Users]
+BEGIN
+  INSERT INTO UsersSearch (rowid, username, first_name, last_name)
+  VALUES (NEW.id, NEW.username, NEW.first_name, NEW.last_name);
+END;
+
+CREATE TRIGGER [UsersSearchDelete] AFTER DELETE ON [Users]
+BEGIN
+  INSERT INTO UsersSearch (UsersSearch, rowid, username, first_name, last_name)
+  VALUES ('delete', OLD.id, OLD.username, OLD.first_name, OLD.last_name);
+END;
+
+CREATE TRIGGER [UsersSearchUpdate] AFTER UPDATE OF username, first_name, last_name ON [Users]
+BEGIN
+  INSERT INTO UsersSearch (UsersSearch, rowid, username, first_name, last_name)
+  VALUES ('delete', OLD.id, OLD.username, OLD.first_name, OLD.last_name);
+  INSERT INTO UsersSearch (rowid, username, first_name, last_name)
+  VALUES (NEW.id, NEW.username, NEW.first_name, NEW.last_name);
+END;
+
 -- --
 -- Populate tables with test data
 -- --
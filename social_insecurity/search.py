@@ -0,0 +1,82 @@
+"""Provides full-text search over posts, comments and users for the Social Insecurity application.
+
+The searches run against the FTS5 tables in schema.sql, which triggers keep in sync with
+Posts, Comments and Users. Results are ranked with bm25, and posts and comments are
+only returned if the searching user can see them in their stream: their own and their friends'.
+
+Example:
+    from social_insecurity.search import search_posts
+
+    posts = search_posts(current_user.id, "holiday pictures")
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from flask import current_app
+
+# Tables rebuilt by 'flask rebuild-search'
+SEARCH_TABLES = ("PostsSearch", "CommentsSearch", "UsersSearch")
+
+
+def match_query(text: str, prefix: bool = False) -> str:
+    """Turns user input into an FTS5 query matching all of its words.
+
+    Every word is quoted, so FTS5 operators and syntax in the input are searched for literally.
+    With prefix set, the last word also matches longer words, for search-as-you-type.
+    """
+    terms = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if prefix and terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_posts(user_id: int, text: str, limit: int = 20) -> list[Any]:
+    """Returns the best matching posts visible to a user."""
+    sqlite = current_app.extensions["sqlite3"]
+    query = match_query(text)
+    if not query:
+        return []
+    get_posts = """
+        SELECT p.id, p.content, p.creation_time, u.username
+        FROM PostsSearch AS s JOIN Posts AS p ON p.id = s.rowid JOIN Users AS u ON u.id = p.u_id
+        WHERE PostsSearch MATCH ?
+          AND (p.u_id = ? OR p.u_id IN (SELECT f_id FROM Friends WHERE u_id = ?) OR p.u_id IN (SELECT u_id FROM Friends WHERE f_id = ?))
+        ORDER BY bm25(PostsSearch)
+        LIMIT ?;
+        """
+    return sqlite.select(get_posts, query, user_id, user_id, user_id, limit)
+
+
+def search_comments(user_id: int, text: str, limit: int = 20) -> list[Any]:
+    """Returns the best matching comments on posts visible to a user."""
+    sqlite = current_app.extensions["sqlite3"]
+    query = match_query(text)
+    if not query:
+        return []
+    get_comments = """
+        SELECT c.id, c.p_id, c.comment, c.creation_time, u.username
+        FROM CommentsSearch AS s JOIN Comments AS c ON c.id = s.rowid JOIN Posts AS p ON p.id = c.p_id JOIN Users AS u ON u.id = c.u_id
+        WHERE CommentsSearch MATCH ?
+          AND (p.u_id = ? OR p.u_id IN (SELECT f_id FROM Friends WHERE u_id = ?) OR p.u_id IN (SELECT u_id FROM Friends WHERE f_id = ?))
+        ORDER BY bm25(CommentsSearch)
+        LIMIT ?;
+        """
+    return sqlite.select(get_comments, query, user_id, user_id, user_id, limit)
+
+
+def search_users(text: str, limit: int = 20) -> list[Any]:
+    """Returns the users whose username or name best matches, treating the last word as a prefix."""
+    sqlite = current_app.extensions["sqlite3"]
+    query = match_query(text, prefix=True)
+    if not query:
+        return []
+    get_users = """
+        SELECT u.id, u.username, u.first_name, u.last_name
+        FROM UsersSearch AS s JOIN Users AS u ON u.id = s.rowid
+        WHERE UsersSearch MATCH ?
+        ORDER BY bm25(UsersSearch, 10.0, 1.0, 1.0)
+        LIMIT ?;
+        """
+    return sqlite.select(get_users, query, limit)
@@ -0,0 +1,108 @@
+"""Provides the cold start helpers of the Social Insecurity application.
+
+Every worker compiles each template from source the first time it renders it. With JINJA_BYTECODE_CACHE set,
+the compiled templates are stored under the instance folder and later workers load them instead.
+With WARM_UP set, create_app() also compiles every template and opens a database connection,
+so the first request a worker serves does not pay for them.
+
+measure_startup() times importing the package, creating the application and the first requests
+in fresh processes, it is run by the `flask measure-startup` command.
+
+Example:
+    from social_insecurity.startup import init_bytecode_cache, warm_up
+
+    init_bytecode_cache(app)
+    warm_up(app)
+"""
+
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+
+from flask import Flask
+from jinja2 import FileSystemBytecodeCache
+
+# Run in a fresh interpreter, so importing the package is part of what is measured
+MEASURE_SCRIPT = """
+import json, sys
+from time import perf_counter
+
+start = perf_counter()
+import social_insecurity
+imported = perf_counter()
+
+class StartupConfig:
+    WARM_UP = sys.argv[2] == "1"
+    RATELIMIT_ENABLED = False
+
+app = social_insecurity.create_app(StartupConfig)
+created = perf_counter()
+client = app.test_client()
+requests = []
+for _ in range(2):
+    begin = perf_counter()
+    status = client.get(sys.argv[1]).status_code
+    requests.append(perf_counter() - begin)
+print(json.dumps({
+    "status": status,
+    "import": imported - start,
+    "create_app": created - imported,
+    "first_request": requests[0],
+    "second_request": requests[1],
+}))
+"""
+
+
+def bytecode_cache_folder(app: Flask) -> Path:
+    """Returns the folder of the Jinja bytecode cache, relative paths are in the instance folder."""
+    return Path(app.instance_path) / app.config["JINJA_BYTECODE_CACHE"]
+
+
+def init_bytecode_cache(app: Flask) -> None:
+    """Stores compiled templates under the instance folder if JINJA_BYTECODE_CACHE is set.
+
+    Entries are keyed by the template's name and source checksum, so edited templates are recompiled.
+    """
+    if not app.config.get("JINJA_BYTECODE_CACHE"):
+        return
+    folder = bytecode_cache_folder(app)
+    folder.mkdir(parents=True, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(folder))
+
+
+def warm_up(app: Flask) -> dict[str, float]:
+    """Compiles every template and opens a database connection, returns the seconds each step took."""
+    timings = {}
+    with app.app_context():
+        start = perf_counter()
+        for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith(".j2")):
+            app.jinja_env.get_template(name)
+        timings["templates"] = perf_counter() - start
+
+        start = perf_counter()
+        # With SQLITE3_POOL_SIZE set the connection goes back to the pool and stays open for the first request,
+        # workers forked from a preloaded app drop it and open their own
+        app.extensions["sqlite3"].connection.execute("SELECT 1;").fetchone()
+        timings["database"] = perf_counter() - start
+    return timings
+
+
+def measure_startup(path: str, warm_up: bool) -> dict[str, Any]:
+    """Starts the application in a fresh process and returns the seconds each startup step took.
+
+    params:
+        path: The URL path of the requests made after startup.
+        warm_up: Whether the application warms up in create_app().
+
+    returns: The status of the last request, and the seconds spent importing the package,
+        creating the application and serving the first and second request.
+
+    """
+    command = [sys.executable, "-c", MEASURE_SCRIPT, path, "1" if warm_up else "0"]
+    output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
@@ -0,0 +1,161 @@
+"""Provides resized variants of uploaded images for the Social Insecurity application.
+
+After a post with an image is saved, a job on a local worker pool writes bounded-size variants
+of the upload next to the original, named after the content hash and their actual width:
+uploads/ab/cd/abcd...ef.320w.webp. Templates list the variants that exist in the <img> srcset,
+so browsers download a small variant where it is enough, and keep using the original until the variants exist.
+
+Pillow is an optional dependency, without it no variants are generated.
+It is imported when the first variant is generated, not when the worker starts.
+
+Example:
+    from social_insecurity.thumbnails import Thumbnails
+
+    thumbnails = Thumbnails()
+    thumbnails.init_app(app)
+    thumbnails.submit(name)
+
+    # In a template
+    # <img src="..." srcset="{{ image_srcset(post.image) }}">
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Optional
+
+from flask import Flask, url_for
+
+from social_insecurity.cache import LRUCache
+from social_insecurity.uploads import is_content_addressed, upload_path
+
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+EXIF_ORIENTATION = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)  # Rotated by 90 degrees, exif_transpose() swaps width and height
+
+
+def fitted_width(width: int, height: int, box: int) -> int:
+    """Returns the width Image.thumbnail((box, box)) gives an image of the given size, it never upscales."""
+    if box >= width and box >= height:
+        return width
+    if width >= height:
+        return box
+    aspect = width / height
+    return max(min(math.floor(box * aspect), math.ceil(box * aspect), key=lambda n: abs(aspect - n / box)), 1)
+
+
+class Thumbnails:
+    """Generates resized image variants on a background worker pool."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._srcsets = LRUCache(maxsize=4096)
+
+    def init_app(self, app: Flask) -> None:
+        """Configures the pipeline and registers the image_srcset template global."""
+        self._folder = Path(app.instance_path) / app.config["UPLOADS_FOLDER_PATH"]
+        self._widths = sorted(set(app.config["IMAGE_VARIANT_WIDTHS"]))
+        self._format = app.config["IMAGE_VARIANT_FORMAT"]
+        self._quality = app.config["IMAGE_VARIANT_QUALITY"]
+        self._logger = app.logger
+        workers = app.config["IMAGE_VARIANT_WORKERS"]
+
+        # Looking for Pillow takes a few milliseconds, it is skipped if the variants are disabled
+        self.enabled = bool(self._widths) and workers > 0 and find_spec("PIL") is not None
+        if self.enabled and self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnails")
+        app.jinja_env.globals["image_srcset"] = self.srcset
+
+    def submit(self, name: str) -> Optional[Future]:
+        """Queues variant generation for an upload, returns None if the pipeline is disabled."""
+        if not self.enabled or self._executor is None or not is_content_addressed(name):
+            return None
+        return self._executor.submit(self._generate_logged, name)
+
+    def generate(self, name: str) -> list[Path]:
+        """Writes the missing variants of an upload and returns the paths of all its variants.
+
+        Each configured width is checked on its own, so widths added to IMAGE_VARIANT_WIDTHS later
+        are generated for existing uploads. The image is only decoded if a variant is missing.
+        """
+        original = self._folder / upload_path(name)
+        stem = name.partition(".")[0]
+        extension = EXTENSIONS[self._format]
+
+        from PIL import Image, ImageOps
+
+        written: dict[int, str] = {}
+        try:
+            with Image.open(original) as image:
+                width, height = image.size  # Read from the header, the pixels are not decoded yet
+                if image.getexif().get(EXIF_ORIENTATION) in TRANSPOSED_ORIENTATIONS:
+                    width, height = height, width
+                missing = [
+                    box
+                    for box in self._widths
+                    if not (original.parent / f"{stem}.{fitted_width(width, height, box)}w.{extension}").exists()
+                ]
+                if not missing:
+                    return self._variants(name)
+
+                image = ImageOps.exif_transpose(image)
+                if self._format == "JPEG" and image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+
+                for box in missing:
+                    variant = image.copy()
+                    variant.thumbnail((box, box))  # Never upscales, so small images share one variant
+                    if variant.width in written:
+                        continue
+                    fd, temporary = tempfile.mkstemp(dir=original.parent, prefix=".variant-")
+                    written[variant.width] = temporary
+                    with os.fdopen(fd, "wb") as output:
+                        variant.save(output, self._format, quality=self._quality)
+
+            # Publish all variants only once they have all been written
+            for width, temporary in written.items():
+                os.replace(temporary, original.parent / f"{stem}.{width}w.{extension}")
+        except BaseException:
+            # Variants published before the failure are kept, they are complete
+            for temporary in written.values():
+                Path(temporary).unlink(missing_ok=True)
+            self._srcsets.pop(name)
+            raise
+        self._srcsets.pop(name)
+        return self._variants(name)
+
+    def srcset(self, name: Optional[str]) -> str:
+        """Returns the srcset attribute value for an upload, or an empty string if it has no variants yet."""
+        if not name or not is_content_addressed(name):
+            return ""
+        srcset = self._srcsets.get(name)
+        if srcset is None:
+            variants = self._variants(name)
+            if not variants:
+                return ""
+            srcset = ", ".join(
+                f"{url_for('uploads', filename=path.name)} {path.name.split('.')[1]}" for path in variants
+            )
+            self._srcsets.set(name, srcset)
+        return srcset
+
+    def _variants(self, name: str) -> list[Path]:
+        """Returns the variants of an upload that exist on disk, smallest first."""
+        stem = name.partition(".")[0]
+        directory = (self._folder / upload_path(name)).parent
+        return sorted(directory.glob(f"{stem}.*w.*"), key=lambda path: int(path.name.split(".")[1][:-1]))
+
+    def _generate_logged(self, name: str) -> None:
+        """Generates variants on a worker thread, logging failures instead of losing them."""
+        try:
+            self.generate(name)
+        except OSError as e:  # Not an image, or one Pillow cannot read
+            self._logger.warning("Could not generate image variants for %s: %s", name, e)
+        except Exception:
+            self._logger.exception("Could not generate image variants for %s", name)
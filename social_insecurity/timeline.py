@@ -0,0 +1,46 @@
+"""Provides the materialized home timelines for the Social Insecurity application.
+
+When TIMELINE_ENABLED is set, every new post is written into the Timeline table
+of its author and of everyone who can see it (fan-out on write).
+The stream page then reads a single user's rows with one indexed range scan,
+instead of rebuilding the feed from Friends and Posts on every view.
+
+Example:
+    from social_insecurity import timeline
+
+    with sqlite.transaction():
+        post_id = sqlite.insert(insert_post, user_id, content, image)
+        timeline.fan_out_post(post_id)
+"""
+
+from flask import current_app
+
+
+def fan_out_post(post_id: int) -> None:
+    """Pushes a post into the timelines of its author and of the author's friends in both directions."""
+    sqlite = current_app.extensions["sqlite3"]
+    fan_out = """
+        INSERT OR IGNORE INTO Timeline (owner_id, post_id, creation_time)
+        SELECT p.u_id, p.id, p.creation_time FROM Posts AS p WHERE p.id = ?
+        UNION ALL
+        SELECT f.u_id, p.id, p.creation_time FROM Posts AS p JOIN Friends AS f ON f.f_id = p.u_id WHERE p.id = ?
+        UNION ALL
+        SELECT f.f_id, p.id, p.creation_time FROM Posts AS p JOIN Friends AS f ON f.u_id = p.u_id WHERE p.id = ?;
+        """
+    sqlite.query(fan_out, post_id, post_id, post_id)
+
+
+def backfill_friendship(user_id: int, friend_id: int) -> None:
+    """Copies the most recent posts of two new friends into each other's timelines."""
+    sqlite = current_app.extensions["sqlite3"]
+    backfill = """
+        INSERT OR IGNORE INTO Timeline (owner_id, post_id, creation_time)
+        SELECT ?, id, creation_time
+        FROM Posts
+        WHERE u_id = ?
+        ORDER BY creation_time DESC, id DESC
+        LIMIT ?;
+        """
+    limit = current_app.config["TIMELINE_BACKFILL_SIZE"]
+    sqlite.query(backfill, user_id, friend_id, limit)
+    sqlite.query(backfill, friend_id, user_id, limit)
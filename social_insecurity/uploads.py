@@ -0,0 +1,191 @@
+"""Provides content-addressed storage for uploaded files.
+
+Uploads are streamed to disk in chunks and hashed while streaming.
+Each file is stored once under the SHA-256 of its content, in sharded subdirectories
+(uploads/ab/cd/abcd...ef.png), so identical uploads share a single stored copy and names never collide.
+The Uploads table counts how many posts reference each file, maintained by triggers on Posts,
+and 'flask gc-uploads' removes files that are no longer referenced, or that never were because
+the post failed to be written. Files stored or uploaded again within UPLOADS_GC_GRACE seconds are kept,
+so a post that is about to reference them does not lose them.
+
+Example:
+    from social_insecurity.uploads import register_upload, save_upload
+
+    name = save_upload(form.image.data)
+    with sqlite.transaction():
+        register_upload(name)
+        sqlite.insert(insert_post, user_id, content, name)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from flask import current_app
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+
+from social_insecurity.cache import LRUCache
+
+CHUNK_SIZE = 64 * 1024
+CONTENT_ADDRESS = re.compile(r"^[0-9a-f]{64}(\.[0-9]+w)?(\.[a-z0-9]+)?$")  # Hash, variant width, extension
+
+# Content hashes of uploads stored before content addressing, keyed by path, mtime and size
+_legacy_etags = LRUCache(maxsize=1024)
+
+
+def upload_folder() -> Path:
+    """Returns the folder uploads are stored in."""
+    return Path(current_app.instance_path) / current_app.config["UPLOADS_FOLDER_PATH"]
+
+
+def is_content_addressed(name: str) -> bool:
+    """Checks whether an upload name is a content hash, so the file behind it can never change."""
+    return CONTENT_ADDRESS.match(name) is not None
+
+
+def upload_path(name: str) -> str:
+    """Returns the path of an upload relative to the upload folder.
+
+    Content-addressed names are sharded by the first two bytes of the hash,
+    other names are uploads stored before content addressing and live in the folder root.
+    """
+    if is_content_addressed(name):
+        return f"{name[:2]}/{name[2:4]}/{name}"
+    return name
+
+
+def upload_etag(name: str, path: Path) -> str:
+    """Returns a strong ETag derived from the content of an upload.
+
+    Content-addressed names already are the hash. Other uploads are hashed once
+    and remembered until the file's modification time or size changes.
+    """
+    if is_content_addressed(name):
+        return name.rpartition(".")[0] or name
+
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    etag = _legacy_etags.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with path.open("rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                digest.update(chunk)
+        etag = digest.hexdigest()
+        _legacy_etags.set(key, etag)
+    return etag
+
+
+def save_upload(file: FileStorage) -> str:
+    """Streams an uploaded file to disk and returns its content-addressed name."""
+    folder = upload_folder()
+    extension = Path(secure_filename(file.filename or "")).suffix.lower()
+    digest = hashlib.sha256()
+
+    fd, temporary = tempfile.mkstemp(dir=folder, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            while chunk := file.stream.read(CHUNK_SIZE):
+                digest.update(chunk)
+                output.write(chunk)
+
+        name = digest.hexdigest() + extension
+        path = folder / upload_path(name)
+        try:
+            os.utime(path)  # Duplicate content, keep the stored copy and mark it as recently used for gc-uploads
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temporary, path)
+        else:
+            os.unlink(temporary)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+    return name
+
+
+def register_upload(name: str) -> None:
+    """Records a stored upload, its reference count is then maintained by the triggers on Posts."""
+    sqlite = current_app.extensions["sqlite3"]
+    insert_upload = """
+        INSERT INTO Uploads (name, size)
+        VALUES (?, ?)
+        ON CONFLICT (name) DO NOTHING;
+        """
+    sqlite.query(insert_upload, name, (upload_folder() / upload_path(name)).stat().st_size)
+
+
+def collect_garbage(grace: float) -> int:
+    """Deletes the stored uploads no post references, with their resized variants.
+
+    These are the uploads whose reference count dropped to zero, and the stored files without an Uploads row,
+    left behind when the post was not written after its upload was saved. The rows are deleted in the same
+    write transaction that rechecks them, so no post can start referencing them meanwhile.
+
+    params:
+        grace: Files written or uploaded again within this many seconds are kept.
+
+    returns: The number of uploads deleted.
+
+    """
+    sqlite = current_app.extensions["sqlite3"]
+    folder = upload_folder()
+    get_unreferenced = """
+        SELECT name
+        FROM Uploads
+        WHERE ref_count <= 0;
+        """
+    get_registered = """
+        SELECT name
+        FROM Uploads
+        WHERE name IN (SELECT value FROM json_each(?));
+        """
+    stored = [path.name for path in folder.glob("??/??/*") if _is_original(path.name)]
+    for path in folder.glob(".upload-*"):  # Uploads interrupted while streaming
+        if time.time() - path.stat().st_mtime >= grace:
+            path.unlink(missing_ok=True)
+
+    deleted = 0
+    with sqlite.transaction():
+        registered = {row["name"] for row in sqlite.select(get_registered, json.dumps(stored))}
+        unreferenced = [row["name"] for row in sqlite.select(get_unreferenced)]
+        for name in unreferenced + [name for name in stored if name not in registered]:
+            if _delete_unless_used(folder / upload_path(name), grace):
+                sqlite.query("DELETE FROM Uploads WHERE name = ?;", name)
+                deleted += 1
+    return deleted
+
+
+def _is_original(name: str) -> bool:
+    """Checks whether a stored file is an upload, rather than one of its resized variants."""
+    match = CONTENT_ADDRESS.match(name)
+    return match is not None and match.group(1) is None
+
+
+def _delete_unless_used(path: Path, grace: float) -> bool:
+    """Deletes a stored upload and its variants, unless it was written or touched within grace seconds.
+
+    The file is moved aside before its age is checked. A concurrent save_upload() of the same content
+    has then either touched it already, which the check sees, or finds it missing and stores a new copy.
+    """
+    aside = path.with_name(f".gc-{path.name}")
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        return True
+    if time.time() - aside.stat().st_mtime < grace:
+        os.replace(aside, path)
+        return False
+    aside.unlink()
+    for variant in path.parent.glob(f"{path.name.partition('.')[0]}.*"):
+        if not _is_original(variant.name):
+            variant.unlink(missing_ok=True)
+    return True
@@ -0,0 +1,179 @@
+"""Provides optional group commit of writes for the Social Insecurity application.
+
+By default every write runs in its own transaction on the request's connection, so each one waits
+for SQLite's write lock and pays for its own commit. When SQLITE3_WRITE_BEHIND is set, writes are
+instead handed to a single writer thread per process. It runs them back to back on its own connection
+and commits them together, once SQLITE3_WRITE_BATCH_SIZE writes are waiting or SQLITE3_WRITE_BATCH_LATENCY
+seconds have passed. Each write runs in a savepoint, so a failing write does not affect the rest of its batch.
+The caller gets the result of its write once the batch has been committed. A write still waiting in the queue
+after SQLITE3_WRITE_TIMEOUT seconds is cancelled and never runs, so the caller can safely retry it.
+
+A write is a function using the SQLite3 extension as usual. In the writer thread it runs inside an
+app context whose connection is the writer's, and its sqlite.transaction() blocks join the batch.
+
+Example:
+    from social_insecurity import writes
+
+    def insert_comment(post_id, user_id, comment):
+        with sqlite.transaction():
+            return sqlite.insert("INSERT INTO Comments (p_id, u_id, comment) VALUES (?, ?, ?);", post_id, user_id, comment)
+
+    comment_id = writes.submit(insert_comment, post_id, current_user.id, comment)
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from time import monotonic, perf_counter
+from typing import Any, Callable, Optional
+
+from flask import Flask, current_app
+
+from social_insecurity.instrumentation import COUNT_BUCKETS, DURATION_BUCKETS, Histogram
+
+Job = tuple[Callable[..., Any], tuple[Any, ...], Future]
+
+
+class WriteBehind:
+    """Runs writes inline, or on a single writer thread that commits them in batches."""
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self._app: Optional[Flask] = None
+        self._queue: queue.SimpleQueue[Job] = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._batch_sizes = Histogram(COUNT_BUCKETS)
+        self._commit_seconds = Histogram(DURATION_BUCKETS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Enables the writer thread if SQLITE3_WRITE_BEHIND is set, otherwise writes run inline."""
+        if app.config.get("SQLITE3_WRITE_BEHIND", False):
+            self._app = app
+            self._batch_size = app.config.get("SQLITE3_WRITE_BATCH_SIZE", 64)
+            self._batch_latency = app.config.get("SQLITE3_WRITE_BATCH_LATENCY", 0.002)
+            self._timeout = app.config.get("SQLITE3_WRITE_TIMEOUT", 30.0)
+            app.extensions["write_behind"] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self._app is not None
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs a write and returns its result once it is committed, raising its exception if it failed.
+
+        Raises concurrent.futures.TimeoutError if the writer did not start the write within SQLITE3_WRITE_TIMEOUT
+        seconds, the write is then cancelled. A write the writer already started is waited for instead,
+        since it may be committed.
+        """
+        if not self.enabled:
+            return func(*args)
+
+        self._ensure_writer()
+        future: Future = Future()
+        self._queue.put((func, args, future))
+        try:
+            return future.result(timeout=self._timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise
+        return future.result()
+
+    def stats(self) -> dict[str, Any]:
+        """Returns the queue depth and the distributions of batch sizes and commit latencies."""
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batch_sizes.count,
+                "writes": int(self._batch_sizes.sum),
+                "batch_size_buckets": dict(zip(self._batch_sizes.buckets, self._batch_sizes.counts)),
+                "commit_seconds_total": self._commit_seconds.sum,
+                "commit_seconds_avg": self._commit_seconds.sum / self._commit_seconds.count
+                if self._commit_seconds.count
+                else 0.0,
+            }
+
+    def samples(self) -> list[str]:
+        """Returns the statistics as lines of the Prometheus text format."""
+        with self._lock:
+            return [
+                "# HELP sqlite_write_queue_depth Writes waiting for the writer thread.",
+                "# TYPE sqlite_write_queue_depth gauge",
+                f"sqlite_write_queue_depth {self._queue.qsize()}",
+                "# HELP sqlite_write_batch_size Writes committed together in one batch.",
+                "# TYPE sqlite_write_batch_size histogram",
+                *self._batch_sizes.samples("sqlite_write_batch_size", 'writer="main"'),
+                "# HELP sqlite_write_commit_seconds Time to run and commit a batch of writes.",
+                "# TYPE sqlite_write_commit_seconds histogram",
+                *self._commit_seconds.samples("sqlite_write_commit_seconds", 'writer="main"'),
+            ]
+
+    def _ensure_writer(self) -> None:
+        """Starts the writer thread, again after a fork since threads do not survive it, or if it died."""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sqlite3-writer", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _next_batch(self) -> list[Job]:
+        """Waits for a write, then collects more until the batch is full or the latency budget is spent."""
+        batch = [self._queue.get()]
+        deadline = monotonic() + self._batch_latency
+        while len(batch) < self._batch_size:
+            remaining = deadline - monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        """Runs batches of writes on the writer's own connection forever."""
+        app = self._app
+        sqlite = app.extensions["sqlite3"]
+        conn = sqlite.connect(check_same_thread=False)
+        while True:
+            # Writes whose caller timed out were cancelled, the rest can no longer be
+            batch = [job for job in self._next_batch() if job[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = perf_counter()
+            results: list[tuple[Future, Any, Optional[BaseException]]] = []
+            # The connection belongs to the writer, bind() keeps the app context teardown from closing it
+            with app.app_context(), sqlite.bind(conn):
+                try:
+                    with sqlite.transaction():  # Transactions in the writes join the batch
+                        for func, args, future in batch:
+                            conn.execute("SAVEPOINT write;")
+                            try:
+                                result = func(*args)
+                            except Exception as e:
+                                conn.execute("ROLLBACK TO write;")
+                                results.append((future, None, e))
+                            else:
+                                results.append((future, result, None))
+                            conn.execute("RELEASE write;")
+                except BaseException as e:
+                    # Even SystemExit or KeyboardInterrupt from a write only fails its batch, the writer keeps going
+                    if conn.in_transaction:
+                        conn.rollback()
+                    current_app.logger.exception("Write batch of %d failed", len(batch))
+                    results = [(future, None, e) for _, _, future in batch]
+
+            with self._lock:
+                self._batch_sizes.observe(len(batch))
+                self._commit_seconds.observe(perf_counter() - start)
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import io
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from social_insecurity import bulk
+from social_insecurity.datagen import generate
+from social_insecurity.uploads import upload_path
+
+SCHEMA_PATH = Path(__file__).parent.parent / "social_insecurity" / "schema.sql"
+
+
+def make_database(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA_PATH.read_text())
+    return conn
+
+
+def snapshot(conn: sqlite3.Connection) -> dict[str, list[tuple]]:
+    return {table: sorted(bulk.iter_table(conn, table), key=repr) for table in bulk.TABLES}
+
+
+@pytest.fixture()
+def source(tmp_path: Path) -> sqlite3.Connection:
+    conn = make_database(tmp_path / "source.db")
+    with conn:
+        generate(conn, users=30, posts=100, comments=300, password_hash="hash", seed=1)
+    return conn
+
+
+def test_ndjson_round_trip(tmp_path: Path, source: sqlite3.Connection):
+    file = io.StringIO()
+    counts = bulk.export_ndjson(source, file)
+    assert counts["Posts"] == 100 and counts["Comments"] == 300
+
+    target = make_database(tmp_path / "target.db")
+    file.seek(0)
+    assert bulk.import_batches(target, bulk.read_ndjson(file)) == {table: count for table, count in counts.items() if count}
+
+    assert snapshot(target) == snapshot(source)
+    # The indexes and triggers are back, and the search index covers the imported rows
+    schema = "SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger') ORDER BY name;"
+    assert target.execute(schema).fetchall() == source.execute(schema).fetchall()
+    search = "SELECT COUNT(*) FROM PostsSearch WHERE PostsSearch MATCH 'coffee';"
+    assert target.execute(search).fetchone() == source.execute(search).fetchone()
+
+
+def test_csv_round_trip_recounts_comments(tmp_path: Path, source: sqlite3.Connection):
+    bulk.export_csv(source, tmp_path / "csv", tables=("Users", "Posts", "Comments"))
+    # Counters are recomputed from the imported rows, not taken from the file
+    with (tmp_path / "csv" / "Comments.csv").open("a") as file:
+        file.write("100000,1,1,,2024-01-01 00:00:00\n")
+
+    target = make_database(tmp_path / "target.db")
+    bulk.import_batches(target, bulk.read_csv(tmp_path / "csv"))
+
+    expected = source.execute("SELECT comment_count FROM Posts WHERE id = 1;").fetchone()[0] + 1
+    assert target.execute("SELECT comment_count FROM Posts WHERE id = 1;").fetchone()[0] == expected
+    assert target.execute("SELECT comment FROM Comments WHERE id = 100000;").fetchone()[0] is None
+    assert target.execute("SELECT COUNT(*) FROM Friends;").fetchone()[0] == 0
+
+
+def test_failed_import_changes_nothing(tmp_path: Path):
+    target = make_database(tmp_path / "target.db")
+    lines = io.StringIO('{"table":"Users","id":5,"username":"alice"}\n{"table":"Users","id":6,"username":"test"}\n')
+
+    with pytest.raises(sqlite3.IntegrityError):
+        bulk.import_batches(target, bulk.read_ndjson(lines), on_conflict="abort")
+
+    assert target.execute("SELECT username FROM Users;").fetchall() == [("test",)]
+    assert target.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger';").fetchone()[0] > 0
+
+
+def test_unknown_columns_are_rejected(tmp_path: Path):
+    target = make_database(tmp_path / "target.db")
+    lines = io.StringIO('{"table":"Users","id":5,"username) VALUES (1, 2); --":"x"}\n')
+
+    with pytest.raises(ValueError):
+        bulk.import_batches(target, bulk.read_ndjson(lines))
+
+
+def test_import_registers_the_uploads_present(tmp_path: Path):
+    source = make_database(tmp_path / "source.db")
+    with source:
+        source.execute("INSERT INTO Users (id, username, password) VALUES (5, 'alice', 'x');")
+        source.executemany(
+            "INSERT INTO Posts (u_id, content, image) VALUES (5, 'Photo', ?);",
+            [(f"{'a' * 64}.png",), (f"{'a' * 64}.png",), (f"{'b' * 64}.png",)],
+        )
+    file = io.StringIO()
+    bulk.export_ndjson(source, file)
+    stored = tmp_path / "uploads" / upload_path(f"{'a' * 64}.png")
+    stored.parent.mkdir(parents=True)
+    stored.write_bytes(b"image")
+
+    target = make_database(tmp_path / "target.db")
+    file.seek(0)
+    bulk.import_batches(target, bulk.read_ndjson(file), uploads=tmp_path / "uploads")
+
+    assert target.execute("SELECT name, size, ref_count FROM Uploads;").fetchall() == [(f"{'a' * 64}.png", 5, 2)]
+
+
+def test_backup_copies_the_database(tmp_path: Path, source: sqlite3.Connection):
+    bulk.backup(source, tmp_path / "backups" / "copy.db", pages=4)
+
+    copy = sqlite3.connect(tmp_path / "backups" / "copy.db")
+    assert snapshot(copy) == snapshot(source)
+
+
+def test_failed_backup_keeps_the_previous_one(tmp_path: Path, source: sqlite3.Connection):
+    target = tmp_path / "copy.db"
+    bulk.backup(source, target)
+    with source:
+        source.execute("DELETE FROM Comments;")
+
+    def interrupt(status: int, remaining: int, total: int) -> None:
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        bulk.backup(source, target, pages=1, progress=interrupt)
+
+    assert sqlite3.connect(target).execute("SELECT COUNT(*) FROM Comments;").fetchone()[0] == 300
+    assert [path.name for path in tmp_path.iterdir() if path.name.startswith(".copy.db")] == []
@@ -0,0 +1,52 @@
+from unittest.mock import patch
+
+from social_insecurity.cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = LRUCache(maxsize=2, ttl=10)
+    with patch("social_insecurity.cache.monotonic", return_value=100.0):
+        cache.set("a", 1)
+    with patch("social_insecurity.cache.monotonic", return_value=105.0):
+        assert cache.get("a") == 1
+    with patch("social_insecurity.cache.monotonic", return_value=111.0):
+        assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_counts_hits_and_misses():
+    cache = LRUCache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_evicts_to_stay_within_memory_budget():
+    cache = LRUCache(maxsize=100, max_bytes=10, sizeof=len)
+    cache.set("a", "aaaa")
+    cache.set("b", "bbbb")
+    cache.set("c", "cccc")
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 8
+
+    cache.set("d", "d" * 11)
+    assert cache.get("d") is None
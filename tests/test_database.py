@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+import pytest
+from flask import Flask
+
+from social_insecurity.database import SQLite3
+
+
+def make_app(tmp_path: Path, **config) -> Flask:
+    app = Flask(__name__, instance_path=str(tmp_path / "instance"))
+    app.config.update(SQLITE3_DATABASE_PATH="sqlite3.db", **config)
+    return app
+
+
+def test_pooled_connection_is_reused(tmp_path: Path):
+    app = make_app(tmp_path, SQLITE3_POOL_SIZE=2)
+    db = SQLite3(app)
+
+    with app.app_context():
+        first = db.connection
+    with app.app_context():
+        second = db.connection
+
+    assert first is second
+    stats = db.pool.stats()
+    assert stats["size"] == 2
+    assert stats["open"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["in_use"] == 0
+
+
+def test_pool_drops_connections_inherited_across_fork(tmp_path: Path, monkeypatch):
+    app = make_app(tmp_path, SQLITE3_POOL_SIZE=1)
+    db = SQLite3(app)
+    with app.app_context():
+        parent = db.connection
+
+    monkeypatch.setattr(os, "getpid", lambda: -1)  # In the child process
+    with app.app_context():
+        child = db.connection
+
+    assert child is not parent
+    assert db.pool.stats()["open"] == 1
+
+
+def test_pool_timeout_when_exhausted(tmp_path: Path):
+    app = make_app(tmp_path, SQLITE3_POOL_SIZE=1, SQLITE3_POOL_TIMEOUT=0.01)
+    db = SQLite3(app)
+
+    held = db.pool.acquire()
+    with pytest.raises(RuntimeError):
+        db.pool.acquire()
+    db.pool.release(held)
+    assert db.pool.stats()["waits"] == 1
+
+
+def test_pragmas_are_applied(tmp_path: Path):
+    app = make_app(tmp_path, SQLITE3_PRAGMAS={"journal_mode": "WAL", "busy_timeout": 1234})
+    db = SQLite3(app)
+
+    with app.app_context():
+        assert db.query("PRAGMA journal_mode;", one=True)[0] == "wal"
+        assert db.query("PRAGMA busy_timeout;", one=True)[0] == 1234
+
+
+def make_counter_table(db: SQLite3) -> None:
+    with db.transaction():
+        db.query("CREATE TABLE IF NOT EXISTS Counters (id INTEGER PRIMARY KEY, value INTEGER);")
+
+
+def count_rows(db: SQLite3) -> int:
+    return db.select("SELECT COUNT(*) FROM Counters;", one=True)[0]
+
+
+def test_transaction_commits_and_rolls_back(tmp_path: Path):
+    app = make_app(tmp_path)
+    db = SQLite3(app)
+
+    with app.app_context():
+        make_counter_table(db)
+        with db.transaction():
+            db.query("INSERT INTO Counters (value) VALUES (1);")
+            with db.transaction():
+                db.query("INSERT INTO Counters (value) VALUES (2);")
+        with pytest.raises(ValueError):
+            with db.transaction():
+                db.query("INSERT INTO Counters (value) VALUES (3);")
+                raise ValueError
+        assert not db.connection.in_transaction
+
+    with app.app_context():
+        assert count_rows(db) == 2
+
+
+def test_writes_are_committed_once_at_teardown(tmp_path: Path):
+    app = make_app(tmp_path)
+    db = SQLite3(app)
+
+    with app.app_context():
+        make_counter_table(db)
+        db.query("INSERT INTO Counters (value) VALUES (1);")
+        db.query("INSERT INTO Counters (value) VALUES (2);")
+        assert db.connection.in_transaction
+
+    with app.app_context():
+        assert count_rows(db) == 2
+
+
+def test_bound_connection_outlives_the_app_context(tmp_path: Path):
+    app = make_app(tmp_path, SQLITE3_POOL_SIZE=1)
+    db = SQLite3(app)
+    conn = db.connect()
+
+    with app.app_context():
+        make_counter_table(db)
+        request_connection = db.connection
+        with db.bind(conn):
+            assert db.connection is conn
+            with db.transaction():
+                db.query("INSERT INTO Counters (value) VALUES (1);")
+        assert db.connection is request_connection
+    with app.app_context(), db.bind(conn):
+        assert count_rows(db) == 1
+
+    assert conn.execute("SELECT COUNT(*) FROM Counters;").fetchone()[0] == 1  # Still open
+    assert db.pool.stats()["open"] == 1
+
+
+def test_autocommit_mode_commits_every_statement(tmp_path: Path):
+    app = make_app(tmp_path, SQLITE3_AUTOCOMMIT=True)
+    db = SQLite3(app)
+
+    with app.app_context():
+        make_counter_table(db)
+        db.query("INSERT INTO Counters (value) VALUES (1);")
+        assert not db.connection.in_transaction
+
+
+def test_rows_are_built_as_named_tuples(tmp_path: Path):
+    app = make_app(tmp_path)
+    db = SQLite3(app)
+
+    class Counter(NamedTuple):
+        id: int
+        value: int
+
+    with app.app_context():
+        make_counter_table(db)
+        db.query("INSERT INTO Counters (value) VALUES (7);")
+        assert db.select("SELECT id, value FROM Counters;", row=Counter) == [Counter(1, 7)]
+        assert db.select("SELECT id, value FROM Counters WHERE id = 1;", one=True, row=Counter).value == 7
+        assert db.select("SELECT id, value FROM Counters WHERE id = 2;", one=True, row=Counter) is None
+        assert db.select("SELECT id, value FROM Counters;", one=True)["value"] == 7  # The default is still sqlite3.Row
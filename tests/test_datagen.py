@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+
+from social_insecurity.datagen import generate
+
+SCHEMA_PATH = Path(__file__).parent.parent / "social_insecurity" / "schema.sql"
+
+
+def make_database() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA_PATH.read_text())
+    return conn
+
+
+def test_generate_adds_requested_rows():
+    conn = make_database()
+    added = generate(conn, users=200, posts=1000, comments=3000, password_hash="hash", friends=8)
+
+    assert added["friends"] == conn.execute("SELECT COUNT(*) FROM Friends;").fetchone()[0] > 0
+    assert conn.execute("SELECT COUNT(*) FROM Users WHERE password = 'hash';").fetchone()[0] == 200
+    assert conn.execute("SELECT COUNT(*) FROM Posts;").fetchone()[0] == 1000
+    assert conn.execute("SELECT SUM(comment_count) FROM Posts;").fetchone()[0] == 3000
+    assert conn.execute("SELECT COUNT(*) FROM Friends WHERE u_id = f_id;").fetchone()[0] == 0
+
+
+def test_friend_degrees_are_skewed():
+    conn = make_database()
+    generate(conn, users=1000, posts=0, comments=0, password_hash="hash", friends=10)
+
+    degrees = [count for (count,) in conn.execute("SELECT COUNT(*) FROM Friends GROUP BY f_id ORDER BY 1 DESC;")]
+    assert degrees[0] > 5 * sum(degrees) / len(degrees)
+
+
+def test_same_seed_generates_same_data():
+    first, second = make_database(), make_database()
+    for conn in (first, second):
+        generate(conn, users=50, posts=100, comments=100, password_hash="hash", seed=7)
+
+    query = "SELECT u_id, content FROM Posts ORDER BY id;"
+    assert first.execute(query).fetchall() == second.execute(query).fetchall()
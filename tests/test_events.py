@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+from flask import Flask
+
+from social_insecurity.database import SQLite3
+from social_insecurity.events import EventHub
+
+SCHEMA_PATH = Path(__file__).parent.parent / "social_insecurity" / "schema.sql"
+
+
+def make_app(tmp_path: Path) -> tuple[Flask, SQLite3]:
+    app = Flask(__name__, instance_path=str(tmp_path / "instance"))
+    app.config.update(SQLITE3_DATABASE_PATH="sqlite3.db", EVENTS_POLL_INTERVAL=0.01)
+    db = SQLite3(app)
+    with app.app_context():
+        db.connection.executescript(SCHEMA_PATH.read_text())
+        db.connection.execute("INSERT INTO Users (username, password) VALUES ('alice', 'x');")
+        db.connection.execute("INSERT INTO Posts (u_id, content) VALUES (1, 'First');")
+        db.connection.commit()
+    return app, db
+
+
+def test_latest_ids_are_read_from_the_database(tmp_path: Path):
+    app, _ = make_app(tmp_path)
+    hub = EventHub(app)
+
+    assert hub.latest("post") == 1
+    assert hub.latest("comment") == 0
+    assert hub.wait("post", 1, timeout=0) == 1
+
+
+def test_wait_is_woken_by_publish(tmp_path: Path):
+    app, _ = make_app(tmp_path)
+    app.config["EVENTS_POLL_INTERVAL"] = 60
+    hub = EventHub(app)
+    hub.latest("post")
+    timer = threading.Timer(0.05, hub.publish, args=("post", 2))
+    timer.start()
+
+    assert hub.wait("post", 1, timeout=5) == 2
+    timer.join()
+
+
+def test_wait_sees_writes_from_other_processes(tmp_path: Path):
+    app, db = make_app(tmp_path)
+    hub = EventHub(app)
+    hub.latest("comment")
+
+    def write() -> None:
+        # Written without publish(), like another worker would
+        with app.app_context():
+            db.connection.execute("INSERT INTO Comments (p_id, u_id, comment) VALUES (1, 1, 'Hi');")
+            db.connection.commit()
+
+    timer = threading.Timer(0.05, write)
+    timer.start()
+    assert hub.wait("comment", 0, timeout=5) == 1
+    timer.join()
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from flask import Flask
+
+from social_insecurity.fragments import FragmentCache
+
+
+def make_app(tmp_path: Path) -> Flask:
+    (tmp_path / "greeting.html.j2").write_text("Hello {{ name }}")
+    app = Flask(__name__, template_folder=str(tmp_path))
+    app.config["FRAGMENT_CACHE_BYTES"] = 1024
+    app.jinja_env.autoescape = True
+    return app
+
+
+def test_fragments_are_cached_per_key(tmp_path: Path):
+    app = make_app(tmp_path)
+    fragments = FragmentCache()
+    fragments.init_app(app)
+
+    with app.app_context():
+        assert fragments.render("greeting.html.j2", (1, 0), name="Jane") == "Hello Jane"
+        assert fragments.render("greeting.html.j2", (1, 0), name="John") == "Hello Jane"
+        assert fragments.render("greeting.html.j2", (1, 1), name="John") == "Hello John"
+
+    stats = fragments.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_rendered_through_template_global(tmp_path: Path):
+    (tmp_path / "page.html.j2").write_text("{{ render_fragment('greeting.html.j2', 1, name='<b>') }}")
+    app = make_app(tmp_path)
+    FragmentCache().init_app(app)
+
+    with app.app_context():
+        assert app.jinja_env.get_template("page.html.j2").render() == "Hello &lt;b&gt;"
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from flask import Flask
+
+from social_insecurity.database import SQLite3
+from social_insecurity.graph import FriendGraph
+
+SCHEMA_PATH = Path(__file__).parent.parent / "social_insecurity" / "schema.sql"
+
+
+def make_app(tmp_path: Path, friendships: list[tuple[int, int]]) -> tuple[Flask, SQLite3]:
+    app = Flask(__name__, instance_path=str(tmp_path / "instance"))
+    app.config.update(SQLITE3_DATABASE_PATH="sqlite3.db")
+    db = SQLite3(app)
+    with app.app_context():
+        db.connection.executescript(SCHEMA_PATH.read_text())
+        db.connection.executemany("INSERT INTO Friends (u_id, f_id) VALUES (?, ?);", friendships)
+        db.connection.commit()
+    return app, db
+
+
+def test_friendships_in_both_directions(tmp_path: Path):
+    app, _ = make_app(tmp_path, [(1, 2), (3, 1)])
+    graph = FriendGraph(app)
+
+    with app.app_context():
+        assert graph.is_friend(1, 2)
+        assert not graph.is_friend(1, 3)  # 3 added 1, not the other way around
+        assert graph.visible_authors(1) == {1, 2, 3}
+
+
+def test_mutual_friends_and_suggestions(tmp_path: Path):
+    app, _ = make_app(tmp_path, [(1, 2), (1, 3), (2, 4), (4, 3), (3, 5), (2, 1)])
+    graph = FriendGraph(app)
+
+    with app.app_context():
+        assert graph.mutual_count(1, 4) == 2
+        assert graph.suggestions(1) == [(4, 2), (5, 1)]
+        assert graph.suggestions(1, limit=1) == [(4, 2)]
+
+
+def test_added_friendship_reloads_both_users(tmp_path: Path):
+    app, db = make_app(tmp_path, [(1, 2)])
+    graph = FriendGraph(app)
+
+    with app.app_context():
+        assert graph.visible_authors(1) == {1, 2}
+        assert graph.visible_authors(3) == {3}
+        db.connection.execute("INSERT INTO Friends (u_id, f_id) VALUES (1, 3);")
+        graph.add(1, 3)
+        assert graph.is_friend(1, 3)
+        assert graph.visible_authors(3) == {1, 3}
+        assert graph.visible_authors(1) == {1, 2, 3}
+
+
+def test_load_racing_an_added_friendship_is_not_indexed(tmp_path: Path, monkeypatch):
+    app, db = make_app(tmp_path, [(1, 2)])
+    graph = FriendGraph(app)
+    select = db.select
+
+    def select_then_add(*args, **kwargs):
+        # Another request commits 1 -> 3 after this load read the friendships
+        rows = select(*args, **kwargs)
+        monkeypatch.setattr(db, "select", select)
+        db.connection.execute("INSERT INTO Friends (u_id, f_id) VALUES (1, 3);")
+        graph.add(1, 3)
+        return rows
+
+    with app.app_context():
+        monkeypatch.setattr(db, "select", select_then_add)
+        assert graph.visible_authors(1) == {1, 2}  # The stale answer is returned once, but not kept
+        assert graph.is_friend(1, 3)
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from flask import Flask
+
+from social_insecurity.cache import LRUCache
+from social_insecurity.database import SQLite3
+from social_insecurity.fragments import FragmentCache
+from social_insecurity.instrumentation import QueryMetrics, fingerprint
+
+
+def make_app(tmp_path: Path, **config) -> tuple[Flask, SQLite3, QueryMetrics]:
+    app = Flask(__name__, instance_path=str(tmp_path / "instance"))
+    app.config.update(
+        {"SQLITE3_DATABASE_PATH": "sqlite3.db", "SQLITE3_INSTRUMENT": True, "SQLITE3_METRICS_TOKEN": "s3cret", **config}
+    )
+    db = SQLite3(app)
+    metrics = QueryMetrics(app)
+
+    @app.route("/numbers")
+    def numbers():
+        db.query("CREATE TABLE IF NOT EXISTS Numbers (n INTEGER);")
+        db.insert("INSERT INTO Numbers (n) VALUES (?);", 7)
+        return str(len(db.select("SELECT n FROM Numbers WHERE n > 1;")))
+
+    return app, db, metrics
+
+
+def test_fingerprint_groups_statements():
+    assert fingerprint("SELECT *\n  FROM Users WHERE id = 1 AND name = 'it''s';") == (
+        "SELECT * FROM Users WHERE id = ? AND name = ?;"
+    )
+
+
+def test_requests_are_aggregated_and_served(tmp_path: Path):
+    app, _, metrics = make_app(tmp_path)
+    client = app.test_client()
+
+    response = client.get("/numbers")
+    assert response.headers["Server-Timing"].endswith('desc="3 statements"')
+    client.get("/numbers")
+
+    body = client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).get_data(as_text=True)
+    assert 'sqlite_route_statements_count{route="numbers"} 2' in body
+    assert 'sqlite_statement_rows_sum{statement="SELECT n FROM Numbers WHERE n > ?;"} 3' in body
+    # Requests forwarded by a local reverse proxy need the token too
+    assert client.get("/metrics").status_code == 404
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 404
+
+
+def test_cache_statistics_are_served(tmp_path: Path):
+    app, _, _ = make_app(tmp_path, FRAGMENT_CACHE_BYTES=1024)
+    fragments = FragmentCache()
+    fragments.init_app(app)
+    fragments.cache.set(("post_card.html.j2", (1, 0)), "<div>First</div>")
+    fragments.cache.get(("post_card.html.j2", (1, 0)))
+    fragments.cache.get(("post_card.html.j2", (1, 1)))
+    app.extensions["user_cache"] = LRUCache(maxsize=8)
+    app.extensions["user_cache"].get(1)
+
+    body = app.test_client().get("/metrics", headers={"Authorization": "Bearer s3cret"}).get_data(as_text=True)
+    assert 'cache_entries{cache="fragments"} 1' in body
+    assert 'cache_bytes{cache="fragments"} 16' in body
+    assert 'cache_hits_total{cache="fragments"} 1' in body
+    assert 'cache_hit_ratio{cache="fragments"} 0.5' in body
+    assert 'cache_hits_total{cache="users"} 0' in body
+    assert 'cache_misses_total{cache="users"} 1' in body
+
+
+def test_pool_statistics_are_served(tmp_path: Path):
+    app, _, _ = make_app(tmp_path, SQLITE3_POOL_SIZE=2)
+    client = app.test_client()
+    client.get("/numbers")
+    client.get("/numbers")
+
+    body = client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).get_data(as_text=True)
+    assert "sqlite_pool_size 2" in body
+    assert 'sqlite_pool_connections{state="idle"} 1' in body
+    assert "sqlite_pool_checkouts_total 2" in body
+    assert "sqlite_pool_waits_total 0" in body
+
+
+def test_metrics_are_hidden_without_a_token(tmp_path: Path):
+    app, _, _ = make_app(tmp_path, SQLITE3_METRICS_TOKEN=None)
+
+    assert app.test_client().get("/metrics", headers={"Authorization": "Bearer None"}).status_code == 404
+
+
+def test_slow_statements_are_logged_with_their_plan(tmp_path: Path, caplog):
+    app, _, _ = make_app(tmp_path, SQLITE3_SLOW_QUERY_SECONDS=0)
+
+    app.test_client().get("/numbers")
+    assert any("SCAN Numbers" in record.getMessage() for record in caplog.records)
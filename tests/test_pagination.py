@@ -0,0 +1,24 @@
+from social_insecurity.pagination import FIRST_PAGE, decode_cursor, encode_cursor, split_page
+from social_insecurity.rows import CommentRow
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2024-01-31 12:00:00", 42)
+    assert decode_cursor(cursor) == ("2024-01-31 12:00:00", 42)
+
+
+def test_invalid_cursor_decodes_to_first_page():
+    assert decode_cursor(None) == FIRST_PAGE
+    assert decode_cursor("not a cursor") == FIRST_PAGE
+
+
+def test_split_page():
+    rows = [CommentRow(day, 1, 1, "alice", "Hello", f"2024-01-0{day} 00:00:00") for day in (3, 2, 1)]
+
+    page, cursor = split_page(rows, 2)
+    assert page == rows[:2]
+    assert decode_cursor(cursor) == ("2024-01-02 00:00:00", 2)
+
+    page, cursor = split_page(rows, 3)
+    assert page == rows
+    assert cursor is None
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from social_insecurity.config import Config
+from social_insecurity.password import Hasher, HasherBusyError
+
+
+def make_hasher(**config) -> Hasher:
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update({"ARGON2_TIME_COST": 1, "ARGON2_MEMORY_COST": 1024, "ARGON2_PARALLELISM": 1, **config})
+    hasher = Hasher()
+    hasher.init_app(app)
+    return hasher
+
+
+def test_hash_and_verify():
+    hasher = make_hasher()
+    password_hash = hasher.hash("password")
+
+    assert hasher.verify("password", password_hash)
+    assert not hasher.verify("wrong", password_hash)
+    assert not hasher.verify("password", "not a hash")
+
+
+def test_needs_rehash_after_parameter_change():
+    password_hash = make_hasher().hash("password")
+
+    assert not make_hasher().needs_rehash(password_hash)
+    assert make_hasher(ARGON2_TIME_COST=2).needs_rehash(password_hash)
+
+
+def test_saturated_pool_fails_fast():
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE_DEPTH=0)
+    started, release = threading.Event(), threading.Event()
+
+    def block(password: str) -> str:
+        started.set()
+        release.wait()
+        return password
+
+    hasher.ph = SimpleNamespace(hash=block)
+    worker = threading.Thread(target=hasher.hash, args=("password",))
+    worker.start()
+    started.wait()
+    try:
+        with pytest.raises(HasherBusyError):
+            hasher.hash("password")
+    finally:
+        release.set()
+        worker.join()
@@ -0,0 +1,71 @@
+"""Checks that every SQL statement used by the application is served by an index and names its columns.
+
+The statements are collected from the string literals in the listed modules,
+and planned against an empty database created from schema.sql.
+"""
+
+from __future__ import annotations
+
+import ast
+import re
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+PACKAGE_PATH = Path(__file__).parent.parent / "social_insecurity"
+MODULES = ["routes.py", "models.py", "timeline.py", "uploads.py", "search.py", "graph.py", "api.py"]
+STATEMENT = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+# An FTS5 table "scanned" with a MATCH constraint is a lookup in its full-text index
+FULL_TEXT_MATCH = re.compile(r"^SCAN \w+ VIRTUAL TABLE INDEX \d+:M")
+# Lists of ids are bound as a JSON array, "scanning" it reads the parameter, not a table
+JSON_PARAMETER = re.compile(r"^SCAN json_each VIRTUAL TABLE")
+# SELECT * and t.* in a result column list, COUNT(*) is fine
+SELECT_STAR = re.compile(r"(?:\bSELECT(?:\s+DISTINCT)?|,)\s*(?:\w+\.)?\*", re.IGNORECASE)
+
+
+def collect_statements() -> Iterator[tuple[str, str]]:
+    for module in MODULES:
+        tree = ast.parse((PACKAGE_PATH / module).read_text())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str) and STATEMENT.match(node.value):
+                yield f"{module}:{node.lineno}", node.value
+
+
+@pytest.fixture(scope="module")
+def connection() -> Iterator[sqlite3.Connection]:
+    conn = sqlite3.connect(":memory:")
+    conn.executescript((PACKAGE_PATH / "schema.sql").read_text())
+    yield conn
+    conn.close()
+
+
+def test_statements_are_collected():
+    assert len(list(collect_statements())) > 0
+
+
+@pytest.mark.parametrize(
+    ("location", "statement"), [pytest.param(*item, id=item[0]) for item in collect_statements()]
+)
+def test_statement_does_not_scan(connection: sqlite3.Connection, location: str, statement: str):
+    plan = connection.execute(f"EXPLAIN QUERY PLAN {statement}", [None] * statement.count("?")).fetchall()
+    # Scanning the rows a subquery produced is not a table scan, the subquery's own plan is checked
+    subqueries = {detail.split()[-1] for *_, detail in plan if detail.startswith(("CO-ROUTINE", "MATERIALIZE"))}
+    scans = [
+        detail
+        for *_, detail in plan
+        if detail.startswith("SCAN")
+        and detail.split()[1] not in subqueries
+        and detail != "SCAN CONSTANT ROW"
+        and not FULL_TEXT_MATCH.match(detail)
+        and not JSON_PARAMETER.match(detail)
+    ]
+    assert not scans, f"{location} scans instead of using an index: {scans}"
+
+
+@pytest.mark.parametrize(
+    ("location", "statement"), [pytest.param(*item, id=item[0]) for item in collect_statements()]
+)
+def test_statement_names_its_columns(location: str, statement: str):
+    assert not SELECT_STAR.search(statement), f"{location} selects every column instead of naming them"
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from pathlib import Path
+from unittest.mock import patch
+
+from limits.storage import storage_from_string
+
+from social_insecurity.ratelimit import SQLiteStorage
+
+
+def make_storage(tmp_path: Path) -> SQLiteStorage:
+    return storage_from_string(f"sqlite:///{tmp_path / 'ratelimit.db'}")
+
+
+def test_scheme_is_registered(tmp_path: Path):
+    storage = make_storage(tmp_path)
+    assert isinstance(storage, SQLiteStorage)
+    assert storage.check()
+
+
+def test_counters_are_shared_between_storages(tmp_path: Path):
+    first, second = make_storage(tmp_path), make_storage(tmp_path)
+
+    assert first.incr("key", 60) == 1
+    assert second.incr("key", 60) == 2
+    assert first.incr("key", 60, amount=3) == 5
+    assert second.get("key") == 5
+
+
+def test_expired_window_starts_over(tmp_path: Path):
+    storage = make_storage(tmp_path)
+    with patch("social_insecurity.ratelimit.time.time", return_value=1000.0):
+        storage.incr("key", 60)
+        storage.incr("key", 60)
+        assert storage.get_expiry("key") == 1060.0
+    with patch("social_insecurity.ratelimit.time.time", return_value=1061.0):
+        assert storage.get("key") == 0
+        assert storage.incr("key", 60) == 1
+        assert storage.get_expiry("key") == 1121.0
+
+
+def test_compaction_removes_expired_windows(tmp_path: Path):
+    storage = make_storage(tmp_path)
+    with patch("social_insecurity.ratelimit.time.time", return_value=1000.0):
+        storage.incr("old", 10)
+    with patch("social_insecurity.ratelimit.time.time", return_value=2000.0):
+        storage.incr("new", 10)
+
+    assert storage.reset() == 1
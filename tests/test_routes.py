@@ -1,25 +1,51 @@
 from __future__ import annotations
 
+import gzip
+import json
 from collections.abc import Iterator
+from itertools import count
+from io import BytesIO
 from typing import TYPE_CHECKING
+from uuid import uuid4
 
 import pytest
+from flask.testing import FlaskClient
+from werkzeug.datastructures import FileStorage
 
-from social_insecurity import create_app
+from social_insecurity import create_app, events
+from social_insecurity.graph import Adjacency
+from social_insecurity.uploads import save_upload
 
 if TYPE_CHECKING:
     from flask import Flask
-    from flask.testing import FlaskClient
+
+_addresses = count(1)
+
+
+class VisitorClient(FlaskClient):
+    """A test client with its own remote address, so each one gets its own rate limits."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        number = next(_addresses)
+        self.environ_base["REMOTE_ADDR"] = f"10.0.{number // 256}.{number % 256}"
 
 
 @pytest.fixture(scope="session")
-def app() -> Iterator[Flask]:
-    test_config = {
-        "SQLITE3_DATABASE_PATH": "file::memory:?cache=shared",
-        "TESTING": True,
-        "WTF_CSRF_ENABLED": False,
-    }
-    app = create_app(test_config)
+def app(tmp_path_factory: pytest.TempPathFactory) -> Iterator[Flask]:
+    instance = tmp_path_factory.mktemp("instance")
+
+    class TestConfig:
+        SQLITE3_DATABASE_PATH = "file::memory:?cache=shared"
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        # Absolute paths, so the test session writes nothing to the instance folder
+        UPLOADS_FOLDER_PATH = str(instance / "uploads")
+        JINJA_BYTECODE_CACHE = str(instance / "jinja")
+        RATELIMIT_STORAGE_URI = "memory://"  # Counters do not outlive the test session
+
+    app = create_app(TestConfig)
+    app.test_client_class = VisitorClient
     yield app
 
 
@@ -28,6 +54,371 @@ def client(app: Flask) -> FlaskClient:
     return app.test_client()
 
 
+def register_and_login(client: FlaskClient) -> str:
+    username = f"user-{uuid4().hex[:8]}"
+    client.post(
+        "/",
+        data={
+            "register-username": username,
+            "register-first_name": "Jane",
+            "register-last_name": "Doe",
+            "register-password": "password",
+            "register-confirm_password": "password",
+            "register-submit": "Sign Up",
+        },
+    )
+    client.post("/", data={"login-username": username, "login-password": "password", "login-submit": "Sign In"})
+    client.get(f"/stream/{username}")  # Consume the flashed login message
+    return username
+
+
 def test_request_index(client: FlaskClient):
     response = client.get("/")
     assert response.status_code == 200
+
+
+def test_login_attempts_are_rate_limited(app: Flask, client: FlaskClient):
+    data = {"login-username": "nobody", "login-password": "wrong", "login-submit": "Sign In"}
+    statuses = [client.post("/", data=data).status_code for _ in range(6)]
+    assert statuses == [200] * 5 + [429]
+    assert app.test_client().post("/", data=data).status_code == 200
+
+
+def test_register_duplicate_username(client: FlaskClient):
+    response = client.post(
+        "/",
+        data={
+            "register-username": "test",
+            "register-first_name": "John",
+            "register-last_name": "Doe",
+            "register-password": "password",
+            "register-confirm_password": "password",
+            "register-submit": "Sign Up",
+        },
+    )
+    assert response.status_code == 200
+    assert b"already taken" in response.data
+
+
+def test_uploads_are_cached_and_support_ranges(app: Flask, client: FlaskClient):
+    with app.app_context():
+        name = save_upload(FileStorage(BytesIO(b"0123456789"), filename="digits.txt"))
+
+    response = client.get(f"/uploads/{name}")
+    assert response.status_code == 200
+    assert response.get_etag() == (name.partition(".")[0], False)
+    assert response.cache_control.immutable
+
+    response = client.get(f"/uploads/{name}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+    response = client.get(f"/uploads/{name}", headers={"Range": "bytes=2-4"})
+    assert response.status_code == 206
+    assert response.data == b"234"
+
+
+def test_uploads_not_found(client: FlaskClient):
+    assert client.get("/uploads/missing.png").status_code == 404
+
+
+def test_pages_answer_conditional_requests(client: FlaskClient):
+    username = register_and_login(client)
+
+    response = client.get(f"/stream/{username}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag.startswith("W/")
+
+    response = client.get(f"/stream/{username}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.post(f"/stream/{username}", data={"content": "Hello"})
+    response = client.get(f"/stream/{username}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert b"Hello" in response.data
+
+
+def test_stream_version_changes_with_comments_on_the_page(app: Flask, client: FlaskClient):
+    username = register_and_login(client)
+    friend = app.test_client()
+    friend_name = register_and_login(friend)
+    add_friend(friend, friend_name, username)
+    client.post(f"/stream/{username}", data={"content": "Discuss"})
+    post_id = client.get("/api/stream", query_string={"fields": "id"}).json["items"][0][0]
+    etag = client.get(f"/stream/{username}").headers["ETag"]
+    assert client.get(f"/stream/{username}", headers={"If-None-Match": etag}).status_code == 304
+
+    friend.post(f"/comments/{friend_name}/{post_id}", data={"comment": "Agreed"})
+    response = client.get(f"/stream/{username}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    etag = response.headers["ETag"]
+    app.config["TIMELINE_ENABLED"] = True
+    try:
+        etag = client.get(f"/stream/{username}").headers["ETag"]
+        assert client.get(f"/stream/{username}", headers={"If-None-Match": etag}).status_code == 304
+    finally:
+        app.config["TIMELINE_ENABLED"] = False
+
+
+def test_stream_version_ignores_posts_the_user_cannot_see(app: Flask, client: FlaskClient):
+    username = register_and_login(client)
+    stranger = app.test_client()
+    stranger_name = register_and_login(stranger)
+    etag = client.get(f"/stream/{username}").headers["ETag"]
+
+    stranger.post(f"/stream/{stranger_name}", data={"content": "Not for you"})
+    assert client.get(f"/stream/{username}", headers={"If-None-Match": etag}).status_code == 304
+
+    stranger.post(f"/friends/{stranger_name}", data={"username": username, "submit": "Add Friend"})
+    response = client.get(f"/stream/{username}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert b"Not for you" in response.data
+
+
+def test_search_only_finds_visible_posts(app: Flask):
+    author, stranger = app.test_client(), app.test_client()
+    author_name = register_and_login(author)
+    stranger_name = register_and_login(stranger)
+    author.post(f"/stream/{author_name}", data={"content": "Spotted a quokka today"})
+
+    response = author.get(f"/search/{author_name}", query_string={"q": "quokka"})
+    assert b"Spotted a quokka today" in response.data
+
+    response = stranger.get(f"/search/{stranger_name}", query_string={"q": "quokka"})
+    assert b"Spotted a quokka today" not in response.data
+
+    response = stranger.get(f"/search/{stranger_name}", query_string={"q": author_name[:7]})
+    assert author_name.encode() in response.data
+
+
+def test_adding_a_friend_twice_with_a_stale_graph(app: Flask, client: FlaskClient, monkeypatch):
+    username = register_and_login(client)
+    friend_name = register_and_login(app.test_client())
+    data = {"username": friend_name, "submit": "Add Friend"}
+    statements = []
+    sqlite = app.extensions["sqlite3"]
+    monkeypatch.setattr(sqlite, "observers", [*sqlite.observers, lambda query, *_: statements.append(query)])
+
+    response = client.post(f"/friends/{username}", data=data, follow_redirects=True)
+    assert b"Friend successfully added!" in response.data
+    assert any("INTO Friends" in query for query in statements)  # Seen by the instrumentation
+
+    # Another worker's graph, loaded before the friendship was added
+    with app.app_context():
+        user_id = app.extensions["sqlite3"].select("SELECT id FROM Users WHERE username = ?;", username, one=True)[0]
+    app.extensions["friend_graph"].set(user_id, Adjacency(frozenset(), frozenset()))
+    response = client.post(f"/friends/{username}", data=data, follow_redirects=True)
+    assert response.status_code == 200
+    assert b"You are already friends with this user!" in response.data
+
+
+def test_api_returns_selected_fields_compressed(client: FlaskClient):
+    username = register_and_login(client)
+    for number in range(30):
+        client.post(f"/stream/{username}", data={"content": f"Post number {number} " + "padding " * 10})
+
+    response = client.get("/api/stream", query_string={"fields": "id,content"}, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.content_encoding == "gzip"
+    page = json.loads(gzip.decompress(response.data))
+    assert len(page["items"]) == 20
+    assert page["fields"] == ["id", "content"]
+    assert page["items"][0][1].startswith("Post number 29")
+
+    response = client.get("/api/stream", query_string={"cursor": page["next_cursor"]})
+    assert response.content_encoding is None
+    assert len(response.json["items"]) == 10
+    assert response.json["next_cursor"] is None
+
+
+def test_api_page_keeps_only_the_selected_fields(app: Flask):
+    from social_insecurity.api import dumps, page  # Registers routes, so it is imported once the app exists
+    from social_insecurity.rows import PostRow
+
+    rows = [PostRow(2, 1, "alice", "Alice", "A", "Second", None, "2024-01-02", 3), PostRow(1, 1, *"abcdef", 0)]
+
+    assert json.loads(dumps(page(rows, "next", PostRow._fields, PostRow._fields)))["items"][0] == list(rows[0])
+    selected = page(rows, None, ("content", "id"), PostRow._fields)
+    assert json.loads(dumps(selected)) == {
+        "fields": ["content", "id"],
+        "items": [["Second", 2], ["d", 1]],
+        "next_cursor": None,
+    }
+    assert page(rows, None, ("username",), PostRow._fields)["items"] == [("alice",), ("a",)]
+    assert page([], None, ("id",), PostRow._fields)["items"] == []
+
+
+def test_api_rejects_unknown_fields_and_anonymous_clients(app: Flask, client: FlaskClient):
+    register_and_login(client)
+    response = client.get("/api/stream", query_string={"fields": "id,password"})
+    assert response.status_code == 400
+    assert client.get("/api/comments/999999").status_code == 404
+    assert app.test_client().get("/api/stream").status_code == 401
+
+
+def test_event_stream_replays_missed_posts(app: Flask, client: FlaskClient, monkeypatch):
+    monkeypatch.setitem(app.config, "EVENTS_ENABLED", True)
+    username = register_and_login(client)
+    client.post(f"/stream/{username}", data={"content": "Live"})
+    last_id = events.latest("post") - 1
+
+    response = client.get("/api/events/stream", headers={"Last-Event-ID": str(last_id)}, buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b"retry:")
+    assert next(chunks).startswith(f"id: {last_id + 1}\nevent: post\n".encode())
+    response.close()
+    assert events.stats()["clients"] == 0
+
+
+def test_events_only_workers_serve_nothing_else(app: Flask, client: FlaskClient, monkeypatch):
+    monkeypatch.setitem(app.config, "EVENTS_ENABLED", True)
+    username = register_and_login(client)
+    monkeypatch.setitem(app.config, "EVENTS_ONLY", True)
+
+    assert client.get(f"/stream/{username}").status_code == 404
+    assert client.get("/api/stream").status_code == 404
+    response = client.get("/api/events/stream", buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    response.close()
+
+
+def test_live_updates_are_disabled_by_default(client: FlaskClient):
+    username = register_and_login(client)
+
+    assert b"EventSource" not in client.get(f"/stream/{username}").data
+    assert client.get("/api/events/stream").status_code == 404
+
+
+def test_comments_are_paginated_newest_first(app: Flask, client: FlaskClient, monkeypatch):
+    monkeypatch.setitem(app.config, "COMMENTS_PAGE_SIZE", 10)  # Fewer requests than the default rate limit
+    username = register_and_login(client)
+    client.post(f"/stream/{username}", data={"content": "Popular"})
+    post_id = client.get("/api/stream", query_string={"fields": "id"}).json["items"][0][0]
+    for number in range(15):
+        client.post(f"/comments/{username}/{post_id}", data={"comment": f"Comment {number:02d}"})
+
+    response = client.get(f"/comments/{username}/{post_id}")
+    assert b"Popular" in response.data
+    assert b"Comment 14" in response.data
+    assert b"Comment 04" not in response.data
+    assert b"Older comments" in response.data
+
+    page = client.get(f"/api/comments/{post_id}", query_string={"fields": "comment"}).json
+    page = client.get(f"/api/comments/{post_id}", query_string={"cursor": page["next_cursor"]}).json
+    column = page["fields"].index("comment")
+    assert [item[column] for item in page["items"]] == [f"Comment {number:02d}" for number in range(4, -1, -1)]
+    assert page["next_cursor"] is None
+
+
+def test_comment_counts_follow_inserts_and_deletes(app: Flask, client: FlaskClient):
+    username = register_and_login(client)
+    client.post(f"/stream/{username}", data={"content": "Counted"})
+    sqlite = app.extensions["sqlite3"]
+
+    with app.app_context():
+        post_id = sqlite.select("SELECT MAX(id) AS id FROM Posts;", one=True)["id"]
+        for comment in ("One", "Two"):
+            client.post(f"/comments/{username}/{post_id}", data={"comment": comment})
+        assert sqlite.select("SELECT comment_count FROM Posts WHERE id = ?;", post_id, one=True)[0] == 2
+        with sqlite.transaction():
+            sqlite.query("DELETE FROM Comments WHERE p_id = ? AND comment = 'One';", post_id)
+        assert sqlite.select("SELECT comment_count FROM Posts WHERE id = ?;", post_id, one=True)[0] == 1
+
+
+def test_repair_counters_migrates_and_fixes_counts(app: Flask, client: FlaskClient):
+    username = register_and_login(client)
+    client.post(f"/stream/{username}", data={"content": "Repaired"})
+    sqlite = app.extensions["sqlite3"]
+    with app.app_context():
+        post_id = sqlite.select("SELECT MAX(id) AS id FROM Posts;", one=True)["id"]
+        client.post(f"/comments/{username}/{post_id}", data={"comment": "Counted"})
+        # A database from before the counter existed
+        with sqlite.transaction() as conn:
+            conn.execute("DROP TRIGGER CommentsCountInsert;")
+            conn.execute("DROP TRIGGER CommentsCountDelete;")
+            conn.execute("ALTER TABLE Posts DROP COLUMN comment_count;")
+
+    result = app.test_cli_runner().invoke(args=["repair-counters"])
+    assert result.exit_code == 0, result.output
+    result = app.test_cli_runner().invoke(args=["repair-counters"])
+    assert "Repaired 0 comment counters." in result.output
+
+    with app.app_context():
+        assert sqlite.select("SELECT comment_count FROM Posts WHERE id = ?;", post_id, one=True)[0] == 1
+        with sqlite.transaction():
+            sqlite.query("UPDATE Posts SET comment_count = 7 WHERE id = ?;", post_id)
+    assert "Repaired 1 comment counters." in app.test_cli_runner().invoke(args=["repair-counters"]).output
+
+    client.post(f"/comments/{username}/{post_id}", data={"comment": "Counted by the trigger again"})
+    with app.app_context():
+        assert sqlite.select("SELECT comment_count FROM Posts WHERE id = ?;", post_id, one=True)[0] == 2
+
+
+def user_id(app: Flask, username: str) -> int:
+    with app.app_context():
+        return app.extensions["sqlite3"].select("SELECT id FROM Users WHERE username = ?;", username, one=True)[0]
+
+
+def add_friend(client: FlaskClient, username: str, friend_name: str) -> None:
+    client.post(f"/friends/{username}", data={"username": friend_name, "submit": "Add Friend"})
+
+
+def test_timeline_fans_out_posts_to_friends(app: Flask, monkeypatch):
+    monkeypatch.setitem(app.config, "TIMELINE_ENABLED", True)
+    author, friend, stranger = app.test_client(), app.test_client(), app.test_client()
+    author_name, friend_name, stranger_name = (register_and_login(client) for client in (author, friend, stranger))
+    add_friend(friend, friend_name, author_name)
+
+    author.post(f"/stream/{author_name}", data={"content": "Fanned out to friends"})
+    friend.post(f"/stream/{friend_name}", data={"content": "Fanned out the other way"})
+
+    assert b"Fanned out to friends" in friend.get(f"/stream/{friend_name}").data
+    assert b"Fanned out the other way" in author.get(f"/stream/{author_name}").data
+    assert b"Fanned out" not in stranger.get(f"/stream/{stranger_name}").data
+
+
+def test_new_friendship_backfills_both_timelines(app: Flask, monkeypatch):
+    monkeypatch.setitem(app.config, "TIMELINE_ENABLED", True)
+    monkeypatch.setitem(app.config, "TIMELINE_BACKFILL_SIZE", 2)
+    user, friend = app.test_client(), app.test_client()
+    username, friend_name = register_and_login(user), register_and_login(friend)
+    user.post(f"/stream/{username}", data={"content": "Before we met"})
+    for number in range(3):
+        friend.post(f"/stream/{friend_name}", data={"content": f"Friend post {number}"})
+
+    add_friend(user, username, friend_name)
+
+    get_timeline = """
+        SELECT p.content
+        FROM Timeline AS t JOIN Posts AS p ON p.id = t.post_id
+        WHERE t.owner_id = ? AND p.u_id != t.owner_id
+        ORDER BY t.post_id;
+        """
+    with app.app_context():
+        sqlite = app.extensions["sqlite3"]
+        backfilled = [row["content"] for row in sqlite.select(get_timeline, user_id(app, username))]
+        assert backfilled == ["Friend post 1", "Friend post 2"]
+        backfilled = [row["content"] for row in sqlite.select(get_timeline, user_id(app, friend_name))]
+        assert backfilled == ["Before we met"]
+
+
+def test_rebuilt_timeline_matches_the_queried_stream(app: Flask, monkeypatch):
+    from social_insecurity.routes import get_stream_page  # Registers routes, so it is imported once the app exists
+
+    clients = [app.test_client() for _ in range(3)]
+    names = [register_and_login(client) for client in clients]
+    add_friend(clients[0], names[0], names[1])
+    add_friend(clients[2], names[2], names[0])
+    for client, name in zip(clients, names):
+        for number in range(3):
+            client.post(f"/stream/{name}", data={"content": f"{name} post {number}"})
+
+    with app.app_context():
+        queried = [get_stream_page(user_id(app, name), None) for name in names]
+    assert app.test_cli_runner().invoke(args=["rebuild-timeline"]).exit_code == 0
+    monkeypatch.setitem(app.config, "TIMELINE_ENABLED", True)
+    with app.app_context():
+        assert [get_stream_page(user_id(app, name), None) for name in names] == queried
+    assert len(queried[0][0]) == 9
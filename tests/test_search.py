@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from social_insecurity.search import match_query
+
+SCHEMA_PATH = Path(__file__).parent.parent / "social_insecurity" / "schema.sql"
+
+
+@pytest.mark.parametrize(
+    ("text", "prefix", "expected"),
+    [
+        ("", False, ""),
+        ("holiday  pictures", False, '"holiday" "pictures"'),
+        ('say "hi" OR NOT', False, '"say" """hi""" "OR" "NOT"'),
+        ("jan do", True, '"jan" "do"*'),
+    ],
+)
+def test_match_query(text: str, prefix: bool, expected: str):
+    assert match_query(text, prefix=prefix) == expected
+
+
+def test_search_tables_follow_their_content():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA_PATH.read_text())
+    conn.execute("INSERT INTO Posts (u_id, content, creation_time) VALUES (1, 'Running in the mountains', '2024-01-01');")
+
+    def matches(text: str) -> list[int]:
+        return [rowid for (rowid,) in conn.execute("SELECT rowid FROM PostsSearch WHERE PostsSearch MATCH ?;", (match_query(text),))]
+
+    assert matches("run") == [1]  # Stemmed by the porter tokenizer
+    conn.execute("UPDATE Posts SET content = 'Swimming in the lake' WHERE id = 1;")
+    assert matches("mountains") == []
+    assert matches("swim lake") == [1]
+    conn.execute("DELETE FROM Posts WHERE id = 1;")
+    assert matches("swim") == []
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from flask import Flask, render_template
+
+from social_insecurity.database import SQLite3
+from social_insecurity.startup import init_bytecode_cache, warm_up
+
+
+def make_app(tmp_path: Path, **config) -> Flask:
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    (templates / "base.html.j2").write_text("<title>{% block title %}{% endblock %}</title>")
+    (templates / "page.html.j2").write_text('{% extends "base.html.j2" %}{% block title %}{{ name }}{% endblock %}')
+    app = Flask(__name__, instance_path=str(tmp_path / "instance"), template_folder=str(templates))
+    app.config.update({"SQLITE3_DATABASE_PATH": "sqlite3.db", "JINJA_BYTECODE_CACHE": "jinja", **config})
+    return app
+
+
+def test_compiled_templates_are_shared_between_apps(tmp_path: Path):
+    app = make_app(tmp_path)
+    init_bytecode_cache(app)
+    with app.app_context():
+        assert render_template("page.html.j2", name="Hello") == "<title>Hello</title>"
+    assert len(list((tmp_path / "instance" / "jinja").iterdir())) == 2
+
+    # A new worker loads the compiled code instead of compiling the source
+    second = Flask(__name__, instance_path=app.instance_path, template_folder=app.template_folder)
+    second.config.update(JINJA_BYTECODE_CACHE="jinja")
+    init_bytecode_cache(second)
+    second.jinja_env.compile = None  # Fails if called
+    with second.app_context():
+        assert render_template("page.html.j2", name="Again") == "<title>Again</title>"
+
+
+def test_bytecode_cache_can_be_disabled(tmp_path: Path):
+    app = make_app(tmp_path, JINJA_BYTECODE_CACHE=None)
+    init_bytecode_cache(app)
+    assert app.jinja_env.bytecode_cache is None
+
+
+def test_warm_up_compiles_templates_and_opens_the_database(tmp_path: Path):
+    app = make_app(tmp_path, SQLITE3_POOL_SIZE=1)
+    db = SQLite3(app)
+
+    timings = warm_up(app)
+
+    assert set(timings) == {"templates", "database"}
+    assert len(app.jinja_env.cache) == 2
+    assert db.pool.stats()["open"] == 1
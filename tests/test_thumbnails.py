@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+from social_insecurity.config import Config
+from social_insecurity.thumbnails import Thumbnails, fitted_width
+from social_insecurity.uploads import save_upload
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def make_app(tmp_path: Path) -> Flask:
+    app = Flask(__name__, instance_path=str(tmp_path))
+    app.config.from_object(Config)
+    app.add_url_rule("/uploads/<string:filename>", "uploads")
+    (tmp_path / "uploads").mkdir()
+    return app
+
+
+def make_image(width: int, height: int) -> FileStorage:
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+    buffer.seek(0)
+    return FileStorage(buffer, filename="image.png")
+
+
+def test_generates_bounded_variants(tmp_path: Path):
+    app = make_app(tmp_path)
+    thumbnails = Thumbnails()
+    thumbnails.init_app(app)
+
+    with app.test_request_context():
+        name = save_upload(make_image(2000, 1000))
+        assert thumbnails.srcset(name) == ""
+
+        thumbnails.submit(name).result()
+        srcset = thumbnails.srcset(name)
+
+    stem = name.partition(".")[0]
+    assert srcset == f"/uploads/{stem}.320w.webp 320w, /uploads/{stem}.960w.webp 960w"
+    with Image.open(tmp_path / "uploads" / stem[:2] / stem[2:4] / f"{stem}.960w.webp") as variant:
+        assert variant.size == (960, 480)
+
+
+def test_small_images_are_not_upscaled(tmp_path: Path):
+    app = make_app(tmp_path)
+    thumbnails = Thumbnails()
+    thumbnails.init_app(app)
+
+    with app.app_context():
+        name = save_upload(make_image(100, 50))
+        variants = thumbnails.generate(name)
+
+    assert [path.name.split(".")[1] for path in variants] == ["100w"]
+
+
+def test_only_missing_widths_are_generated(tmp_path: Path, monkeypatch):
+    app = make_app(tmp_path)
+    app.config["IMAGE_VARIANT_WIDTHS"] = [320]
+    thumbnails = Thumbnails()
+    thumbnails.init_app(app)
+    with app.app_context():
+        name = save_upload(make_image(1000, 2000))
+        (first,) = thumbnails.generate(name)
+        generated_at = first.stat().st_mtime_ns
+
+        app.config["IMAGE_VARIANT_WIDTHS"] = [320, 640]
+        thumbnails.init_app(app)
+        variants = thumbnails.generate(name)
+        assert [path.name.split(".")[1] for path in variants] == ["160w", "320w"]
+        assert first.stat().st_mtime_ns == generated_at
+
+        # Nothing is missing, so the image is not decoded again
+        monkeypatch.setattr(Image.Image, "copy", None)
+        assert thumbnails.generate(name) == variants
+
+
+def test_failed_generation_leaves_no_temporary_files(tmp_path: Path, monkeypatch):
+    app = make_app(tmp_path)
+    thumbnails = Thumbnails()
+    thumbnails.init_app(app)
+    with app.app_context():
+        name = save_upload(make_image(2000, 1000))
+        save = Image.Image.save
+
+        def fail_second_save(image, *args, **kwargs):
+            if image.width > 320:
+                raise OSError("No space left on device")
+            save(image, *args, **kwargs)
+
+        monkeypatch.setattr(Image.Image, "save", fail_second_save)
+        with pytest.raises(OSError):
+            thumbnails.generate(name)
+
+    assert not list((tmp_path / "uploads").rglob(".variant-*"))
+    assert not list((tmp_path / "uploads").rglob("*w.webp"))  # Nothing is published unless all variants are written
+
+
+def test_fitted_width_matches_pillow():
+    for width, height in ((2000, 1000), (1000, 2000), (999, 1333), (1, 500), (100, 50)):
+        for box in (160, 320, 960):
+            image = Image.new("1", (width, height))
+            image.thumbnail((box, box))
+            assert fitted_width(width, height, box) == image.width, (width, height, box)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from io import BytesIO
+from pathlib import Path
+
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+from social_insecurity.database import SQLite3
+from social_insecurity.uploads import collect_garbage, register_upload, save_upload, upload_folder, upload_path
+
+SCHEMA_PATH = Path(__file__).parent.parent / "social_insecurity" / "schema.sql"
+
+
+def make_app(tmp_path: Path) -> Flask:
+    app = Flask(__name__, instance_path=str(tmp_path))
+    app.config["UPLOADS_FOLDER_PATH"] = "uploads"
+    (tmp_path / "uploads").mkdir()
+    return app
+
+
+def test_save_stores_content_addressed_copy(tmp_path: Path):
+    app = make_app(tmp_path)
+    content = b"image data" * 10000
+
+    with app.app_context():
+        name = save_upload(FileStorage(BytesIO(content), filename="My Photo.PNG"))
+
+    digest = hashlib.sha256(content).hexdigest()
+    assert name == f"{digest}.png"
+    assert (tmp_path / "uploads" / digest[:2] / digest[2:4] / name).read_bytes() == content
+
+
+def test_duplicate_uploads_share_one_copy(tmp_path: Path):
+    app = make_app(tmp_path)
+
+    with app.app_context():
+        first = save_upload(FileStorage(BytesIO(b"same"), filename="a.jpg"))
+        second = save_upload(FileStorage(BytesIO(b"same"), filename="b.jpg"))
+
+    assert first == second
+    assert len([path for path in (tmp_path / "uploads").rglob("*") if path.is_file()]) == 1
+
+
+def test_relative_path_of_legacy_name():
+    assert upload_path("photo.png") == "photo.png"
+
+
+def make_database(app: Flask) -> SQLite3:
+    app.config["SQLITE3_DATABASE_PATH"] = "sqlite3.db"
+    db = SQLite3(app)
+    with app.app_context():
+        db.connection.executescript(SCHEMA_PATH.read_text())
+        db.connection.execute("INSERT INTO Users (username, password) VALUES ('alice', 'x');")
+        db.connection.commit()
+    return db
+
+
+def store(content: bytes, age: float = 0) -> Path:
+    path = upload_folder() / upload_path(save_upload(FileStorage(BytesIO(content), filename="a.png")))
+    os.utime(path, (path.stat().st_atime - age, path.stat().st_mtime - age))
+    return path
+
+
+def test_gc_deletes_unreferenced_and_orphaned_uploads(tmp_path: Path):
+    app = make_app(tmp_path)
+    db = make_database(app)
+
+    with app.app_context():
+        with db.transaction():
+            referenced = store(b"referenced", age=7200)
+            register_upload(referenced.name)
+            db.insert("INSERT INTO Posts (u_id, image) VALUES (1, ?);", referenced.name)
+            unreferenced = store(b"unreferenced", age=7200)
+            register_upload(unreferenced.name)
+        variant = unreferenced.with_name(unreferenced.name.replace(".png", ".320w.png"))
+        variant.write_bytes(b"small")
+        orphan = store(b"post was never written", age=7200)
+        pending = store(b"post is being written")
+
+        assert collect_garbage(grace=3600) == 2
+        assert [row["name"] for row in db.select("SELECT name FROM Uploads;")] == [referenced.name]
+
+    assert referenced.exists() and pending.exists()
+    assert not unreferenced.exists() and not variant.exists() and not orphan.exists()
+
+
+def test_gc_keeps_uploads_uploaded_again(tmp_path: Path):
+    app = make_app(tmp_path)
+    db = make_database(app)
+
+    with app.app_context():
+        with db.transaction():
+            path = store(b"popular", age=7200)
+            register_upload(path.name)
+        store(b"popular")  # A new post with the same file is being written
+
+        assert collect_garbage(grace=3600) == 0
+    assert path.exists()
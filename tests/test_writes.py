@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import threading
+from concurrent import futures
+from pathlib import Path
+
+import pytest
+from flask import Flask
+
+from social_insecurity.database import SQLite3
+from social_insecurity.writes import WriteBehind
+
+SCHEMA_PATH = Path(__file__).parent.parent / "social_insecurity" / "schema.sql"
+
+
+def make_app(tmp_path: Path, **config) -> tuple[Flask, SQLite3, WriteBehind]:
+    app = Flask(__name__, instance_path=str(tmp_path / "instance"))
+    app.config.update(SQLITE3_DATABASE_PATH="sqlite3.db", **config)
+    db = SQLite3(app)
+    with app.app_context():
+        db.connection.executescript(SCHEMA_PATH.read_text())
+        db.connection.execute("INSERT INTO Users (username, password) VALUES ('alice', 'x');")
+        db.connection.commit()
+    return app, db, WriteBehind(app)
+
+
+def make_post(db: SQLite3):
+    def write(content: str) -> int:
+        if content == "fail":
+            db.insert("INSERT INTO Posts (u_id, content) VALUES (1, ?);", content)
+            raise ValueError("Rejected")
+        with db.transaction():
+            return db.insert("INSERT INTO Posts (u_id, content) VALUES (1, ?);", content)
+
+    return write
+
+
+def test_writes_run_inline_when_disabled(tmp_path: Path):
+    app, db, writes = make_app(tmp_path)
+    write = make_post(db)
+
+    with app.app_context():
+        assert not writes.enabled
+        assert writes.submit(write, "Hello") == 1
+        assert db.query("SELECT content FROM Posts;", one=True)["content"] == "Hello"
+
+
+def test_concurrent_writes_are_committed_together(tmp_path: Path):
+    app, db, writes = make_app(tmp_path, SQLITE3_WRITE_BEHIND=True, SQLITE3_WRITE_BATCH_LATENCY=0.2)
+    write = make_post(db)
+    barrier = threading.Barrier(8)
+    ids: list[int] = []
+
+    def request(number: int) -> None:
+        with app.app_context():
+            barrier.wait()
+            ids.append(writes.submit(write, f"Post {number}"))
+
+    threads = [threading.Thread(target=request, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(ids) == list(range(1, 9))
+    stats = writes.stats()
+    assert stats["writes"] == 8
+    assert stats["batches"] < 8
+    with app.app_context():
+        assert db.query("SELECT COUNT(*) AS count FROM Posts;", one=True)["count"] == 8
+
+
+def test_failing_write_does_not_affect_its_batch(tmp_path: Path):
+    app, db, writes = make_app(tmp_path, SQLITE3_WRITE_BEHIND=True, SQLITE3_WRITE_BATCH_LATENCY=0.2)
+    write = make_post(db)
+    results: dict[str, object] = {}
+
+    def request(content: str) -> None:
+        with app.app_context():
+            try:
+                results[content] = writes.submit(write, content)
+            except ValueError as e:
+                results[content] = e
+
+    threads = [threading.Thread(target=request, args=(content,)) for content in ("first", "fail", "last")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert isinstance(results["fail"], ValueError)
+    with app.app_context():
+        contents = {row["content"] for row in db.query("SELECT content FROM Posts;")}
+    assert contents == {"first", "last"}
+
+
+def test_samples_are_prometheus_histograms(tmp_path: Path):
+    app, db, writes = make_app(tmp_path, SQLITE3_WRITE_BEHIND=True)
+
+    with app.app_context():
+        writes.submit(make_post(db), "Hello")
+
+    samples = writes.samples()
+    assert "sqlite_write_queue_depth 0" in samples
+    assert 'sqlite_write_batch_size_count{writer="main"} 1' in samples
+
+
+def test_timed_out_write_is_cancelled(tmp_path: Path):
+    app, db, writes = make_app(tmp_path, SQLITE3_WRITE_BEHIND=True, SQLITE3_WRITE_TIMEOUT=0.05)
+    release, started = threading.Event(), threading.Event()
+
+    def block() -> str:
+        started.set()
+        release.wait()
+        return "done"
+
+    def request() -> None:
+        with app.app_context():
+            results.append(writes.submit(block))
+
+    # The writer is busy with a write that already started, it is waited for past the timeout
+    results: list[str] = []
+    thread = threading.Thread(target=request)
+    thread.start()
+    started.wait()
+    with app.app_context():
+        with pytest.raises(futures.TimeoutError):
+            writes.submit(make_post(db), "Retried")
+    release.set()
+    thread.join()
+
+    assert results == ["done"]
+    with app.app_context():
+        writes.submit(make_post(db), "Hello")
+        assert [row["content"] for row in db.query("SELECT content FROM Posts;")] == ["Hello"]
+
+
+def test_writer_survives_base_exceptions(tmp_path: Path):
+    app, db, writes = make_app(tmp_path, SQLITE3_WRITE_BEHIND=True)
+
+    def interrupt() -> None:
+        raise KeyboardInterrupt
+
+    with app.app_context():
+        with pytest.raises(KeyboardInterrupt):
+            writes.submit(interrupt)
+        assert writes.submit(make_post(db), "Hello") == 1